@@ -0,0 +1,30 @@
+"""add output encoding options and encode results for upscale jobs
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "008"
+down_revision: Union[str, None] = "007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("jobs", sa.Column("compression_level", sa.Integer(), nullable=True))
+    op.add_column("jobs", sa.Column("result_format", sa.String(16), nullable=True))
+    op.add_column("jobs", sa.Column("result_bytes", sa.BigInteger(), nullable=True))
+    op.add_column("jobs", sa.Column("encode_seconds", sa.Float(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("jobs", "encode_seconds")
+    op.drop_column("jobs", "result_bytes")
+    op.drop_column("jobs", "result_format")
+    op.drop_column("jobs", "compression_level")
@@ -0,0 +1,31 @@
+"""add content hash and result cache key to jobs
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision: str = "009"
+down_revision: Union[str, None] = "008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("jobs", sa.Column("content_hash", sa.String(64), nullable=True))
+    op.add_column("jobs", sa.Column("cache_key", sa.String(64), nullable=True))
+    op.add_column("jobs", sa.Column("cached_from", postgresql.UUID(as_uuid=True), nullable=True))
+    op.create_index("ix_jobs_cache_key", "jobs", ["cache_key"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_jobs_cache_key", table_name="jobs")
+    op.drop_column("jobs", "cached_from")
+    op.drop_column("jobs", "cache_key")
+    op.drop_column("jobs", "content_hash")
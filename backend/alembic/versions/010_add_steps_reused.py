@@ -0,0 +1,24 @@
+"""add steps_reused to jobs (pipeline steps taken from stored intermediates)
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-18
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "010"
+down_revision: Union[str, None] = "009"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("jobs", sa.Column("steps_reused", sa.String(64), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("jobs", "steps_reused")
@@ -26,5 +26,8 @@ def admin_stats(
     _: None = Depends(require_admin_key),
     db: Session = Depends(get_db),
 ):
-    """Return aggregate job counts by status. Requires X-Admin-Key header or ?key=."""
-    return job_service.get_admin_stats(db)
+    """
+    Return aggregate job counts by status and result cache hits (over jobs not yet cleaned up).
+    Requires X-Admin-Key header or ?key=.
+    """
+    return {**job_service.get_admin_stats(db), "result_cache": job_service.get_result_cache_stats(db)}
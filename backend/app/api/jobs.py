@@ -1,3 +1,4 @@
+import hashlib
 import logging
 import tempfile
 from datetime import datetime, timezone
@@ -16,8 +17,8 @@ from app.core.database import get_db
 from app.core.rate_limit import check_upload_rate_limit, check_download_rate_limit
 from app.core.storage import get_storage
 from app.models.job import JOB_STATUS_COMPLETED
-from app.core.celery_client import celery_app, enqueue_upscale
-from app.schemas.job import JobResponse, UploadResponse
+from app.core.celery_client import enqueue_upscale, request_cancel
+from app.schemas.job import JobResponse, JobVariant, UploadResponse
 from app.services import job_service
 
 router = APIRouter(prefix="/api/jobs", tags=["jobs"])
@@ -32,6 +33,24 @@ def _job_to_response(request: Request, job) -> JobResponse:
     if job.original_key:
         original_url = f"{base}/api/jobs/{job.id}/original"
     thumbnail_url = f"{base}/api/jobs/{job.id}/thumbnail" if job.original_key else None
+    variants = None
+    if getattr(job, "variants", None):
+        variants = []
+        for v in job.variants:
+            name = job_service.variant_name(v)
+            url = None
+            if job.status == JOB_STATUS_COMPLETED and v.get("result_key"):
+                url = f"{base}/api/jobs/{job.id}/variants/{name}"
+            variants.append(
+                JobVariant(
+                    name=name,
+                    scale=v["scale"],
+                    format=v["format"],
+                    result_format=v.get("result_format"),
+                    result_bytes=v.get("result_bytes"),
+                    result_url=url,
+                )
+            )
     return JobResponse(
         id=job.id,
         status=job.status,
@@ -54,6 +73,12 @@ def _job_to_response(request: Request, job) -> JobResponse:
         progress=getattr(job, "progress", None),
         target_format=getattr(job, "target_format", None),
         quality=getattr(job, "quality", None),
+        compression_level=getattr(job, "compression_level", None),
+        result_format=getattr(job, "result_format", None),
+        result_bytes=getattr(job, "result_bytes", None),
+        encode_seconds=getattr(job, "encode_seconds", None),
+        steps_reused=getattr(job, "steps_reused", None),
+        variants=variants,
     )
 
 
@@ -62,11 +87,15 @@ ALLOWED_METHODS = (
     "swinir",
     "esrgan",
     "real_esrgan_anime",
+    "real_esrgan_fast",
     "background_remove",
     "convert",
 )
 
 CONVERT_TARGET_FORMATS = ("webp", "png", "jpeg")
+# Result formats of upscale jobs (worker app.encode): png with compression_level 0-9, webp lossless
+# without quality or lossy with it, jpeg with quality
+OUTPUT_FORMATS = ("png", "webp", "jpeg")
 
 # Media types and filename suffix for download
 DOWNLOAD_MEDIA_TYPES = {"webp": "image/webp", "png": "image/png", "jpeg": "image/jpeg"}
@@ -82,7 +111,86 @@ def _result_download_name_and_media_type(job) -> tuple[str, str]:
     if job.method == "convert" and getattr(job, "target_format", None):
         ext = job.target_format
         return f"{base}_converted.{ext}", DOWNLOAD_MEDIA_TYPES.get(ext, "application/octet-stream")
-    return f"{base}_upscaled.png", "image/png"
+    # What the worker wrote (it falls back to png when webp cannot hold the size), else what was asked
+    ext = getattr(job, "result_format", None) or getattr(job, "target_format", None) or "png"
+    return f"{base}_upscaled.{ext}", DOWNLOAD_MEDIA_TYPES.get(ext, "application/octet-stream")
+
+
+def _variant_download_name_and_media_type(job, variant: dict) -> tuple[str, str]:
+    """Return (download_filename, media_type) of one of a completed job's variants."""
+    base = job.original_filename.rsplit(".", 1)[0] if "." in job.original_filename else job.original_filename
+    ext = variant.get("result_format") or variant["format"]
+    return (
+        f"{base}_upscaled_{variant['scale']}x.{ext}",
+        DOWNLOAD_MEDIA_TYPES.get(ext, "application/octet-stream"),
+    )
+
+
+def _parse_variants(value: str | None, scale: int, target_format: str | None) -> list[dict]:
+    """
+    Extra outputs requested with an upscale job of (scale, target_format): the "scale:format" items
+    of value (e.g. "2:webp,4:jpeg"; format defaults to png), as [{"scale", "format"}]. The model runs
+    once, at the job's own scale, and the variants are derived from its output, so none may exceed
+    that scale; an item equal to the job's own output is dropped.
+    """
+    if value in (None, ""):
+        return []
+    outputs = [(scale, target_format or "png")]
+    for item in value.split(","):
+        item_scale, _, item_format = item.strip().partition(":")
+        item_format = item_format or "png"
+        if item_scale not in ("2", "4") or item_format not in OUTPUT_FORMATS:
+            raise HTTPException(
+                400,
+                detail=f"variants must be scale:format items, scale 2 or 4, format one of: {', '.join(OUTPUT_FORMATS)}",
+            )
+        if int(item_scale) > scale:
+            raise HTTPException(400, detail=f"variants cannot exceed the job's scale ({scale}x)")
+        if (int(item_scale), item_format) not in outputs:
+            outputs.append((int(item_scale), item_format))
+    return [{"scale": s, "format": f} for s, f in outputs[1:]]
+
+
+def _form_int(value: str | None, name: str, low: int, high: int) -> int | None:
+    """Optional integer form field in [low, high]; 400 otherwise."""
+    if value in (None, ""):
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise HTTPException(400, detail=f"{name} must be a number between {low} and {high}")
+    if number < low or number > high:
+        raise HTTPException(400, detail=f"{name} must be between {low} and {high}")
+    return number
+
+
+def _complete_from_cache(db: Session, job, storage) -> bool:
+    """
+    Complete job with a copy of the result of an earlier job with its cache key, if one is still
+    available; False sends it to the worker. The copy expires and is cleaned up with the new job.
+    """
+    if not settings.result_cache or not getattr(job, "cache_key", None):
+        return False
+    source = job_service.find_cached_result(db, job.cache_key)
+    if source is None:
+        return False
+    result_key = f"results/{job.id}"
+    variants = None
+    try:
+        storage.copy(source.result_key, result_key)
+        if getattr(source, "variants", None):
+            variants = []
+            for v in source.variants:
+                key = job_service.variant_result_key(job.id, v)
+                storage.copy(v["result_key"], key)
+                variants.append({**v, "result_key": key})
+    except Exception as e:
+        # Source cleaned up meanwhile: process as usual
+        logger.warning("Result cache copy from %s failed: %s", source.id, e, extra={"job_id": str(job.id)})
+        return False
+    job_service.complete_from_cache(db, job, source, result_key, variants)
+    logger.info("Result cache hit from %s", source.id, extra={"job_id": str(job.id)})
+    return True
 
 
 @router.post("/upload", response_model=UploadResponse)
@@ -95,6 +203,8 @@ def upload_jobs(
     face_enhance: str = Form("false"),
     target_format: str | None = Form(None),
     quality: str | None = Form(None),
+    compression_level: str | None = Form(None),
+    variants: str | None = Form(None),
     db: Session = Depends(get_db),
 ) -> UploadResponse:
     check_upload_rate_limit(request)
@@ -106,6 +216,10 @@ def upload_jobs(
     if method not in ALLOWED_METHODS:
         raise HTTPException(400, detail=f"method must be one of: {', '.join(ALLOWED_METHODS)}")
     quality_int: int | None = None
+    compression_int: int | None = None
+    variant_list: list[dict] = []
+    if variants not in (None, "") and method in ("convert", "background_remove"):
+        raise HTTPException(400, detail="variants are only available for upscale methods")
     if method == "convert":
         if not target_format or target_format not in CONVERT_TARGET_FORMATS:
             raise HTTPException(
@@ -113,20 +227,26 @@ def upload_jobs(
                 detail=f"target_format required for convert, one of: {', '.join(CONVERT_TARGET_FORMATS)}",
             )
         scale = 1
-        if quality not in (None, ""):
-            try:
-                quality_int = int(quality)
-                if quality_int < 1 or quality_int > 100:
-                    raise HTTPException(400, detail="quality must be between 1 and 100")
-            except ValueError:
-                raise HTTPException(400, detail="quality must be a number between 1 and 100")
+        quality_int = _form_int(quality, "quality", 1, 100)
     elif method == "background_remove":
         if scale != 1:
             raise HTTPException(400, detail="scale must be 1 for background remove")
-    elif scale not in (2, 4):
-        raise HTTPException(400, detail="scale must be 2 or 4")
-
-    valid: list[tuple[str, UploadFile]] = []
+        target_format = None
+    else:
+        if scale not in (2, 4):
+            raise HTTPException(400, detail="scale must be 2 or 4")
+        target_format = target_format or None
+        if target_format is not None and target_format not in OUTPUT_FORMATS:
+            raise HTTPException(400, detail=f"target_format must be one of: {', '.join(OUTPUT_FORMATS)}")
+        variant_list = _parse_variants(variants, scale, target_format)
+        # quality and compression_level apply to every output of their formats
+        formats = {target_format or "png"} | {v["format"] for v in variant_list}
+        if formats & {"webp", "jpeg"}:
+            quality_int = _form_int(quality, "quality", 1, 100)
+        if "png" in formats:
+            compression_int = _form_int(compression_level, "compression_level", 0, 9)
+
+    valid: list[tuple[str, UploadFile, str]] = []
     max_bytes = settings.max_mb_per_file * 1024 * 1024
     max_pixels = settings.max_megapixels * 1_000_000
     for f in files:
@@ -151,7 +271,7 @@ def upload_jobs(
         except Exception:
             pass
         f.file.seek(0)
-        valid.append((f.filename, f))
+        valid.append((f.filename, f, hashlib.sha256(content).hexdigest()))
 
     if not valid:
         raise HTTPException(400, detail="No valid files")
@@ -164,21 +284,29 @@ def upload_jobs(
         method=method,
         denoise_first=denoise_first.lower() == "true",
         face_enhance=face_enhance.lower() == "true",
-        target_format=target_format if method == "convert" else None,
-        quality=quality_int if method == "convert" else None,
+        target_format=target_format,
+        quality=quality_int,
+        compression_level=compression_int,
+        content_hashes=[v[2] for v in valid],
+        variants=variant_list,
     )
     storage = get_storage()
-    for job, (_, upload_file) in zip(jobs, valid):
+    for job, (_, upload_file, _) in zip(jobs, valid):
         storage.put(job.original_key, upload_file.file)
 
-    for job in jobs:
-        task_id = enqueue_upscale(job.id)
+    # Same bytes and options as a job with a result still stored: done without the worker
+    queued = [job for job in jobs if not _complete_from_cache(db, job, storage)]
+    # Background-remove jobs of one upload can share a batched segmentation on the worker
+    batch = [str(j.id) for j in queued] if method == "background_remove" and len(queued) > 1 else None
+    for job in queued:
+        task_id = enqueue_upscale(job.id, batch=batch)
         if task_id:
             job.celery_task_id = task_id
     db.commit()
     logger.info(
-        "Upload created %s jobs",
+        "Upload created %s jobs (%s from result cache)",
         len(jobs),
+        len(jobs) - len(queued),
         extra={"job_id": str(jobs[0].id) if jobs else ""},
     )
     return UploadResponse(job_ids=[j.id for j in jobs])
@@ -215,6 +343,11 @@ def batch_download(
                     storage.get_to_file(job.result_key, Path(tmp.name))
                     arcname, _ = _result_download_name_and_media_type(job)
                     zf.write(tmp.name, arcname=arcname)
+                    for variant in getattr(job, "variants", None) or []:
+                        if variant.get("result_key"):
+                            storage.get_to_file(variant["result_key"], Path(tmp.name))
+                            arcname, _ = _variant_download_name_and_media_type(job, variant)
+                            zf.write(tmp.name, arcname=arcname)
                 finally:
                     Path(tmp.name).unlink(missing_ok=True)
     buf.seek(0)
@@ -235,22 +368,21 @@ def cancel_job_endpoint(
     job = job_service.get_job_by_id(db, job_id)
     if not job:
         raise HTTPException(404, detail="Job not found")
-    if job.status not in ("queued", "processing"):
+    if job.status not in ("queued", "processing", "interrupted"):
         raise HTTPException(
             400,
             detail="Job cannot be cancelled (not found or already completed/failed/cancelled)",
         )
     task_id = getattr(job, "celery_task_id", None)
-    if task_id:
-        try:
-            celery_app.control.revoke(task_id, terminate=True, signal="SIGTERM")
-        except Exception as e:
-            logger.warning(
-                "revoke task_id=%s failed: %s",
-                task_id,
-                e,
-                extra={"job_id": str(job_id)},
-            )
+    try:
+        request_cancel(str(job_id), task_id)
+    except Exception as e:
+        logger.warning(
+            "cancel request task_id=%s failed: %s",
+            task_id,
+            e,
+            extra={"job_id": str(job_id)},
+        )
     job = job_service.cancel_job(db, job_id)
     logger.info("Job cancelled", extra={"job_id": str(job_id)})
     return _job_to_response(request, job)
@@ -278,6 +410,33 @@ def download_result(
     return FileResponse(url_or_path, filename=download_name, media_type=media_type)
 
 
+@router.get("/{job_id}/variants/{name}")
+def download_variant(
+    request: Request,
+    job_id: UUID,
+    name: str,
+    db: Session = Depends(get_db),
+) -> FileResponse:
+    """Download one variant ("<scale>x.<format>", see JobResponse.variants) of a completed job."""
+    check_download_rate_limit(request)
+    job = job_service.get_job_by_id(db, job_id)
+    if not job:
+        raise HTTPException(404, detail="Job not found")
+    variant = next(
+        (v for v in getattr(job, "variants", None) or [] if job_service.variant_name(v) == name), None
+    )
+    if job.status != JOB_STATUS_COMPLETED or not variant or not variant.get("result_key"):
+        raise HTTPException(404, detail="Variant not available")
+    if job.expires_at < datetime.now(timezone.utc).replace(tzinfo=None):
+        raise HTTPException(410, detail="Result expired")
+    storage = get_storage()
+    url_or_path = storage.get_url(variant["result_key"])
+    download_name, media_type = _variant_download_name_and_media_type(job, variant)
+    if url_or_path.startswith("http://") or url_or_path.startswith("https://"):
+        return RedirectResponse(url=url_or_path, status_code=302)
+    return FileResponse(url_or_path, filename=download_name, media_type=media_type)
+
+
 @router.get("/{job_id}/original")
 def serve_original(
     job_id: UUID,
@@ -341,6 +500,9 @@ def retry_job_endpoint(
         face_enhance=job.face_enhance,
         target_format=getattr(job, "target_format", None),
         quality=getattr(job, "quality", None),
+        compression_level=getattr(job, "compression_level", None),
+        content_hashes=[getattr(job, "content_hash", None)],
+        variants=[{"scale": v["scale"], "format": v["format"]} for v in getattr(job, "variants", None) or []],
     )
     new_job = new_jobs[0]
     storage = get_storage()
@@ -351,7 +513,8 @@ def retry_job_endpoint(
                 storage.put(new_job.original_key, f)
         finally:
             Path(tmp.name).unlink(missing_ok=True)
-    enqueue_upscale(new_job.id)
+    if not _complete_from_cache(db, new_job, storage):
+        enqueue_upscale(new_job.id)
     logger.info(
         "Job retry created",
         extra={"job_id": str(new_job.id)},
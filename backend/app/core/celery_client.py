@@ -1,3 +1,4 @@
+import redis
 from celery import Celery
 
 from app.core.config import settings
@@ -9,9 +10,33 @@ celery_app = Celery(
 )
 
 TASK_UPSCALE = "app.tasks.upscale.upscale_task"
+# Must match worker app.progress.CANCEL_KEY; checked by the worker between tiles.
+CANCEL_KEY = "job:{job_id}:cancel"
+CANCEL_FLAG_TTL_SECONDS = 24 * 3600
+# Must match worker app.progress.SUBTASKS_KEY: region task ids of a job split across workers.
+SUBTASKS_KEY = "job:{job_id}:subtasks"
 
 
-def enqueue_upscale(job_id: str) -> str | None:
-    """Enqueue upscale task; returns Celery task_id for revoke on cancel."""
-    result = celery_app.send_task(TASK_UPSCALE, args=[str(job_id)])
+def enqueue_upscale(job_id: str, batch: list[str] | None = None) -> str | None:
+    """
+    Enqueue upscale task; returns Celery task_id for revoke on cancel. batch: ids of the
+    background-remove jobs of the same upload, which the worker may segment together.
+    """
+    kwargs = {"batch": batch} if batch else None
+    result = celery_app.send_task(TASK_UPSCALE, args=[str(job_id)], kwargs=kwargs)
     return result.id if result else None
+
+
+def request_cancel(job_id: str, task_id: str | None) -> None:
+    """
+    Ask the worker to stop a job: set the cancel flag (a running task stops within one tile)
+    and revoke the task so a queued one never starts. The worker child is not killed.
+    For a split job the whole group of region tasks is revoked as well.
+    """
+    r = redis.from_url(settings.redis_url)
+    r.set(CANCEL_KEY.format(job_id=job_id), 1, ex=CANCEL_FLAG_TTL_SECONDS)
+    if task_id:
+        celery_app.control.revoke(task_id)
+    subtasks = [t.decode() for t in r.lrange(SUBTASKS_KEY.format(job_id=job_id), 0, -1)]
+    if subtasks:
+        celery_app.control.revoke(subtasks)
@@ -20,6 +20,8 @@ class Settings(BaseSettings):
     max_files_per_batch: int = 10
     max_mb_per_file: int = 50
     max_megapixels: int = 16
+    # Complete a job with a copy of an earlier identical job's result (same original bytes and options)
+    result_cache: bool = True
 
     admin_api_key: str | None = None
 
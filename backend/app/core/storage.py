@@ -1,3 +1,4 @@
+import shutil
 from abc import ABC, abstractmethod
 from pathlib import Path
 from typing import BinaryIO
@@ -43,6 +44,11 @@ class StorageBackend(ABC):
         """Download object to local file (for worker)."""
         ...
 
+    @abstractmethod
+    def copy(self, src_key: str, dst_key: str) -> None:
+        """Copy object src_key to dst_key within the store (no download)."""
+        ...
+
 
 class LocalStorageBackend(StorageBackend):
     def __init__(self, base_path: str | None = None) -> None:
@@ -73,9 +79,17 @@ class LocalStorageBackend(StorageBackend):
         path.parent.mkdir(parents=True, exist_ok=True)
         path.write_bytes(src.read_bytes())
 
+    def copy(self, src_key: str, dst_key: str) -> None:
+        src = self._path(src_key)
+        if not src.exists():
+            raise FileNotFoundError(f"Storage key not found: {src_key}")
+        dst = self._path(dst_key)
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(src, dst)
+
 
 class S3StorageBackend(StorageBackend):
-    """S3 (or MinIO) backend: put, get_url (presigned), delete, get_to_file."""
+    """S3 (or MinIO) backend: put, get_url (presigned), delete, get_to_file, copy."""
 
     def __init__(self) -> None:
         self._client = _s3_client()
@@ -99,6 +113,12 @@ class S3StorageBackend(StorageBackend):
         path.parent.mkdir(parents=True, exist_ok=True)
         self._client.download_file(self._bucket, key, str(path))
 
+    def copy(self, src_key: str, dst_key: str) -> None:
+        # Server-side; the content type is copied with the object
+        self._client.copy_object(
+            Bucket=self._bucket, Key=dst_key, CopySource={"Bucket": self._bucket, "Key": src_key}
+        )
+
 
 def get_storage() -> StorageBackend:
     if settings.use_local_storage:
@@ -1,6 +1,6 @@
 import uuid
 from datetime import datetime, timezone
-from sqlalchemy import Boolean, String, Integer, DateTime, Text, Index, Column
+from sqlalchemy import JSON, BigInteger, Boolean, String, Integer, DateTime, Float, Text, Index, Column
 from sqlalchemy.dialects.postgresql import UUID
 
 from app.core.database import Base
@@ -14,11 +14,14 @@ JOB_STATUS_QUEUED = "queued"
 JOB_STATUS_PROCESSING = "processing"
 JOB_STATUS_COMPLETED = "completed"
 JOB_STATUS_FAILED = "failed"
+# Worker child died mid-job (e.g. OOM kill); the redelivered task resumes from its tile checkpoint
+JOB_STATUS_INTERRUPTED = "interrupted"
 
 JOB_METHOD_REAL_ESRGAN = "real_esrgan"
 JOB_METHOD_SWINIR = "swinir"
 JOB_METHOD_ESRGAN = "esrgan"
 JOB_METHOD_REAL_ESRGAN_ANIME = "real_esrgan_anime"
+JOB_METHOD_REAL_ESRGAN_FAST = "real_esrgan_fast"
 JOB_METHOD_BACKGROUND_REMOVE = "background_remove"
 JOB_METHOD_CONVERT = "convert"
 
@@ -28,6 +31,7 @@ class Job(Base):
     __table_args__ = (
         Index("ix_jobs_status", "status"),
         Index("ix_jobs_expires_at", "expires_at"),
+        Index("ix_jobs_cache_key", "cache_key"),
     )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -47,5 +51,16 @@ class Job(Base):
     status_detail = Column(String(256), nullable=True)
     celery_task_id = Column(String(255), nullable=True)
     progress = Column(Integer, nullable=True)  # 0-100 when processing
-    target_format = Column(String(16), nullable=True)  # for convert: webp, png, jpeg
-    quality = Column(Integer, nullable=True)  # for convert: 1-100
+    target_format = Column(String(16), nullable=True)  # convert / upscale output: webp, png, jpeg
+    quality = Column(Integer, nullable=True)  # webp / jpeg: 1-100 (upscale webp without: lossless)
+    compression_level = Column(Integer, nullable=True)  # upscale png: 0-9
+    result_format = Column(String(16), nullable=True)  # format the worker wrote (png if webp could not hold it)
+    result_bytes = Column(BigInteger, nullable=True)
+    encode_seconds = Column(Float, nullable=True)
+    content_hash = Column(String(64), nullable=True)  # sha256 of the uploaded original
+    cache_key = Column(String(64), nullable=True)  # original + result parameters, see job_service.result_cache_key
+    cached_from = Column(UUID(as_uuid=True), nullable=True)  # completed with a copy of this job's result
+    steps_reused = Column(String(64), nullable=True)  # e.g. "denoise,upscale": taken from stored intermediates
+    # Extra outputs of an upscale job: [{"scale", "format"}], plus result_key / result_format /
+    # result_bytes once the worker wrote them
+    variants = Column(JSON, nullable=True)
@@ -9,6 +9,17 @@ class JobCreate(BaseModel):
     method: str
 
 
+class JobVariant(BaseModel):
+    """One extra output of an upscale job (derived from the job's own result)."""
+
+    name: str  # "<scale>x.<format>", as in the download URL
+    scale: int
+    format: str
+    result_format: str | None = None  # what the worker wrote (png if webp could not hold it)
+    result_bytes: int | None = None
+    result_url: str | None = None
+
+
 class JobResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
@@ -33,6 +44,12 @@ class JobResponse(BaseModel):
     progress: int | None = None  # 0-100 when processing
     target_format: str | None = None
     quality: int | None = None
+    compression_level: int | None = None
+    result_format: str | None = None
+    result_bytes: int | None = None
+    encode_seconds: float | None = None
+    steps_reused: str | None = None
+    variants: list[JobVariant] | None = None
 
 
 class UploadResponse(BaseModel):
@@ -1,3 +1,5 @@
+import hashlib
+import json
 from datetime import datetime, timedelta, timezone
 from uuid import UUID
 
@@ -5,7 +7,13 @@ from sqlalchemy import select, func
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
-from app.models.job import Job, JOB_STATUS_QUEUED
+from app.models.job import (
+    Job,
+    JOB_METHOD_BACKGROUND_REMOVE,
+    JOB_METHOD_CONVERT,
+    JOB_STATUS_COMPLETED,
+    JOB_STATUS_QUEUED,
+)
 
 
 def _utcnow_naive() -> datetime:
@@ -14,15 +22,18 @@ def _utcnow_naive() -> datetime:
 
 
 def get_queue_stats(db: Session) -> dict[str, int]:
-    """Return counts of jobs in queued and processing (non-expired)."""
+    """Return counts of jobs in queued (incl. interrupted, waiting to resume) and processing (non-expired)."""
     now = _utcnow_naive()
     result = db.execute(
         select(Job.status, func.count(Job.id))
-        .where(Job.expires_at > now, Job.status.in_(["queued", "processing"]))
+        .where(Job.expires_at > now, Job.status.in_(["queued", "processing", "interrupted"]))
         .group_by(Job.status)
     )
     counts = dict(result.all())
-    return {"queued": counts.get("queued", 0), "processing": counts.get("processing", 0)}
+    return {
+        "queued": counts.get("queued", 0) + counts.get("interrupted", 0),
+        "processing": counts.get("processing", 0),
+    }
 
 
 def get_admin_stats(db: Session) -> dict[str, int]:
@@ -34,12 +45,21 @@ def get_admin_stats(db: Session) -> dict[str, int]:
     return {
         "queued": counts.get("queued", 0),
         "processing": counts.get("processing", 0),
+        "interrupted": counts.get("interrupted", 0),
         "completed": counts.get("completed", 0),
         "failed": counts.get("failed", 0),
         "cancelled": counts.get("cancelled", 0),
     }
 
 
+def get_result_cache_stats(db: Session) -> dict[str, float]:
+    """Result cache lookups (jobs with a cache key) and hits among the jobs not yet cleaned up."""
+    lookups, hits = db.execute(
+        select(func.count(Job.cache_key), func.count(Job.cached_from))
+    ).one()
+    return {"lookups": lookups, "hits": hits, "hit_rate": round(hits / lookups, 3) if lookups else 0.0}
+
+
 def get_recent_jobs(db: Session, limit: int = 50) -> list[Job]:
     """Return recent jobs (not expired), newest first."""
     now = _utcnow_naive()
@@ -52,6 +72,79 @@ def get_recent_jobs(db: Session, limit: int = 50) -> list[Job]:
     return list(result.scalars().all())
 
 
+def result_cache_key(
+    content_hash: str,
+    method: str,
+    scale: int,
+    denoise_first: bool = False,
+    face_enhance: bool = False,
+    target_format: str | None = None,
+    quality: int | None = None,
+    compression_level: int | None = None,
+    variants: list[dict] | None = None,
+) -> str:
+    """
+    Key of the result of these parameters on the original with content_hash. Options the method
+    ignores are dropped so equivalent requests share a key (upscales write png by default).
+    """
+    if method == JOB_METHOD_CONVERT:
+        denoise_first = face_enhance = False
+    elif method == JOB_METHOD_BACKGROUND_REMOVE:
+        face_enhance = False
+    else:
+        target_format = target_format or "png"
+    params = [content_hash, method, scale, denoise_first, face_enhance, target_format, quality, compression_level]
+    if variants:
+        params.append(sorted(variant_name(v) for v in variants))
+    return hashlib.sha256(json.dumps(params).encode()).hexdigest()
+
+
+def variant_name(variant: dict) -> str:
+    """Name of a variant in URLs and its storage key: "<scale>x.<format>"."""
+    return f"{variant['scale']}x.{variant['format']}"
+
+
+def variant_result_key(job_id, variant: dict) -> str:
+    """Storage key of a job's variant (must match worker app.tasks.upscale)."""
+    return f"results/{job_id}-{variant_name(variant)}"
+
+
+def find_cached_result(db: Session, cache_key: str) -> Job | None:
+    """Most recent completed, non-expired job with this cache key and a stored result."""
+    result = db.execute(
+        select(Job)
+        .where(
+            Job.cache_key == cache_key,
+            Job.status == JOB_STATUS_COMPLETED,
+            Job.result_key.is_not(None),
+            Job.expires_at > _utcnow_naive(),
+        )
+        .order_by(Job.finished_at.desc())
+        .limit(1)
+    )
+    return result.scalars().first()
+
+
+def complete_from_cache(
+    db: Session, job: Job, source: Job, result_key: str, variants: list[dict] | None = None
+) -> Job:
+    """Mark job completed with result_key, a copy of source's result (variants: copies of source's)."""
+    now = _utcnow_naive()
+    job.status = JOB_STATUS_COMPLETED
+    job.result_key = result_key
+    if variants is not None:
+        job.variants = variants
+    job.cached_from = source.id
+    job.result_format = source.result_format
+    job.result_bytes = source.result_bytes
+    job.started_at = now
+    job.finished_at = now
+    job.progress = 100
+    db.commit()
+    db.refresh(job)
+    return job
+
+
 def create_jobs(
     db: Session,
     filenames: list[str],
@@ -61,10 +154,30 @@ def create_jobs(
     face_enhance: bool = False,
     target_format: str | None = None,
     quality: int | None = None,
+    compression_level: int | None = None,
+    content_hashes: list[str | None] | None = None,
+    variants: list[dict] | None = None,
 ) -> list[Job]:
+    """
+    Create queued jobs, one per filename. content_hashes (sha256 of each original, in order) set
+    the jobs' result cache keys. variants: extra outputs of each job ([{"scale", "format"}]).
+    """
     expires_at = _utcnow_naive() + timedelta(minutes=settings.job_expiry_minutes)
     jobs = []
-    for filename in filenames:
+    for filename, content_hash in zip(filenames, content_hashes or [None] * len(filenames)):
+        cache_key = None
+        if content_hash is not None:
+            cache_key = result_cache_key(
+                content_hash,
+                method,
+                scale,
+                denoise_first,
+                face_enhance,
+                target_format,
+                quality,
+                compression_level,
+                variants,
+            )
         job = Job(
             status=JOB_STATUS_QUEUED,
             original_filename=filename,
@@ -77,6 +190,10 @@ def create_jobs(
             expires_at=expires_at,
             target_format=target_format,
             quality=quality,
+            compression_level=compression_level,
+            content_hash=content_hash,
+            cache_key=cache_key,
+            variants=[dict(v) for v in variants] if variants else None,
         )
         db.add(job)
         jobs.append(job)
@@ -102,9 +219,9 @@ def get_job_by_id(db: Session, job_id: UUID) -> Job | None:
 
 
 def cancel_job(db: Session, job_id: UUID) -> Job | None:
-    """Set job to cancelled if it is queued or processing. Returns the job or None."""
+    """Set job to cancelled if it is queued, processing or interrupted. Returns the job or None."""
     job = get_job_by_id(db, job_id)
-    if not job or job.status not in ("queued", "processing"):
+    if not job or job.status not in ("queued", "processing", "interrupted"):
         return None
     now = _utcnow_naive()
     job.status = "cancelled"
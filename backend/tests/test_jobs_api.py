@@ -1,3 +1,4 @@
+import hashlib
 import io
 import uuid
 from unittest.mock import MagicMock, patch
@@ -116,6 +117,226 @@ def test_upload_rate_limit_returns_429_after_limit(client):
         rate_limit._upload_times.clear()
 
 
+def _upload_with_mocks(client, method: str, scale: int, count: int):
+    """POST count PNGs with create_jobs / storage / enqueue mocked; returns (jobs, enqueue mock)."""
+    from app.core import rate_limit
+    rate_limit._upload_times.clear()
+
+    jobs = []
+    for _ in range(count):
+        job = MagicMock()
+        job.id = uuid.uuid4()
+        job.celery_task_id = None
+        jobs.append(job)
+    buf = io.BytesIO()
+    Image.new("RGB", (10, 10), color="red").save(buf, format="PNG")
+    files = [("files", (f"img{i}.png", buf.getvalue(), "image/png")) for i in range(count)]
+    payload = {"scale": scale, "method": method, "denoise_first": "false", "face_enhance": "false"}
+    with (
+        patch("app.api.jobs.job_service.create_jobs", return_value=jobs),
+        patch("app.api.jobs.job_service.find_cached_result", return_value=None),
+        patch("app.api.jobs.get_storage", return_value=MagicMock()),
+        patch("app.api.jobs.enqueue_upscale", return_value="task-1") as enqueue,
+    ):
+        r = client.post("/api/jobs/upload", data=payload, files=files)
+    rate_limit._upload_times.clear()
+    assert r.status_code == 200
+    return jobs, enqueue
+
+
+def test_upload_enqueues_background_remove_jobs_as_one_batch(client):
+    """Background-remove jobs of one upload carry the upload's job ids so the worker can batch them."""
+    jobs, enqueue = _upload_with_mocks(client, "background_remove", 1, 3)
+    ids = [str(j.id) for j in jobs]
+    assert [c.args[0] for c in enqueue.call_args_list] == [j.id for j in jobs]
+    assert all(c.kwargs["batch"] == ids for c in enqueue.call_args_list)
+
+
+def test_upload_enqueues_upscale_jobs_without_batch(client):
+    jobs, enqueue = _upload_with_mocks(client, "real_esrgan", 4, 2)
+    assert all(c.kwargs["batch"] is None for c in enqueue.call_args_list)
+
+
+def test_upload_upscale_output_format(client):
+    """Upscale uploads may ask for webp / jpeg with a quality or png with a compression level."""
+    from app.core import rate_limit
+    rate_limit._upload_times.clear()
+
+    buf = io.BytesIO()
+    Image.new("RGB", (10, 10), color="red").save(buf, format="PNG")
+    files = [("files", ("img.png", buf.getvalue(), "image/png"))]
+    base = {"scale": 4, "method": "real_esrgan", "denoise_first": "false", "face_enhance": "false"}
+    job = MagicMock()
+    job.id = uuid.uuid4()
+    with (
+        patch("app.api.jobs.job_service.create_jobs", return_value=[job]) as create,
+        patch("app.api.jobs.job_service.find_cached_result", return_value=None),
+        patch("app.api.jobs.get_storage", return_value=MagicMock()),
+        patch("app.api.jobs.enqueue_upscale", return_value="task-1"),
+    ):
+        r = client.post("/api/jobs/upload", data={**base, "target_format": "webp", "quality": "80"}, files=files)
+        assert r.status_code == 200
+        assert create.call_args.kwargs["target_format"] == "webp"
+        assert create.call_args.kwargs["quality"] == 80
+        assert create.call_args.kwargs["compression_level"] is None
+
+        r = client.post("/api/jobs/upload", data={**base, "compression_level": "3"}, files=files)
+        assert r.status_code == 200
+        assert create.call_args.kwargs["target_format"] is None
+        assert create.call_args.kwargs["compression_level"] == 3
+
+        r = client.post("/api/jobs/upload", data={**base, "compression_level": "12"}, files=files)
+        assert r.status_code == 400
+        r = client.post("/api/jobs/upload", data={**base, "target_format": "gif"}, files=files)
+        assert r.status_code == 400
+    rate_limit._upload_times.clear()
+
+
+def test_upload_completes_from_result_cache(client):
+    """An upload matching a stored result is completed with a copy of it instead of being enqueued."""
+    from app.core import rate_limit
+    rate_limit._upload_times.clear()
+
+    buf = io.BytesIO()
+    Image.new("RGB", (10, 10), color="red").save(buf, format="PNG")
+    job = MagicMock()
+    job.id = uuid.uuid4()
+    job.cache_key = "k"
+    source = _job_row("completed", result_key="results/source")
+    storage = MagicMock()
+    with (
+        patch("app.api.jobs.job_service.create_jobs", return_value=[job]) as create,
+        patch("app.api.jobs.job_service.find_cached_result", return_value=source),
+        patch("app.api.jobs.job_service.complete_from_cache") as complete,
+        patch("app.api.jobs.get_storage", return_value=storage),
+        patch("app.api.jobs.enqueue_upscale", return_value="task-1") as enqueue,
+    ):
+        r = client.post(
+            "/api/jobs/upload",
+            data={"scale": 4, "method": "real_esrgan"},
+            files=[("files", ("img.png", buf.getvalue(), "image/png"))],
+        )
+    rate_limit._upload_times.clear()
+    assert r.status_code == 200
+    assert create.call_args.kwargs["content_hashes"] == [hashlib.sha256(buf.getvalue()).hexdigest()]
+    storage.copy.assert_called_once_with("results/source", f"results/{job.id}")
+    assert complete.call_args.args[1:] == (job, source, f"results/{job.id}", None)
+    enqueue.assert_not_called()
+
+
+def test_upload_variants_derive_from_the_requested_scale(client):
+    """The job keeps its own scale and format; variants up to that scale are derived from its output."""
+    from app.core import rate_limit
+    rate_limit._upload_times.clear()
+
+    buf = io.BytesIO()
+    Image.new("RGB", (10, 10), color="red").save(buf, format="PNG")
+    files = [("files", ("img.png", buf.getvalue(), "image/png"))]
+    base = {"method": "esrgan", "denoise_first": "false", "face_enhance": "false"}
+    job = MagicMock()
+    job.id = uuid.uuid4()
+    with (
+        patch("app.api.jobs.job_service.create_jobs", return_value=[job]) as create,
+        patch("app.api.jobs.job_service.find_cached_result", return_value=None),
+        patch("app.api.jobs.get_storage", return_value=MagicMock()),
+        patch("app.api.jobs.enqueue_upscale", return_value="task-1"),
+    ):
+        r = client.post(
+            "/api/jobs/upload",
+            data={**base, "scale": 4, "target_format": "webp", "variants": "4:webp,2:png,2:jpeg", "quality": "85"},
+            files=files,
+        )
+        assert r.status_code == 200
+        kwargs = create.call_args.kwargs
+        assert (kwargs["scale"], kwargs["target_format"]) == (4, "webp")
+        assert kwargs["variants"] == [{"scale": 2, "format": "png"}, {"scale": 2, "format": "jpeg"}]
+        assert kwargs["quality"] == 85
+
+        r = client.post("/api/jobs/upload", data={**base, "scale": 4, "variants": "3:png"}, files=files)
+        assert r.status_code == 400
+        r = client.post(
+            "/api/jobs/upload",
+            data={**base, "method": "convert", "target_format": "webp", "variants": "2:png"},
+            files=files,
+        )
+        assert r.status_code == 400
+    rate_limit._upload_times.clear()
+
+
+def test_upload_rejects_variants_above_the_job_scale(client):
+    """A 2x job stays a 2x job (native 2x inference): a 4x variant is refused, not promoted to the job."""
+    from app.core import rate_limit
+    rate_limit._upload_times.clear()
+
+    buf = io.BytesIO()
+    Image.new("RGB", (10, 10), color="red").save(buf, format="PNG")
+    files = [("files", ("img.png", buf.getvalue(), "image/png"))]
+    data = {"method": "esrgan", "denoise_first": "false", "face_enhance": "false", "scale": 2, "variants": "4:png"}
+    with (
+        patch("app.api.jobs.job_service.create_jobs") as create,
+        patch("app.api.jobs.enqueue_upscale") as enqueue,
+    ):
+        r = client.post("/api/jobs/upload", data=data, files=files)
+        assert r.status_code == 400
+        assert "2x" in r.json()["detail"]
+        create.assert_not_called()
+        enqueue.assert_not_called()
+    rate_limit._upload_times.clear()
+
+
+def test_job_response_lists_variants_and_downloads_them(client, tmp_path):
+    """Completed variants are listed with their own download URL and served by name."""
+    from datetime import datetime
+    from app.core.storage import LocalStorageBackend
+
+    job = _job_row(
+        "completed",
+        expires_at=datetime(2999, 1, 1),
+        result_key="results/x",
+        variants=[{"scale": 2, "format": "webp", "result_key": "results/x-2x.webp", "result_format": "webp"}],
+    )
+    (tmp_path / "results").mkdir()
+    (tmp_path / "results" / "x-2x.webp").write_bytes(b"RIFF")
+    with (
+        patch("app.api.jobs.job_service.get_jobs_by_ids", return_value=[job]),
+        patch("app.api.jobs.job_service.get_job_by_id", return_value=job),
+        patch("app.api.jobs.get_storage", return_value=LocalStorageBackend(str(tmp_path))),
+    ):
+        r = client.get(f"/api/jobs?ids={job.id}")
+        assert r.status_code == 200
+        (variant,) = r.json()[0]["variants"]
+        assert variant["name"] == "2x.webp"
+        assert variant["result_url"].endswith(f"/api/jobs/{job.id}/variants/2x.webp")
+        r = client.get(f"/api/jobs/{job.id}/variants/2x.webp")
+        assert r.status_code == 200
+        assert r.headers["content-type"] == "image/webp"
+        assert "img_upscaled_2x.webp" in r.headers["content-disposition"]
+        assert client.get(f"/api/jobs/{job.id}/variants/4x.png").status_code == 404
+
+
+def test_result_cache_key_ignores_unused_options():
+    from app.services.job_service import result_cache_key
+
+    assert result_cache_key("h", "real_esrgan", 4) == result_cache_key("h", "real_esrgan", 4, target_format="png")
+    assert result_cache_key("h", "real_esrgan", 4) != result_cache_key("h", "real_esrgan", 2)
+    assert result_cache_key("h", "real_esrgan", 4) != result_cache_key("h2", "real_esrgan", 4)
+    assert result_cache_key("h", "convert", 1, face_enhance=True, target_format="webp") == result_cache_key(
+        "h", "convert", 1, target_format="webp"
+    )
+
+
+def test_result_download_name_follows_result_format():
+    """Upscale results download with the extension of the format the worker wrote."""
+    from app.api.jobs import _result_download_name_and_media_type
+
+    assert _result_download_name_and_media_type(_job_row("completed")) == ("img_upscaled.png", "image/png")
+    webp = _job_row("completed", target_format="webp", result_format="webp")
+    assert _result_download_name_and_media_type(webp) == ("img_upscaled.webp", "image/webp")
+    # webp too large for the format: the worker fell back to png
+    fallback = _job_row("completed", target_format="webp", result_format="png")
+    assert _result_download_name_and_media_type(fallback) == ("img_upscaled.png", "image/png")
+
+
 def test_download_404_for_nonexistent_job(client):
     """GET /api/jobs/{id}/download returns 404 for non-existent job."""
     with patch("app.api.jobs.job_service.get_job_by_id", return_value=None):
@@ -135,6 +356,93 @@ def test_retry_404_for_nonexistent_job(client):
     assert "detail" in data
 
 
+def _job_row(status: str, **overrides):
+    """Job-like object with every field JobResponse reads."""
+    from datetime import datetime
+    from types import SimpleNamespace
+
+    now = datetime(2024, 1, 1)
+    fields = dict(
+        id=uuid.uuid4(),
+        status=status,
+        original_filename="img.png",
+        original_key="originals/x",
+        result_key=None,
+        scale=4,
+        method="real_esrgan",
+        created_at=now,
+        expires_at=now,
+        started_at=None,
+        finished_at=None,
+        error_message=None,
+        status_detail=None,
+        progress=None,
+        celery_task_id="task-1",
+    )
+    fields.update(overrides)
+    return SimpleNamespace(**fields)
+
+
+def test_cancel_sets_flag_and_revokes_without_terminate(client):
+    """POST /api/jobs/{id}/cancel asks the worker to stop cooperatively instead of killing it."""
+    job = _job_row("processing")
+    cancelled = _job_row("cancelled", id=job.id, error_message="Cancelled by user")
+    mock_redis = MagicMock()
+    with (
+        patch("app.api.jobs.job_service.get_job_by_id", return_value=job),
+        patch("app.api.jobs.job_service.cancel_job", return_value=cancelled),
+        patch("app.core.celery_client.redis.from_url", return_value=mock_redis),
+        patch("app.core.celery_client.celery_app.control.revoke") as revoke,
+    ):
+        r = client.post(f"/api/jobs/{job.id}/cancel")
+    assert r.status_code == 200
+    assert r.json()["status"] == "cancelled"
+    mock_redis.set.assert_called_once()
+    assert mock_redis.set.call_args.args[0] == f"job:{job.id}:cancel"
+    revoke.assert_called_once_with("task-1")
+
+
+def test_cancel_revokes_region_tasks_of_split_job(client):
+    """Cancelling a job split across workers revokes every region task recorded by the worker."""
+    job = _job_row("processing")
+    cancelled = _job_row("cancelled", id=job.id, error_message="Cancelled by user")
+    mock_redis = MagicMock()
+    mock_redis.lrange.return_value = [b"region-0", b"region-1"]
+    with (
+        patch("app.api.jobs.job_service.get_job_by_id", return_value=job),
+        patch("app.api.jobs.job_service.cancel_job", return_value=cancelled),
+        patch("app.core.celery_client.redis.from_url", return_value=mock_redis),
+        patch("app.core.celery_client.celery_app.control.revoke") as revoke,
+    ):
+        r = client.post(f"/api/jobs/{job.id}/cancel")
+    assert r.status_code == 200
+    assert mock_redis.lrange.call_args.args[0] == f"job:{job.id}:subtasks"
+    assert revoke.call_args_list[-1].args == (["region-0", "region-1"],)
+
+
+def test_cancel_interrupted_job(client):
+    """An interrupted job (waiting to resume from its checkpoint) can still be cancelled."""
+    job = _job_row("interrupted")
+    cancelled = _job_row("cancelled", id=job.id, error_message="Cancelled by user")
+    with (
+        patch("app.api.jobs.job_service.get_job_by_id", return_value=job),
+        patch("app.api.jobs.job_service.cancel_job", return_value=cancelled),
+        patch("app.core.celery_client.redis.from_url", return_value=MagicMock()),
+        patch("app.core.celery_client.celery_app.control.revoke") as revoke,
+    ):
+        r = client.post(f"/api/jobs/{job.id}/cancel")
+    assert r.status_code == 200
+    assert r.json()["status"] == "cancelled"
+    revoke.assert_called_once_with("task-1")
+
+
+def test_cancel_400_for_finished_job(client):
+    """POST /api/jobs/{id}/cancel returns 400 for a job that is no longer queued or processing."""
+    with patch("app.api.jobs.job_service.get_job_by_id", return_value=_job_row("completed")):
+        r = client.post("/api/jobs/00000000-0000-0000-0000-000000000001/cancel")
+    assert r.status_code == 400
+
+
 def test_batch_download_400_when_ids_empty(client):
     """GET /api/jobs/batch-download with empty ids returns 400."""
     r = client.get("/api/jobs/batch-download?ids=")
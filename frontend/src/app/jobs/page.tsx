@@ -42,7 +42,7 @@ function JobsContent() {
   }, [justUploaded, ids, router]);
 
   useEffect(() => {
-    const inProgress = ["queued", "processing"];
+    const inProgress = ["queued", "processing", "interrupted"];
     const newlyCompleted = jobs.filter(
       (j) => j.status === "completed" && prevStatusRef.current[j.id] && inProgress.includes(prevStatusRef.current[j.id])
     );
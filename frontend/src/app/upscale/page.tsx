@@ -35,6 +35,7 @@ const scaleOptions = [
 const methodOptions = [
   { value: "real_esrgan" as UpscaleMethod, label: "Standard (Real-ESRGAN)" },
   { value: "real_esrgan_anime" as UpscaleMethod, label: "Anime (Real-ESRGAN)" },
+  { value: "real_esrgan_fast" as UpscaleMethod, label: "Fast (Real-ESRGAN compact)" },
   { value: "esrgan" as UpscaleMethod, label: "Original ESRGAN (RRDB)" },
   { value: "swinir" as UpscaleMethod, label: "Detailed (SwinIR)" },
 ];
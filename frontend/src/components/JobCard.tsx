@@ -18,6 +18,7 @@ interface JobCardProps {
 const statusLabels: Record<string, string> = {
   queued: "Queued",
   processing: "Processing",
+  interrupted: "Interrupted — resuming",
   completed: "Done",
   failed: "Failed",
   cancelled: "Cancelled",
@@ -80,7 +81,8 @@ export function JobCard({ job, onCancelled, onRetried }: JobCardProps) {
     );
   }, [job.id]);
 
-  const canCancel = (job.status === "queued" || job.status === "processing") && onCancelled;
+  const canCancel =
+    (job.status === "queued" || job.status === "processing" || job.status === "interrupted") && onCancelled;
   const canRetry = job.status === "failed" && onRetried;
   const showCompare = job.status === "completed" && job.result_key && job.original_key;
 
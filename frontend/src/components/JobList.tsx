@@ -8,6 +8,7 @@ import type { Job } from "@/lib/types";
 const statusLabels: Record<string, string> = {
   queued: "Queued",
   processing: "Processing",
+  interrupted: "Interrupted — resuming",
   completed: "Done",
   failed: "Failed",
 };
@@ -36,7 +37,7 @@ function JobRow({ job }: { job: Job }) {
           </p>
           <p className="text-sm text-neutral-500 dark:text-zinc-400">
             {statusLabels[job.status] ?? job.status}
-            {job.status === "processing" && job.status_detail && (
+            {(job.status === "processing" || job.status === "interrupted") && job.status_detail && (
               <span className="ml-1">· {job.status_detail}</span>
             )}
           </p>
@@ -8,6 +8,9 @@ export interface UploadOptionsExtended {
   face_enhance?: boolean;
   target_format?: string;
   quality?: number;
+  compression_level?: number;
+  /** Extra outputs of an upscale job, "scale:format" items up to its scale, e.g. "2:webp,4:jpeg" */
+  variants?: string;
 }
 
 // Browser calls the backend at this URL. Set in .env as NEXT_PUBLIC_API_URL=http://localhost:8000.
@@ -106,6 +109,8 @@ export async function uploadJobsWithProgress(
   form.append("face_enhance", options.face_enhance === true ? "true" : "false");
   if (options.target_format != null) form.append("target_format", options.target_format);
   if (options.quality != null) form.append("quality", String(options.quality));
+  if (options.compression_level != null) form.append("compression_level", String(options.compression_level));
+  if (options.variants) form.append("variants", options.variants);
   for (const file of files) {
     form.append("files", file);
   }
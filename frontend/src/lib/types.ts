@@ -1,6 +1,11 @@
-export type JobStatus = "queued" | "processing" | "completed" | "failed" | "cancelled";
+export type JobStatus = "queued" | "processing" | "interrupted" | "completed" | "failed" | "cancelled";
 
-export type UpscaleMethod = "real_esrgan" | "real_esrgan_anime" | "esrgan" | "swinir";
+export type UpscaleMethod =
+  | "real_esrgan"
+  | "real_esrgan_anime"
+  | "real_esrgan_fast"
+  | "esrgan"
+  | "swinir";
 
 export type ConvertTargetFormat = "webp" | "png" | "jpeg";
 
@@ -22,6 +27,17 @@ export interface Job {
   finished_at: string | null;
   error_message: string | null;
   status_detail: string | null;
+  variants?: JobVariant[] | null;
+}
+
+/** One extra output of an upscale job (requested with the upload's variants option). */
+export interface JobVariant {
+  name: string;
+  scale: number;
+  format: string;
+  result_format: string | null;
+  result_bytes: number | null;
+  result_url: string | null;
 }
 
 export interface UploadOptions {
@@ -1,5 +1,9 @@
+from billiard.process import current_process
 from celery import Celery
+from celery.signals import worker_init, worker_process_init
+from celery.worker.control import inspect_command
 
+from app import cpu_layout
 from app.config import settings
 
 celery_app = Celery(
@@ -8,6 +12,10 @@ celery_app = Celery(
     backend=settings.redis_url,
 )
 celery_app.conf.task_default_queue = "celery"
+# Upscale tasks ack late (a child killed mid-job requeues its task); fetch one at a time so a
+# requeued or long job does not sit behind another child's prefetched messages
+celery_app.conf.worker_prefetch_multiplier = 1
+celery_app.conf.broker_transport_options = {"visibility_timeout": settings.task_visibility_timeout_seconds}
 celery_app.autodiscover_tasks(["app.tasks"])
 celery_app.conf.beat_schedule = {
     "cleanup-expired": {
@@ -19,3 +27,27 @@ celery_app.conf.beat_schedule = {
         "schedule": 300.0,  # every 5 min
     },
 }
+
+
+@worker_init.connect
+def preload_models(**kwargs) -> None:
+    """Runs once in the parent before the prefork pool starts (see app.warmup)."""
+    from app.warmup import preload_models as _preload_models
+
+    if settings.cpu_partition:
+        cpu_layout.log_layout(cpu_layout.plan())
+    _preload_models()
+
+
+@worker_process_init.connect
+def partition_cpus(**kwargs) -> None:
+    """Runs in each prefork child: pin it to its CPU slice and size its thread pools."""
+    if settings.cpu_partition:
+        # billiard numbers pool processes 0..concurrency-1 and reuses the index of a replaced child
+        cpu_layout.apply(getattr(current_process(), "index", 0) or 0)
+
+
+@inspect_command(name="cpu_layout")
+def cpu_layout_info(state, **kwargs) -> dict:
+    """CPU split across this worker's prefork children (celery -A app.celery_app inspect cpu_layout)."""
+    return cpu_layout.describe(cpu_layout.plan())
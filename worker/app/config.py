@@ -1,6 +1,16 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
+def _per_method(value: str) -> dict[str, str]:
+    """Parse 'real_esrgan:onnx,esrgan:onnx' into {method: value}."""
+    entries = {}
+    for item in value.split(","):
+        method, sep, option = item.partition(":")
+        if sep and method.strip():
+            entries[method.strip()] = option.strip()
+    return entries
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8", extra="ignore")
 
@@ -17,12 +27,140 @@ class Settings(BaseSettings):
     s3_region: str = "us-east-1"
 
     max_megapixels: int = 16
+    # Tile size per job is planned from the image size and memory budget (app.upscalers._tile_planner).
+    # tile_auto=False uses real_esrgan_tile (256 for SwinIR) for every image.
+    tile_auto: bool = True
     real_esrgan_tile: int = 512
+    # Same-shaped tiles stacked per forward pass (the planner's upper bound). >1 helps many-core CPUs
+    # with smaller tiles (e.g. tile 192 x batch 4); activation memory grows with tile area x batch size.
+    tile_batch_size: int = 1
+    # Inference memory per job for the tile planner; 0 = cgroup (or physical) memory limit split
+    # across worker_concurrency children, minus cached models. On GPU, 0 = free VRAM.
+    tile_memory_budget_mb: int = 0
+    # Prefork children per worker (entrypoint.sh --concurrency reads the same WORKER_CONCURRENCY)
+    worker_concurrency: int = 1
+    # Split the usable CPUs (affinity set capped by the cgroup quota) across the prefork children:
+    # each child sizes torch / OpenCV / onnxruntime to its share (see app.cpu_layout).
+    # Inspect: celery -A app.celery_app inspect cpu_layout
+    cpu_partition: bool = True
+    # Also pin each child to its own contiguous CPU slice (sched_setaffinity; only with cpu_partition)
+    cpu_affinity: bool = True
+    # Upscale output canvases at least this large are numpy.memmap files in the job temp dir,
+    # so peak RSS is bounded by tile size rather than image size (0 = always memory-map)
+    memmap_canvas_min_mb: int = 256
+    # Content-aware tile skipping (app.upscalers._tiling): near-constant padded tiles are upscaled
+    # bicubically instead of by the model, byte-identical padded tiles reuse one model output.
+    # Meant for screenshots, scans, pixel art and flat backgrounds; off by default.
+    tile_skip: bool = False
+    # A padded tile is near-constant when each channel's max - min is within this many 8-bit levels
+    tile_skip_flat_range: int = 2
+    # Reuse the model output of byte-identical padded tiles (only with tile_skip)
+    tile_skip_reuse: bool = True
+    # Output pixels over which an interpolated tile is ramped into model-output neighbours
+    # (0 = the tile padding times the scale)
+    tile_skip_blend_px: int = 0
+    # Processes one job's tile loop is sharded across (forked after the model is loaded, weights
+    # shared copy-on-write, tiles written into a shared canvas); 1 = in-process. CPU torch only.
+    # Compare: python scripts/benchmark.py shards --shards 1,2,4,8
+    tile_shards: int = 1
+    # Torch threads per shard (0 = this child's CPU share / tile_shards)
+    tile_shard_threads: int = 0
+    # Checkpoint finished tile batches (output canvas + done markers on disk, see
+    # app.upscalers._checkpoint) so a job whose worker child died resumes when redelivered. Opt-in:
+    # it writes every large job's canvas twice, and a redelivery only resumes on a worker that sees
+    # the same checkpoint_dir, so it pays off with checkpoint_dir on storage shared by all workers
+    tile_checkpoints: bool = False
+    # Jobs with fewer planned tiles are simply rerun from the start
+    tile_checkpoint_min_tiles: int = 16
+    # Checkpoint directory, must survive worker restarts and be shared by the workers a job may be
+    # redelivered to (empty = <local_storage_path>/checkpoints, host-local)
+    checkpoint_dir: str = ""
+    # Deliveries of one job (or split region) before it is failed instead of resumed again,
+    # e.g. an image that OOM-kills the worker every time
+    max_job_attempts: int = 3
+    # Upscale tasks are acknowledged when they finish; the Redis broker redelivers an unacknowledged
+    # task after this many seconds (worker container gone). Must exceed the longest job.
+    task_visibility_timeout_seconds: int = 6 * 3600
+    # Split upscale jobs of at least this many input megapixels into overlapping regions, each a
+    # Celery task any worker can pick up; a chord callback stitches them, runs face enhance and
+    # uploads (see app.tasks.split). Region images go through storage. 0 = never split.
+    split_min_megapixels: float = 0
+    # Target input megapixels per region
+    split_region_megapixels: float = 2.0
+    # Input pixels each region extends into its neighbours; the overlaps are blended linearly
+    split_overlap_px: int = 32
+    # Keep post-denoise and post-upscale images in storage this many seconds, so a later job on the
+    # same image whose steps share a prefix (e.g. the same upscale with face_enhance) starts from the
+    # deepest one (see app.step_cache). Storing adds a full-size PNG encode and upload per step to
+    # every job, so 0 = off by default; enable where the same images are re-run (e.g. 3600)
+    step_cache_ttl_seconds: int = 0
+    # Denoise pre-step filter (denoise_first): nlmeans (OpenCV non-local means, the reference) or
+    # bilateral (several times faster, softer on heavy noise). Compare: python scripts/benchmark.py denoise
+    denoise_method: str = "nlmeans"
+    # Threads the denoise runs its overlapping row bands on (0 = this child's CPU share)
+    denoise_workers: int = 0
+    # Face enhance detects faces on the upscale's input (else the output) scaled down to at most this
+    # many megapixels, then maps the boxes to the output; images without faces skip GFPGAN
+    face_detect_max_megapixels: float = 4.0
+    # rembg model for background_remove (u2net; u2netp is several times faster and a little coarser;
+    # also u2net_human_seg, silueta, isnet-general-use, isnet-anime), downloaded to U2NET_HOME on first use
+    background_remove_model: str = "u2net"
+    # Background-remove jobs from one upload that one task segments together in a batched inference
+    # (1 = each job on its own)
+    background_remove_batch_size: int = 4
+    # Result encoding (see app.encode). PNG compression level 0-9 when the job does not set one: 1 is
+    # cv2.imwrite's default size and speed, 2-3 typically smaller for ~1.5x the time
+    png_compression_level: int = 1
+    # JPEG quality when the job sets none, and libwebp effort (0 fastest - 6 smallest)
+    jpeg_quality: int = 95
+    webp_method: int = 4
     # GPU: set to 0 (or device id) to use CUDA; None = CPU (slow, minutes per image)
     real_esrgan_gpu_id: int | None = None
+    # Inference backend per RRDB method ("method:backend,...", backend torch or onnx), e.g.
+    # "real_esrgan:onnx,esrgan:onnx". ONNX graphs are exported once next to the weights; if
+    # onnxruntime is missing, export fails or a GPU is configured, the method runs on torch.
+    inference_backends: str = ""
+    # CPU precision per torch method ("method:precision,...", fp32 / bf16 / int8), e.g.
+    # "real_esrgan:bf16,swinir:int8". Falls back to fp32 where the CPU or network lacks support
+    # (see app.upscalers._precision); compare with python scripts/benchmark.py precision.
+    inference_precision: str = ""
+    # How 2× jobs run per method ("method:strategy,...", native / half_input / downscale), e.g.
+    # "esrgan:half_input,real_esrgan_anime:half_input". Default: native 2× checkpoint where one
+    # exists (real_esrgan, swinir), else 4× then downscale (see app.upscalers._scale_strategy).
+    upscale_2x_strategies: str = ""
+    # How the alpha plane of RGBA inputs is upscaled per method ("method:strategy,...", model /
+    # interpolate / guided), e.g. "real_esrgan:guided,real_esrgan_fast:interpolate". Default model
+    # (through the network, about twice the inference); fully opaque alpha is always skipped
+    # (see app.upscalers._alpha).
+    alpha_strategies: str = ""
+    # onnxruntime threads per session, RRDB ONNX backend and background_remove (0 = intra-op: this
+    # child's CPU share with cpu_partition, else onnxruntime's default of one thread per core)
+    onnx_intra_op_threads: int = 0
+    onnx_inter_op_threads: int = 0
+    # Loaded models kept in memory across jobs (LRU, evicted above this budget)
+    model_cache_max_mb: int = 4096
+    # Models loaded in the Celery parent before forking, e.g. "real_esrgan,real_esrgan:2,swinir"
+    # (method[:scale], scale defaults to 4; face_enhance loads the GFPGAN restorer). Children share
+    # the weights copy-on-write.
+    warmup_models: str = ""
 
-    # SwinIR subprocess timeout (seconds). Large images on CPU can take 15–30+ min.
+    # Minimum seconds between progress updates written while tiles run (cancel is checked every tile)
+    progress_interval_seconds: float = 2.0
+
+    # SwinIR inference timeout (seconds), checked between tiles. Large images on CPU can take 15–30+ min.
     swinir_timeout_seconds: int = 9000
 
+    def inference_backend(self, method: str) -> str:
+        return _per_method(self.inference_backends).get(method, "torch")
+
+    def precision(self, method: str) -> str:
+        return _per_method(self.inference_precision).get(method, "fp32")
+
+    def upscale_2x_strategy(self, method: str) -> str:
+        return _per_method(self.upscale_2x_strategies).get(method, "")
+
+    def alpha_strategy(self, method: str) -> str:
+        return _per_method(self.alpha_strategies).get(method, "")
+
 
 settings = Settings()
@@ -0,0 +1,180 @@
+"""
+Split the worker's CPUs across the prefork children so WORKER_CONCURRENCY > 1 does not
+oversubscribe the host (every child's torch / OpenCV / onnxruntime pools default to all cores).
+
+The usable CPUs are this process's affinity set, capped by the cgroup CPU quota. Child i gets
+the i-th contiguous slice of the affinity set (pinned with sched_setaffinity when
+CPU_AFFINITY is on) and threads = usable CPUs // children for torch intra-op, OpenCV and
+onnxruntime (unless ONNX_INTRA_OP_THREADS is set; see onnx_threads). The parent logs the layout at startup and
+each child logs its slice; inspect a running worker with
+  celery -A app.celery_app inspect cpu_layout
+or preview a layout with
+  python -m app.cpu_layout --concurrency 4
+"""
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CpuLayout:
+    """CPU slice and thread count per prefork child (index = billiard pool process index)."""
+
+    cpus: list[int]
+    quota_cpus: float | None
+    usable: int
+    children: int
+    threads_per_child: int
+    slices: list[list[int]]
+
+
+def _cgroup_cpu_quota() -> float | None:
+    """CPU quota in cores (cgroup v2 cpu.max, then v1 cfs quota / period), or None when unlimited."""
+    try:
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()[:2]
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        quota = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+        period = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
+        return None if quota <= 0 else quota / period
+    except (OSError, ValueError):
+        return None
+
+
+def _affinity() -> list[int]:
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # not Linux
+        return list(range(os.cpu_count() or 1))
+
+
+def plan(children: int | None = None) -> CpuLayout:
+    """Layout for `children` prefork children (default settings.worker_concurrency)."""
+    children = max(1, children or settings.worker_concurrency)
+    cpus = _affinity()
+    quota = _cgroup_cpu_quota()
+    usable = len(cpus) if quota is None else max(1, min(len(cpus), math.floor(quota)))
+    threads = max(1, usable // children)
+    # Contiguous slices of the affinity set covering all of it (neighbouring ids usually share a
+    # core / cache); with more children than CPUs, children share single CPUs round-robin
+    n = len(cpus)
+    if children <= n:
+        slices = [cpus[i * n // children:(i + 1) * n // children] for i in range(children)]
+    else:
+        slices = [[cpus[i % n]] for i in range(children)]
+    return CpuLayout(
+        cpus=cpus,
+        quota_cpus=quota,
+        usable=usable,
+        children=children,
+        threads_per_child=threads,
+        slices=slices,
+    )
+
+
+_process_threads: int | None = None
+
+
+def process_threads() -> int:
+    """Threads this process may use: its share after apply(), else all usable CPUs."""
+    return _process_threads or plan(1).usable
+
+
+def onnx_threads() -> int:
+    """
+    intra_op_num_threads for onnxruntime sessions (0 = onnxruntime's default): ONNX_INTRA_OP_THREADS,
+    else with cpu_partition a child's share, also in the parent, so the sessions it preloads are
+    the ones (same threads, same model cache key) the children look up.
+    """
+    if settings.onnx_intra_op_threads:
+        return settings.onnx_intra_op_threads
+    if settings.cpu_partition:
+        return _process_threads or plan().threads_per_child
+    return 0
+
+
+def apply(index: int, layout: CpuLayout | None = None) -> None:
+    """Pin this (child) process to its slice and size the torch / OpenCV / onnxruntime pools."""
+    global _process_threads
+    layout = layout or plan()
+    threads = layout.threads_per_child
+    cpus = layout.slices[index % layout.children]
+    if settings.cpu_affinity:
+        try:
+            os.sched_setaffinity(0, cpus)
+        except (AttributeError, OSError) as e:
+            logger.warning("cpu layout: could not pin child %s to %s: %s", index, cpus, e)
+            cpus = _affinity()
+    # Read by torch / MKL / OpenBLAS if they are first imported after this point
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(threads)
+    try:
+        import cv2
+
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+    _process_threads = threads
+    logger.info(
+        "cpu layout child=%s cpus=%s threads=%s (torch, opencv, onnxruntime intra-op)",
+        index, _format_cpus(cpus), threads,
+    )
+
+
+def _format_cpus(cpus: list[int]) -> str:
+    """[0, 1, 2, 5] -> '0-2,5'."""
+    runs: list[list[int]] = []
+    for cpu in cpus:
+        if runs and runs[-1][1] == cpu - 1:
+            runs[-1][1] = cpu
+        else:
+            runs.append([cpu, cpu])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in runs)
+
+
+def describe(layout: CpuLayout) -> dict:
+    """JSON-friendly layout, as returned by the cpu_layout inspect command."""
+    data = asdict(layout)
+    data["cpus"] = _format_cpus(layout.cpus)
+    data["slices"] = {str(i): _format_cpus(s) for i, s in enumerate(layout.slices)}
+    data["partitioned"] = settings.cpu_partition
+    data["affinity"] = settings.cpu_affinity
+    return data
+
+
+def log_layout(layout: CpuLayout) -> None:
+    logger.info(
+        "cpu layout: cpus=%s quota=%s usable=%s children=%s threads_per_child=%s slices=%s",
+        _format_cpus(layout.cpus),
+        f"{layout.quota_cpus:g}" if layout.quota_cpus is not None else "none",
+        layout.usable,
+        layout.children,
+        layout.threads_per_child,
+        " ".join(f"{i}:{_format_cpus(s)}" for i, s in enumerate(layout.slices)),
+    )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Preview the worker's CPU layout on this host.")
+    parser.add_argument("--concurrency", type=int, default=None, help="default WORKER_CONCURRENCY")
+    args = parser.parse_args()
+    print(json.dumps(describe(plan(args.concurrency)), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+"""
+Result encoding: the one encode of a job's output (see app.image), in the format the job asked for.
+
+  png   lossless; compression_level 0-9 (default settings.png_compression_level), written by
+        OpenCV's libpng encoder straight from the pixels (a memmap canvas stays on disk):
+          0    stored
+          1    cv2.imwrite's defaults: its fastest filtered encode
+          2-3  zlib at that level with the RLE strategy: typically smaller, ~1.5x the time
+          4-9  zlib at that level with the filtered strategy: slower, rarely smaller than 2-3
+  webp  quality 1-100 is lossy; no quality is lossless. settings.webp_method trades speed (0) for
+        size (6). At most 16383 px a side: larger outputs are written as PNG instead.
+  jpeg  quality 1-100 (default settings.jpeg_quality); 8-bit, no alpha. At most 65535 px a side.
+
+WebP and JPEG keep 8 bits per channel (16-bit inputs keep their high byte) and run single-threaded
+(libwebp / libjpeg through Pillow / OpenCV). EncodeStats records what was written for the job.
+"""
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from app.config import settings
+from app.image import Frame, eight_bit
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("png", "webp", "jpeg")
+MEDIA_TYPES = {"png": "image/png", "webp": "image/webp", "jpeg": "image/jpeg"}
+# Largest side each format can hold
+MAX_SIDE = {"webp": 16383, "jpeg": 65535}
+
+
+@dataclass
+class EncodeStats:
+    """What the result encode wrote, for the job record and log."""
+
+    format: str = "png"
+    bytes: int = 0
+    seconds: float = 0.0
+
+
+@dataclass(frozen=True)
+class Encoding:
+    """Requested output format; quality (webp / jpeg) and compression_level (png) None = default."""
+
+    format: str = "png"
+    quality: int | None = None
+    compression_level: int | None = None
+
+    @classmethod
+    def for_job(cls, job) -> "Encoding":
+        """From the job's target_format / quality / compression_level (unknown formats: png)."""
+        fmt = getattr(job, "target_format", None) or "png"
+        return cls(
+            format=fmt if fmt in FORMATS else "png",
+            quality=getattr(job, "quality", None),
+            compression_level=getattr(job, "compression_level", None),
+        )
+
+
+def result_path(directory: Path, job) -> Path:
+    """The file in directory a job's result is encoded to, named by its format (Encoding.for_job)."""
+    return directory / f"output.{Encoding.for_job(job).format}"
+
+
+def _rgb(pixels: np.ndarray) -> np.ndarray:
+    """BGR(A) -> RGB(A); gray unchanged."""
+    if pixels.ndim == 2:
+        return pixels
+    return cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB if pixels.shape[2] == 3 else cv2.COLOR_BGRA2RGBA)
+
+
+def _png_params(level: int) -> list[int]:
+    """cv2.imwrite parameters of a compression level, see the module docstring."""
+    if level == 1:
+        return []
+    if level <= 0:
+        return [cv2.IMWRITE_PNG_COMPRESSION, 0]
+    strategy = cv2.IMWRITE_PNG_STRATEGY_RLE if level <= 3 else cv2.IMWRITE_PNG_STRATEGY_FILTERED
+    return [cv2.IMWRITE_PNG_COMPRESSION, min(level, 9), cv2.IMWRITE_PNG_STRATEGY, strategy]
+
+
+def write_png(pixels: np.ndarray, path: Path, level: int) -> None:
+    """Encode pixels (OpenCV layout, see app.image) as PNG at path, row by row."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # cv2.imwrite picks the codec by extension; result paths have none
+    target = path if path.suffix.lower() == ".png" else path.with_name(f"{path.name}.png")
+    if not cv2.imwrite(str(target), pixels, _png_params(level)):
+        raise RuntimeError(f"Failed to encode PNG: {path}")
+    if target != path:
+        os.replace(target, path)
+
+
+def _fits(fmt: str, frame: Frame) -> bool:
+    return max(frame.width, frame.height) <= MAX_SIDE.get(fmt, 1 << 31)
+
+
+def write(frame: Frame, path: Path, encoding: Encoding | None = None, stats: EncodeStats | None = None) -> str:
+    """Encode frame at path as encoding (default PNG); returns the format written."""
+    encoding = encoding or Encoding()
+    start = time.monotonic()
+    fmt = encoding.format
+    if not _fits(fmt, frame):
+        logger.warning(
+            "%sx%s exceeds %s's %s px limit; writing png", frame.width, frame.height, fmt, MAX_SIDE[fmt]
+        )
+        fmt = "png"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if fmt == "webp":
+        img = Image.fromarray(_rgb(eight_bit(frame.pixels)))
+        if encoding.quality is None:
+            img.save(path, format="WEBP", lossless=True, method=settings.webp_method)
+        else:
+            img.save(path, format="WEBP", quality=encoding.quality, method=settings.webp_method)
+    elif fmt == "jpeg":
+        pixels = eight_bit(frame.pixels)
+        if frame.has_alpha:
+            pixels = cv2.cvtColor(pixels, cv2.COLOR_BGRA2BGR)
+        ok, buf = cv2.imencode(".jpg", pixels, [cv2.IMWRITE_JPEG_QUALITY, encoding.quality or settings.jpeg_quality])
+        if not ok:
+            raise RuntimeError(f"Failed to encode JPEG: {path}")
+        path.write_bytes(buf.tobytes())
+    else:
+        level = encoding.compression_level
+        write_png(frame.pixels, path, settings.png_compression_level if level is None else level)
+    seconds = time.monotonic() - start
+    size = os.path.getsize(path)
+    if stats is not None:
+        stats.format, stats.bytes, stats.seconds = fmt, size, seconds
+    logger.info(
+        "encoded %sx%s %s %.1f MB in %.1fs", frame.width, frame.height, fmt, size / 1e6, seconds
+    )
+    return fmt
@@ -0,0 +1,122 @@
+"""
+Decoded images handed between pipeline steps. A job's input is decoded once (read) and its result
+encoded once (write); every step in between takes and returns a Frame, never a file.
+
+Pixels are in OpenCV layout, as cv2.imread(IMREAD_UNCHANGED) returns them: gray (H, W), BGR or
+BGRA (H, W, C), uint8 or uint16, in stored orientation (EXIF orientation is not applied). A
+step's output may be a numpy.memmap in the job's temp dir when it is large (the upscale canvas,
+see _tiling.allocate_canvas); everything else stays in memory.
+"""
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+MODES = {1: "gray", 3: "BGR", 4: "BGRA"}
+
+# Inputs are checked against settings.max_megapixels (probe) before they are decoded; PIL's own
+# decompression-bomb limit would reject the very large inputs split jobs are for
+Image.MAX_IMAGE_PIXELS = None
+
+
+@dataclass(frozen=True, eq=False)
+class Frame:
+    """A decoded image and what the steps need to know about it."""
+
+    pixels: np.ndarray
+    # Container the job's input was decoded from ("PNG", "JPEG", "WEBP", ...), None if unknown
+    source_format: str | None = None
+
+    @property
+    def height(self) -> int:
+        return self.pixels.shape[0]
+
+    @property
+    def width(self) -> int:
+        return self.pixels.shape[1]
+
+    @property
+    def channels(self) -> int:
+        return 1 if self.pixels.ndim == 2 else self.pixels.shape[2]
+
+    @property
+    def mode(self) -> str:
+        return MODES[self.channels]
+
+    @property
+    def has_alpha(self) -> bool:
+        return self.channels == 4
+
+    @property
+    def bit_depth(self) -> int:
+        return 16 if self.pixels.dtype == np.uint16 else 8
+
+    @property
+    def megapixels(self) -> float:
+        return self.height * self.width / 1_000_000
+
+    def with_pixels(self, pixels: np.ndarray) -> "Frame":
+        """Step output: new pixels, same source metadata."""
+        return replace(self, pixels=pixels)
+
+
+def probe(path: Path) -> tuple[int, int]:
+    """(width, height) from the file header, without decoding the pixels."""
+    with Image.open(path) as im:
+        return im.size
+
+
+def probe_channels(path: Path) -> int:
+    """Channels read() decodes the file at path to (1 gray, 3 BGR, 4 BGRA), from the file header."""
+    with Image.open(path) as im:
+        if im.mode in ("RGBA", "LA", "PA") or (im.mode == "P" and "transparency" in im.info):
+            return 4
+        if im.mode in ("1", "L", "I", "I;16", "F"):
+            return 1
+        return 3
+
+
+def _format(path: Path) -> str | None:
+    try:
+        with Image.open(path) as im:
+            return im.format
+    except (OSError, ValueError):
+        return None
+
+
+def read(path: Path) -> Frame:
+    """Decode the image at path (the only decode of a job's input)."""
+    pixels = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+    if pixels is None:
+        raise RuntimeError(f"Failed to read image: {path}")
+    return Frame(pixels, _format(path))
+
+
+def write(frame: Frame, path: Path) -> None:
+    """Encode frame as PNG at path (the only encode of a job's result)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if not cv2.imwrite(str(path), frame.pixels):
+        raise RuntimeError(f"Failed to write image: {path}")
+
+
+def eight_bit(pixels: np.ndarray) -> np.ndarray:
+    """pixels as uint8 (16-bit keeps its high byte, as cv2.imread without IMREAD_ANYDEPTH)."""
+    if pixels.dtype == np.uint16:
+        return (pixels >> 8).astype(np.uint8)
+    return pixels
+
+
+def color(pixels: np.ndarray) -> np.ndarray:
+    """
+    8-bit BGR view of pixels, converted as cv2.imread(IMREAD_COLOR) converts (without its EXIF
+    rotation): for steps whose models take neither alpha nor 16-bit (denoise, face enhance,
+    SwinIR). Unchanged if already so.
+    """
+    pixels = eight_bit(pixels)
+    if pixels.ndim == 2:
+        return cv2.cvtColor(pixels, cv2.COLOR_GRAY2BGR)
+    if pixels.shape[2] == 4:
+        return cv2.cvtColor(pixels, cv2.COLOR_BGRA2BGR)
+    return pixels
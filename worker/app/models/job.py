@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, String, Integer, DateTime, Text, Column
+from sqlalchemy import JSON, BigInteger, Boolean, String, Integer, DateTime, Float, Text, Column
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import DeclarativeBase
 
@@ -27,6 +27,13 @@ class Job(Base):
     finished_at = Column(DateTime, nullable=True)
     error_message = Column(Text, nullable=True)
     status_detail = Column(String(256), nullable=True)
+    celery_task_id = Column(String(255), nullable=True)
     progress = Column(Integer, nullable=True)  # 0-100 when processing
-    target_format = Column(String(16), nullable=True)  # for convert: webp, png, jpeg
-    quality = Column(Integer, nullable=True)  # for convert: 1-100
+    target_format = Column(String(16), nullable=True)  # convert / upscale output: webp, png, jpeg
+    quality = Column(Integer, nullable=True)  # webp / jpeg: 1-100
+    compression_level = Column(Integer, nullable=True)  # png: 0-9
+    result_format = Column(String(16), nullable=True)
+    result_bytes = Column(BigInteger, nullable=True)
+    encode_seconds = Column(Float, nullable=True)
+    steps_reused = Column(String(64), nullable=True)  # steps taken from app.step_cache
+    variants = Column(JSON, nullable=True)  # extra outputs, see app.pipeline.Variant
@@ -1,62 +1,348 @@
 """
 Run the image pipeline for a job: optional denoise -> main (upscale or bg remove) -> optional face_enhance.
 Single responsibility: compose steps; no DB or status updates.
+The input is decoded once and the result encoded once (app.encode, in the job's output format);
+steps hand each other decoded Frames (app.image), and only the upscale canvas spills to a memmap in
+the job's temp dir when large. Post-denoise and post-upscale frames may also be kept in storage for
+later jobs on the same image (app.step_cache).
 """
+import logging
+import os
+import time
+from dataclasses import dataclass, field, replace
 from pathlib import Path
 
-import shutil
-from pathlib import Path
+import cv2
 
+from app import encode, image
 from app.config import settings
+from app.image import Frame
 from app.processors import background_remove, convert, denoise, face_enhance
-from app.upscalers import esrgan, real_esrgan, real_esrgan_anime, swinir
+from app.progress import JobProgress
+from app import step_cache
+from app.step_cache import StepCache
+from app.upscalers import (
+    _alpha,
+    _scale_strategy,
+    _tile_planner,
+    _tiling,
+    esrgan,
+    real_esrgan,
+    real_esrgan_anime,
+    real_esrgan_fast,
+    swinir,
+)
+from app.upscalers._checkpoint import TileCheckpoint
+
+logger = logging.getLogger(__name__)
 
 METHOD_BACKGROUND_REMOVE = "background_remove"
 METHOD_CONVERT = "convert"
-UPSCALE_METHODS = ("real_esrgan", "swinir", "esrgan", "real_esrgan_anime")
+UPSCALE_METHODS = ("real_esrgan", "swinir", "esrgan", "real_esrgan_anime", "real_esrgan_fast")
+UPSCALERS = {
+    "real_esrgan": real_esrgan,
+    "esrgan": esrgan,
+    "real_esrgan_anime": real_esrgan_anime,
+    "real_esrgan_fast": real_esrgan_fast,
+    "swinir": swinir,
+}
+
+# Job progress (percent) spanned by the pipeline; upscale_task reports the steps around it
+PROGRESS_START = 50
+PROGRESS_END = 75
+
+
+@dataclass
+class Variant:
+    """An extra output of an upscale job (job.variants): requested scale and encoding, then what was written."""
+
+    scale: int
+    encoding: encode.Encoding
+    path: Path | None = None
+    encoded: encode.EncodeStats = field(default_factory=encode.EncodeStats)
+
+    @property
+    def name(self) -> str:
+        """As the backend names it (job_service.variant_name)."""
+        return f"{self.scale}x.{self.encoding.format}"
+
+
+def variants_for(job) -> list[Variant]:
+    """The job's variants; quality / compression_level as for its own result."""
+    base = encode.Encoding.for_job(job)
+    return [Variant(v["scale"], replace(base, format=v["format"])) for v in getattr(job, "variants", None) or []]
+
+
+def write_variants(job, frame: Frame, variants: list[Variant], directory: Path) -> None:
+    """
+    Derive each variant from frame (the job's output at job.scale; smaller scales by INTER_AREA, as
+    the downscale 2× strategy) and encode it in directory.
+    """
+    resized: dict[int, Frame] = {job.scale: frame}
+    for i, variant in enumerate(variants):
+        if variant.scale not in resized:
+            size = (frame.width * variant.scale // job.scale, frame.height * variant.scale // job.scale)
+            resized[variant.scale] = frame.with_pixels(cv2.resize(frame.pixels, size, interpolation=cv2.INTER_AREA))
+        variant.path = directory / f"variant-{i}"
+        encode.write(resized[variant.scale], variant.path, variant.encoding, variant.encoded)
+
+
+def plan_tiles(job, frame: Frame, strategy: str = "native") -> _tile_planner.TilePlan:
+    """Tile plan for this job's upscale step of frame."""
+    return _plan(job, frame.height, frame.width, frame.channels, strategy)
+
+
+def plan_input(job, input_path: Path, strategy: str = "native") -> _tile_planner.TilePlan:
+    """plan_tiles for the frame job's upscale step will take from input_path, from the file header."""
+    width, height = image.probe(input_path)
+    # denoise hands on 8-bit BGR
+    channels = 3 if getattr(job, "denoise_first", False) else image.probe_channels(input_path)
+    return _plan(job, height, width, channels, strategy)
+
+
+def _plan(job, height: int, width: int, channels: int, strategy: str) -> _tile_planner.TilePlan:
+    if strategy == "half_input":
+        height, width = (height + 1) // 2, (width + 1) // 2
+    run_scale = _scale_strategy.model_scale(strategy, job.scale)
+    if settings.tile_auto:
+        plan = _tile_planner.plan(job.method, run_scale, height, width, channels)
+    else:
+        plan = _tile_planner.fixed_plan(job.method, height, width)
+    logger.info(
+        "job_id=%s tile plan method=%s x%s strategy=%s %sx%s tile=%s batch=%s tiles=%s "
+        "estimate_mb=%.0f budget_mb=%.0f source=%s%s",
+        getattr(job, "id", None), job.method, job.scale, strategy, width, height,
+        plan.tile, plan.batch_size, plan.tiles,
+        plan.estimate_mb, plan.budget_mb, plan.source,
+        f" est_seconds={plan.est_seconds:.0f}" if plan.est_seconds is not None else "",
+    )
+    return plan
+
+
+def model_identity(job, strategy: str) -> str:
+    """
+    The model job's upscale step runs, for app.step_cache keys: weights file (name, size, mtime),
+    backend, precision, device and alpha strategy of job.method at strategy's model scale.
+    """
+    path = UPSCALERS[job.method].weights(_scale_strategy.model_scale(strategy, job.scale))
+    try:
+        stat = path.stat()
+        version = f"{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        version = "missing"
+    return (
+        f"{path.name}:{version}:{settings.inference_backend(job.method)}:{settings.precision(job.method)}"
+        f":gpu={settings.real_esrgan_gpu_id}:alpha={_alpha.resolve(job.method)}"
+    )
+
+
+def step_keys(
+    job,
+    input_path: Path,
+    strategy: str | None,
+    intermediates: StepCache | None,
+    checkpoint: TileCheckpoint | None = None,
+) -> tuple[dict[str, str], _tile_planner.TilePlan | None]:
+    """
+    Keys of job's steps in intermediates ({} without) and the tile plan the upscale key names, which
+    the upscale must then run with: the checkpointed plan, else one planned from input_path's header.
+    """
+    if intermediates is None:
+        return {}, None
+    if strategy is None:
+        return intermediates.keys(job), None
+    plan = checkpoint.load_plan() if checkpoint is not None else None
+    if plan is None:
+        plan = plan_input(job, input_path, strategy)
+    return intermediates.keys(job, strategy, step_cache.tiling(plan), model_identity(job, strategy)), plan
 
 
-def run(job, input_path: Path, output_path: Path) -> None:
+def run(
+    job,
+    input_path: Path,
+    output_path: Path,
+    progress: JobProgress | None = None,
+    checkpoint: TileCheckpoint | None = None,
+    encoded: encode.EncodeStats | None = None,
+    intermediates: StepCache | None = None,
+    variants: list[Variant] | None = None,
+) -> dict:
     """
     Run pipeline for job. job must have: method, scale, denoise_first, face_enhance.
-    For convert: target_format, optional quality. Reads from input_path, writes final result to output_path.
+    For convert: target_format, optional quality. Reads from input_path, writes final result to output_path
+    (the only decode and encode; large intermediates spill next to output_path).
+    With progress, tile/face progress is reported and JobCancelled is raised between tiles once cancelled.
+    With checkpoint, the upscale step resumes from the tiles an earlier attempt finished.
+    encoded receives the format, size and encode time of the result.
+    With intermediates, the job starts from the deepest stored step of its chain (see resume) and
+    stores its denoise / upscale outputs for later jobs on the same image.
+    variants (see variants_for) are derived from the final frame and written next to output_path.
+    Returns what ran, for the job log: for upscale methods {"upscale_strategy": ..., "tiles": ...,
+    "tiles_flat": ..., "tiles_reused": ...} (skipped tiles, see _tiling) plus "alpha" (the alpha
+    strategy, see _alpha) for RGBA inputs and "faces" / "face_seconds" with face_enhance, plus
+    "steps_reused" ("denoise", "upscale" or both, comma-separated) when resumed from intermediates.
     """
+    check = progress.check if progress else (lambda: None)
+
     if job.method == METHOD_CONVERT:
-        convert.run(
-            input_path,
-            output_path,
-            target_format=getattr(job, "target_format", "png"),
-            quality=getattr(job, "quality", None),
+        start = time.monotonic()
+        target_format = getattr(job, "target_format", "png")
+        convert.run(input_path, output_path, target_format=target_format, quality=getattr(job, "quality", None))
+        if encoded is not None:
+            encoded.format, encoded.bytes = target_format, os.path.getsize(output_path)
+            encoded.seconds = time.monotonic() - start
+        return {}
+
+    strategy = _scale_strategy.resolve(job.method, job.scale) if job.method in UPSCALE_METHODS else None
+    keys, plan = step_keys(job, input_path, strategy, intermediates, checkpoint)
+    frame, reused = resume(job, input_path, intermediates, keys)
+    check()
+
+    if job.method == METHOD_BACKGROUND_REMOVE:
+        encode.write(background_remove.run(frame), output_path, encode.Encoding.for_job(job), encoded)
+        return {"steps_reused": ",".join(reused)} if reused else {}
+
+    label = upscale_label(job, strategy)
+    end = upscale_end(job)
+    stats = _tiling.TileStats()
+    source = None
+    if "upscale" not in reused:
+        source = frame
+        frame = upscale(
+            job,
+            frame,
+            strategy,
+            on_tile=progress.stage(label, PROGRESS_START, end) if progress else None,
+            stats=stats,
+            checkpoint=checkpoint,
+            spill_dir=output_path.parent,
+            plan=plan,
         )
-        return
+        check()
+        if "upscale" in keys:
+            intermediates.save(keys["upscale"], frame)
+
+    face_stats = face_enhance.FaceStats()
+    frame = finish(job, frame, progress, end, source=source, stats=face_stats)
+    encode.write(frame, output_path, encode.Encoding.for_job(job), encoded)
+    if variants:
+        write_variants(job, frame, variants, output_path.parent)
+    steps = {
+        "upscale_strategy": strategy,
+        "tiles": stats.tiles,
+        "tiles_flat": stats.flat,
+        "tiles_reused": stats.reused,
+    }
+    if stats.alpha:
+        steps["alpha"] = stats.alpha
+    if reused:
+        steps["steps_reused"] = ",".join(reused)
+    if getattr(job, "face_enhance", False):
+        steps["faces"] = face_stats.faces
+        steps["face_seconds"] = round(face_stats.seconds, 1)
+    return steps
 
-    current = input_path
-    work_dir = input_path.parent
-    step_out = work_dir / "step.png"
 
+def resume(
+    job,
+    input_path: Path,
+    intermediates: StepCache | None,
+    keys: dict[str, str],
+) -> tuple[Frame, list[str]]:
+    """
+    Where job's steps start: the deepest cached intermediate of its chain (keys, see StepCache.keys),
+    else the decoded input through prepare (the denoised frame is stored). Returns the frame and
+    the steps it already includes.
+    """
+    chain = list(keys.items())
+    for depth in range(len(chain), 0, -1):
+        step, key = chain[depth - 1]
+        frame = intermediates.load(key)
+        if frame is not None:
+            logger.info("job_id=%s resuming after step %s", getattr(job, "id", None), step)
+            return frame, [s for s, _ in chain[:depth]]
+    frame = prepare(job, image.read(input_path))
+    if "denoise" in keys:
+        intermediates.save(keys["denoise"], frame)
+    return frame, []
+
+
+def upscale_label(job, strategy: str) -> str:
+    return f"Upscaling ({strategy} 2×)" if job.scale == 2 else "Upscaling"
+
+
+def upscale_end(job) -> int:
+    """Progress percent at which the upscale step ends (face enhance, if any, runs after it)."""
+    if getattr(job, "face_enhance", False):
+        return PROGRESS_START + (PROGRESS_END - PROGRESS_START) * 4 // 5
+    return PROGRESS_END
+
+
+def prepare(job, frame: Frame) -> Frame:
+    """Steps before the main one (denoise_first); returns the image the main step takes."""
     if getattr(job, "denoise_first", False):
-        denoise.run(current, step_out)
-        current = step_out
+        return denoise.run(frame)
+    return frame
 
-    if job.method == METHOD_BACKGROUND_REMOVE:
-        background_remove.run(current, output_path)
-        return
-
-    step_upscaled = work_dir / "upscaled.png"
-    tile = settings.real_esrgan_tile
-    if job.method == "real_esrgan":
-        real_esrgan.upscale(current, step_upscaled, scale=job.scale, tile=tile)
-    elif job.method == "esrgan":
-        esrgan.upscale(current, step_upscaled, scale=job.scale, tile=tile)
-    elif job.method == "real_esrgan_anime":
-        real_esrgan_anime.upscale(current, step_upscaled, scale=job.scale, tile=tile)
-    elif job.method == "swinir":
-        swinir.upscale(current, step_upscaled, scale=job.scale, tile=256)
-    else:
+
+def upscale(
+    job,
+    frame: Frame,
+    strategy: str,
+    on_tile: _tiling.OnTile | None = None,
+    stats: _tiling.TileStats | None = None,
+    checkpoint: TileCheckpoint | None = None,
+    spill_dir: Path | None = None,
+    plan: _tile_planner.TilePlan | None = None,
+) -> Frame:
+    """
+    Upscale step: job.method at job.scale with the planned tiles (also run per region, see tasks.split).
+    plan is one made already (step_keys), else the tiles are planned here. A checkpoint keeps the
+    first attempt's plan, so a resumed attempt tiles and batches identically.
+    The output is a memmap in spill_dir when large (or the checkpoint's canvas).
+    """
+    if job.method not in UPSCALE_METHODS:
         raise ValueError(f"Unknown method: {job.method}")
-    current = step_upscaled
+    checkpointed = checkpoint.load_plan() if checkpoint is not None else None
+    if checkpointed is None:
+        plan = plan or plan_tiles(job, frame, strategy)
+        if plan.tiles < settings.tile_checkpoint_min_tiles:
+            checkpoint = None  # cheaper to rerun than to write the canvas to disk
+        if checkpoint is not None:
+            checkpoint.save_plan(plan)
+    else:
+        plan = checkpointed
+        logger.info(
+            "job_id=%s resuming with checkpointed tile plan tile=%s batch=%s",
+            getattr(job, "id", None), plan.tile, plan.batch_size,
+        )
+    tiling = dict(
+        tile=plan.tile,
+        batch_size=plan.batch_size,
+        on_tile=on_tile,
+        strategy=strategy,
+        stats=stats,
+        checkpoint=checkpoint,
+        spill_dir=spill_dir,
+    )
+    return frame.with_pixels(UPSCALERS[job.method].upscale(frame.pixels, scale=job.scale, **tiling))
+
 
+def finish(
+    job,
+    frame: Frame,
+    progress: JobProgress | None,
+    start: int,
+    source: Frame | None = None,
+    stats: face_enhance.FaceStats | None = None,
+) -> Frame:
+    """
+    Steps after the upscale (face_enhance, reported from start to PROGRESS_END). source is the
+    upscale's input when still in memory (faces are detected on it rather than on frame).
+    """
     if getattr(job, "face_enhance", False):
-        face_enhance.run(current, output_path)
-    else:
-        shutil.copy2(current, output_path)
+        on_face = None
+        if progress:
+            on_face = progress.stage("Enhancing faces", start, PROGRESS_END, unit="face")
+        return face_enhance.run(frame, on_face=on_face, source=source, stats=stats)
+    return frame
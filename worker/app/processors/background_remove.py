@@ -1,22 +1,131 @@
-"""Remove background (rembg). Produces PNG with alpha."""
-import io
+"""
+Remove background (rembg). Produces BGRA with the mask as alpha.
+
+The rembg model's onnxruntime session is built once per worker child and kept in the model cache
+(settings.background_remove_model, threads as the other ONNX sessions: cpu_layout.onnx_threads /
+onnx_inter_op_threads). Segmentation runs on a copy of the image resized to the model's native
+input (320² for the u2net family, 1024² for isnet); the mask is resized back and applied to the
+full-resolution pixels, as rembg.remove does, without its PIL / PNG round trip. masks() takes
+several images and runs them through the session as one batch (see app.tasks.batch).
+"""
+import logging
 from pathlib import Path
+from typing import Any
+
+import cv2
+import numpy as np
+
+from app import cpu_layout
+from app.config import settings
+from app.image import Frame, color
+from app.upscalers._model_cache import model_cache
+
+logger = logging.getLogger(__name__)
+
+# rembg session name -> (native input side, normalisation std); every model uses the ImageNet mean
+MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+MODELS = {
+    "u2net": (320, IMAGENET_STD),
+    "u2netp": (320, IMAGENET_STD),
+    "u2net_human_seg": (320, IMAGENET_STD),
+    "silueta": (320, IMAGENET_STD),
+    "isnet-general-use": (1024, (1.0, 1.0, 1.0)),
+    "isnet-anime": (1024, (1.0, 1.0, 1.0)),
+}
+_warned: set[str] = set()
 
-from PIL import Image
 
+def resolve(model: str | None = None) -> str:
+    """model, else settings.background_remove_model; unknown names fall back to u2net (warned once)."""
+    model = model or settings.background_remove_model
+    if model in MODELS:
+        return model
+    if model not in _warned:
+        _warned.add(model)
+        logger.warning("unknown background remove model %r; using u2net", model)
+    return "u2net"
 
-def run(input_path: Path, output_path: Path) -> None:
-    """Remove background; write RGBA PNG to output_path."""
+
+def _session(model: str) -> Any:
+    """Cached onnxruntime session of a rembg model (downloaded to U2NET_HOME on first use)."""
     try:
-        from rembg import remove
+        import onnxruntime as ort
+        from rembg.sessions import sessions_class
     except ImportError as e:
         raise RuntimeError(
             "rembg not installed. Add rembg to worker requirements and rebuild."
         ) from e
 
-    with open(input_path, "rb") as f:
-        data = f.read()
-    out_data = remove(data)
-    img = Image.open(io.BytesIO(out_data))
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    img.save(output_path, "PNG")
+    session_class = next(c for c in sessions_class if c.name() == model)
+    intra, inter = cpu_layout.onnx_threads(), settings.onnx_inter_op_threads
+
+    def load() -> Any:
+        options = ort.SessionOptions()
+        if intra:
+            options.intra_op_num_threads = intra
+        if inter:
+            options.inter_op_num_threads = inter
+        # Positional providers: rembg < 2.0.63 (pinned in requirements.txt); later releases ignore them
+        return session_class(model, options, ["CPUExecutionProvider"]).inner_session
+
+    return model_cache.get(
+        ("rembg", model, intra, inter),
+        load,
+        size_of=lambda _: (Path(session_class.u2net_home()) / f"{model}.onnx").stat().st_size,
+    )
+
+
+def _input(img: np.ndarray, side: int, std: tuple[float, float, float]) -> np.ndarray:
+    """rembg BaseSession.normalize of an 8-bit BGR image: CHW float32 at side x side."""
+    small = cv2.cvtColor(cv2.resize(img, (side, side), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB)
+    x = small.astype(np.float32) / max(int(small.max()), 1)
+    x = (x - np.array(MEAN, np.float32)) / np.array(std, np.float32)
+    return x.transpose(2, 0, 1)
+
+
+def masks(images: list[np.ndarray], model: str | None = None) -> list[np.ndarray]:
+    """
+    Foreground masks (uint8, HW, full size) of 8-bit BGR images, segmented in one batched run
+    (one run per image when the model's graph has a fixed batch of 1).
+    """
+    model = resolve(model)
+    side, std = MODELS[model]
+    session = _session(model)
+    source = session.get_inputs()[0]
+    batch = np.stack([_input(img, side, std) for img in images])
+    if isinstance(source.shape[0], int) and source.shape[0] != len(images):
+        pred = np.concatenate([session.run(None, {source.name: batch[i:i + 1]})[0] for i in range(len(images))])
+    else:
+        pred = session.run(None, {source.name: batch})[0]
+    out = []
+    for img, p in zip(images, pred[:, 0]):
+        # Per-image min-max, as rembg's predict() on a single image
+        lo, hi = p.min(), p.max()
+        mask = ((p - lo) / max(hi - lo, 1e-12) * 255).astype(np.uint8)
+        out.append(cv2.resize(mask, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_LINEAR))
+    return out
+
+
+def cutout(img: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """
+    BGRA of an 8-bit BGR image and its mask: rembg's naive_cutout (PIL composite over transparent
+    black), so colour is scaled by the mask and alpha is the mask.
+    """
+    # PIL's integer blend, round(c * m / 255); at most 255 * 255 + 128 + 254, so uint16 holds it
+    t = img.astype(np.uint16) * mask[:, :, None]
+    t += 128
+    t += t >> 8
+    bgr = (t >> 8).astype(np.uint8)
+    return np.dstack([bgr, mask])
+
+
+def run_batch(frames: list[Frame], model: str | None = None) -> list[Frame]:
+    """Remove the background of several frames with one segmentation batch; BGRA out."""
+    images = [color(f.pixels) for f in frames]
+    return [f.with_pixels(cutout(img, m)) for f, img, m in zip(frames, images, masks(images, model))]
+
+
+def run(frame: Frame) -> Frame:
+    """Remove background; returns BGRA."""
+    return run_batch([frame])[0]
@@ -1,15 +1,127 @@
-"""Denoise image (OpenCV). Used as optional pre-step before upscale."""
-from pathlib import Path
+"""
+Denoise image (OpenCV). Used as optional pre-step before upscale.
+
+The image is cut into bands of rows that overlap by the filter's reach (non-local means: half the
+template plus half the search window), the bands run on a thread pool (OpenCV releases the GIL)
+and each band's own rows are copied into the output. Every output pixel sees exactly the input it
+would in one call on the whole image, so the result is identical to it and the overlaps need no
+blending. settings.denoise_method picks the filter: nlmeans (the reference) or bilateral (several
+times faster, softer on heavy noise). Compare: python scripts/benchmark.py denoise
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
 
 import cv2
+import numpy as np
+
+from app import cpu_layout
+from app.config import settings
+from app.image import Frame, color
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("nlmeans", "bilateral")
+# fastNlMeansDenoisingColored(src, dst, h, hForColorComponents, templateWindowSize, searchWindowSize)
+NLM_H = 6
+NLM_TEMPLATE = 7
+NLM_SEARCH = 21
+# bilateralFilter(src, d, sigmaColor, sigmaSpace)
+BILATERAL_D = 7
+BILATERAL_SIGMA_COLOR = 20
+BILATERAL_SIGMA_SPACE = 3
+# Bands per worker (uneven bands still finish together) and the smallest band worth a task
+BANDS_PER_WORKER = 2
+MIN_BAND_ROWS = 64
+_warned: set[str] = set()
+
+
+def _filter(method: str) -> tuple[Callable[[np.ndarray], np.ndarray], int]:
+    """(filter of an 8-bit BGR image, rows of input beyond a band that its output depends on)."""
+    if method == "bilateral":
+        return (
+            lambda img: cv2.bilateralFilter(img, BILATERAL_D, BILATERAL_SIGMA_COLOR, BILATERAL_SIGMA_SPACE),
+            BILATERAL_D // 2,
+        )
+    return (
+        lambda img: cv2.fastNlMeansDenoisingColored(img, None, NLM_H, NLM_H, NLM_TEMPLATE, NLM_SEARCH),
+        NLM_TEMPLATE // 2 + NLM_SEARCH // 2,
+    )
+
+
+def resolve(method: str | None = None) -> str:
+    """method, else settings.denoise_method; unknown names fall back to nlmeans (warned once)."""
+    method = method or settings.denoise_method
+    if method in METHODS:
+        return method
+    if method not in _warned:
+        _warned.add(method)
+        logger.warning("unknown denoise method %r; using nlmeans", method)
+    return "nlmeans"
+
+
+def bands(height: int, count: int, reach: int) -> list[tuple[int, int, int, int]]:
+    """count bands of rows as (y0, y1, a0, a1): output rows [y0, y1) from input rows [a0, a1)."""
+    count = max(1, min(count, height // MIN_BAND_ROWS))
+    edges = [height * i // count for i in range(count + 1)]
+    return [
+        (y0, y1, max(0, y0 - reach), min(height, y1 + reach))
+        for y0, y1 in zip(edges, edges[1:])
+    ]
+
+
+def _workers(workers: int | None = None) -> int:
+    return workers or settings.denoise_workers or cpu_layout.process_threads()
+
+
+def _band_count(workers: int) -> int:
+    return workers * BANDS_PER_WORKER if workers > 1 else 1
+
+
+def signature(method: str | None = None) -> str:
+    """
+    Everything denoise's output depends on besides the image (default method as in denoise): the
+    method and its filter parameters, e.g. for app.step_cache keys. Not the row bands: banded output
+    is identical to the whole-image filter, so keys agree across hosts and worker counts.
+    """
+    method = resolve(method)
+    if method == "bilateral":
+        params = f"d={BILATERAL_D},sigma_color={BILATERAL_SIGMA_COLOR},sigma_space={BILATERAL_SIGMA_SPACE}"
+    else:
+        params = f"h={NLM_H},template={NLM_TEMPLATE},search={NLM_SEARCH}"
+    return f"{method}:{params}"
+
+
+def denoise(img: np.ndarray, method: str | None = None, workers: int | None = None) -> np.ndarray:
+    """
+    Denoise an 8-bit BGR image with method (default settings.denoise_method) on workers threads
+    (default settings.denoise_workers, else this process's CPU share, see app.cpu_layout).
+    """
+    method = resolve(method)
+    workers = _workers(workers)
+    apply, reach = _filter(method)
+    parts = bands(img.shape[0], _band_count(workers), reach)
+    if len(parts) == 1:
+        return apply(img)
+    out = np.empty_like(img)
+
+    def run_band(part: tuple[int, int, int, int]) -> None:
+        y0, y1, a0, a1 = part
+        out[y0:y1] = apply(img[a0:a1])[y0 - a0:y1 - a0]
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="denoise") as pool:
+        # list() re-raises the first band error here
+        list(pool.map(run_band, parts))
+    return out
 
 
-def run(input_path: Path, output_path: Path) -> None:
-    """Reduce noise; write result to output_path."""
-    img = cv2.imread(str(input_path))
-    if img is None:
-        raise RuntimeError(f"Failed to read image: {input_path}")
-    # Positional args: src, dst, h, hForColorComponents, templateWindowSize, searchWindowSize
-    out = cv2.fastNlMeansDenoisingColored(img, None, 6, 6, 7, 21)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    cv2.imwrite(str(output_path), out)
+def run(frame: Frame) -> Frame:
+    """Reduce noise; 8-bit BGR out (alpha and 16-bit are not kept, as before the upscale)."""
+    start = time.monotonic()
+    method = resolve()
+    out = denoise(color(frame.pixels), method)
+    logger.info(
+        "denoise method=%s %sx%s in %.1fs", method, frame.width, frame.height, time.monotonic() - start
+    )
+    return frame.with_pixels(out)
@@ -1,18 +1,44 @@
-"""Face enhancement via GFPGAN. Optional post-step after upscale."""
+"""
+Face enhancement via GFPGAN. Optional post-step after upscale.
+
+The GFPGANer (restorer plus its RetinaFace detector and parsing net) is built once per worker
+process and kept in the model cache. Faces are detected on the pre-upscale image when the
+pipeline has it, else on the output, either way downscaled to at most
+settings.face_detect_max_megapixels, and the boxes and landmarks are mapped to output
+coordinates; an upscaled image has scale² the pixels of its input and no more faces. When
+nothing is found the restoration (alignment, GFPGAN, paste-back) is skipped entirely.
+"""
+import logging
+import sys
+import time
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Callable
 
 import cv2
+import numpy as np
 
+from app.config import settings
+from app.image import Frame, color
+from app.upscalers._model_cache import model_cache, torch_module_nbytes
+
+logger = logging.getLogger(__name__)
+
+# GFPGANer / FaceRestoreHelper defaults: RetinaFace score threshold, smallest eye distance (output px)
+DETECT_THRESHOLD = 0.97
+EYE_DIST_THRESHOLD = 5
 
-def run(input_path: Path, output_path: Path) -> None:
-    """Enhance faces in image; write result to output_path."""
-    try:
-        from gfpgan import GFPGANer
-        from basicsr.utils.download_util import load_file_from_url
-    except ImportError as e:
-        raise RuntimeError(
-            "GFPGAN not installed. Add gfpgan to worker requirements and rebuild."
-        ) from e
+
+@dataclass
+class FaceStats:
+    """What the face step did, for the job log (faces found, seconds in the step)."""
+
+    faces: int = 0
+    seconds: float = 0.0
+
+
+def _model_path() -> Path:
+    from basicsr.utils.download_util import load_file_from_url
 
     weights_dir = Path(__file__).resolve().parent.parent.parent / "weights"
     weights_dir.mkdir(parents=True, exist_ok=True)
@@ -24,12 +50,134 @@ def run(input_path: Path, output_path: Path) -> None:
             progress=True,
             file_name="GFPGANv1.4.pth",
         )
+    return model_path
+
+
+def _restorer():
+    """The process's GFPGANer, built on first use (see app.upscalers._model_cache)."""
+    try:
+        import torchvision.transforms.functional as _tv_functional
+
+        # basicsr (under gfpgan) imports the module torchvision renamed, as the upscalers patch it
+        sys.modules["torchvision.transforms.functional_tensor"] = _tv_functional
+        from gfpgan import GFPGANer
+    except ImportError as e:
+        raise RuntimeError(
+            "GFPGAN not installed. Add gfpgan to worker requirements and rebuild."
+        ) from e
+
+    model_path = _model_path()
+    return model_cache.get(
+        ("gfpgan", str(model_path)),
+        lambda: GFPGANer(model_path=str(model_path), upscale=1, arch="clean", channel_multiplier=2),
+        size_of=lambda r: sum(
+            torch_module_nbytes(m) for m in (r.gfpgan, r.face_helper.face_det, r.face_helper.face_parse)
+        ),
+    )
+
+
+def _detection_image(frame: Frame, source: Frame | None) -> np.ndarray:
+    """8-bit BGR image to detect on: source (else frame) scaled down to the detection budget."""
+    base = (source or frame).pixels
+    height, width = base.shape[:2]
+    factor = (settings.face_detect_max_megapixels * 1_000_000 / (width * height)) ** 0.5
+    if factor < 1:
+        size = (max(1, round(width * factor)), max(1, round(height * factor)))
+        base = cv2.resize(base, size, interpolation=cv2.INTER_AREA)
+    return color(base)
+
+
+def _detect(helper, small: np.ndarray, width: int, height: int) -> int:
+    """
+    FaceRestoreHelper.get_face_landmarks_5(eye_dist_threshold=EYE_DIST_THRESHOLD) with detection on
+    small and the boxes / landmarks mapped to width x height output coordinates. Returns the face count.
+    """
+    import torch
+
+    fx, fy = width / small.shape[1], height / small.shape[0]
+    with torch.no_grad():
+        bboxes = helper.face_det.detect_faces(small, DETECT_THRESHOLD)
+    for bbox in bboxes:
+        # Columns: x0, y0, x1, y1, score, then five (x, y) landmarks
+        bbox = np.array(bbox, dtype=np.float32)
+        bbox[0:4:2] *= fx
+        bbox[1:4:2] *= fy
+        bbox[5:15:2] *= fx
+        bbox[6:15:2] *= fy
+        # Side or tiny faces, as the helper drops them
+        if np.linalg.norm([bbox[5] - bbox[7], bbox[6] - bbox[8]]) < EYE_DIST_THRESHOLD:
+            continue
+        helper.all_landmarks_5.append(bbox[5:15].reshape(5, 2))
+        helper.det_faces.append(bbox[0:5])
+    return len(helper.det_faces)
+
+
+def _enhance(restorer, on_face: Callable[[int, int], None] | None) -> np.ndarray:
+    """
+    GFPGANer.enhance(has_aligned=False, only_center_face=False, paste_back=True) from the alignment
+    on, for the image and faces the helper already holds; unrolled so on_face(done, total) runs after each
+    restored face (progress / cancel between faces).
+    """
+    import torch
+    from basicsr.utils import img2tensor, tensor2img
+    from torchvision.transforms.functional import normalize
+
+    helper = restorer.face_helper
+    helper.align_warp_face()
+
+    total = len(helper.cropped_faces)
+    for i, cropped_face in enumerate(helper.cropped_faces, start=1):
+        face_t = img2tensor(cropped_face / 255.0, bgr2rgb=True, float32=True)
+        normalize(face_t, (0.5, 0.5, 0.5), (0.5, 0.5, 0.5), inplace=True)
+        face_t = face_t.unsqueeze(0).to(restorer.device)
+        try:
+            with torch.no_grad():
+                output = restorer.gfpgan(face_t, return_rgb=False, weight=0.5)[0]
+            restored_face = tensor2img(output.squeeze(0), rgb2bgr=True, min_max=(-1, 1))
+        except RuntimeError:
+            # Same fallback as GFPGANer: keep the original crop for this face
+            restored_face = cropped_face
+        helper.add_restored_face(restored_face.astype("uint8"))
+        if on_face is not None:
+            on_face(i, total)
+
+    helper.get_inverse_affine(None)
+    return helper.paste_faces_to_input_image(upsample_img=None)
+
+
+def run(
+    frame: Frame,
+    on_face: Callable[[int, int], None] | None = None,
+    source: Frame | None = None,
+    stats: FaceStats | None = None,
+) -> Frame:
+    """
+    Enhance faces; 8-bit BGR out. on_face(done, total) is called per face. source is the image
+    frame was upscaled from (faces are detected on it); without it they are detected on frame.
+    """
+    start = time.monotonic()
+    restorer = _restorer()
+    helper = restorer.face_helper
+    helper.clean_all()
+    try:
+        faces = _detect(helper, _detection_image(frame, source), frame.width, frame.height)
+        if faces:
+            helper.read_image(color(frame.pixels))
+            out = _enhance(restorer, on_face)
+        else:
+            out = color(frame.pixels)
+    finally:
+        # Don't keep this job's image and crops alive in the cached helper
+        helper.clean_all()
+        helper.input_img = None
+    seconds = time.monotonic() - start
+    if stats is not None:
+        stats.faces = faces
+        stats.seconds = seconds
+    logger.info("face_enhance %sx%s faces=%s in %.1fs", frame.width, frame.height, faces, seconds)
+    return frame.with_pixels(out)
 
-    restorer = GFPGANer(model_path=str(model_path), upscale=1, arch="clean", channel_multiplier=2)
-    img = cv2.imread(str(input_path), cv2.IMREAD_COLOR)
-    if img is None:
-        raise RuntimeError(f"Failed to read image: {input_path}")
 
-    _, _, output = restorer.enhance(img, has_aligned=False, only_center_face=False, paste_back=True)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    cv2.imwrite(str(output_path), output)
+def warmup(scale: int = 4) -> None:
+    """Load the restorer into the model cache (scale is unused; one model serves every scale)."""
+    _restorer()
@@ -0,0 +1,72 @@
+"""
+Job progress and cooperative cancellation for the long inference steps.
+The tiled loops call an on_tile(done, total) callback between tiles; JobProgress turns that into
+throttled progress updates and raises JobCancelled as soon as the backend has set the job's
+cancel flag in Redis, so a cancelled job stops within one tile and the worker child survives.
+"""
+import logging
+import time
+from typing import Callable
+
+import redis
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Must match backend app.core.celery_client.CANCEL_KEY
+CANCEL_KEY = "job:{job_id}:cancel"
+# Must match backend app.core.celery_client.SUBTASKS_KEY; region task ids of a split job
+SUBTASKS_KEY = "job:{job_id}:subtasks"
+
+# report(progress_percent, status_detail)
+Report = Callable[[int, str], None]
+
+_redis: redis.Redis | None = None
+
+
+def redis_client() -> redis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = redis.from_url(settings.redis_url)
+    return _redis
+
+
+class JobCancelled(Exception):
+    """Raised from inside a pipeline step when the job's cancel flag is set."""
+
+
+class JobProgress:
+    """Per-job progress reporter and cancel check; stage() returns an on_tile callback for one step."""
+
+    def __init__(self, job_id: str, report: Report, interval: float | None = None) -> None:
+        self.job_id = job_id
+        self.report = report
+        self.interval = settings.progress_interval_seconds if interval is None else interval
+        self._last_report = 0.0
+
+    def cancelled(self) -> bool:
+        """True once the backend has flagged this job (one Redis EXISTS; errors count as not cancelled)."""
+        try:
+            return bool(redis_client().exists(CANCEL_KEY.format(job_id=self.job_id)))
+        except redis.RedisError as e:
+            logger.warning("job_id=%s cancel flag check failed: %s", self.job_id, e)
+            return False
+
+    def check(self) -> None:
+        if self.cancelled():
+            raise JobCancelled(f"Job {self.job_id} cancelled")
+
+    def stage(self, label: str, start: int, end: int, unit: str = "tile") -> Callable[[int, int], None]:
+        """Callback mapping units (tiles, faces) done/total of one step onto progress start..end."""
+
+        def on_tile(done: int, total: int) -> None:
+            self.check()
+            now = time.monotonic()
+            if now - self._last_report < self.interval and done < total:
+                return
+            self._last_report = now
+            pct = start + (end - start) * done // max(total, 1)
+            self.report(pct, f"{label} — {unit} {done}/{total}")
+
+        return on_tile
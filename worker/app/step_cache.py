@@ -0,0 +1,163 @@
+"""
+Step intermediates shared between jobs on the same image (settings.step_cache_ttl_seconds, off by
+default), so re-running an upscale with face_enhance, or another output format, starts from the
+stored upscale instead of the model. An intermediate is named by the chain that made it:
+
+  denoise   sha256(input file) / denoise:<denoise.signature>
+  upscale   <denoise key, else input hash> / upscale:<method>:<scale>:<strategy>:<tiling>:<model>:<settings>
+
+(<tiling>: the job's resolved tile plan, see tiling, or its split layout; <model>: weights, backend,
+precision, device and alpha strategy, see pipeline.model_identity; <settings>: UPSCALE_SETTINGS).
+Post-denoise and post-upscale frames are stored as lossless PNG (app.encode, level 1: 16-bit and
+alpha kept) under STEPS_PREFIX, and indexed in the Redis sorted set INDEX_KEY scored by expiry
+time: a key past its score is a miss, and cleanup_expired_task deletes its object (sweep).
+pipeline.resume takes the deepest intermediate of a job's chain that is still there. Every failure
+here (Redis or storage down) only means the step runs again.
+"""
+import hashlib
+import logging
+import time
+from pathlib import Path
+
+import redis
+
+from app import encode, image
+from app.config import settings
+from app.image import Frame
+from app.processors import denoise
+from app.progress import redis_client
+from app.upscalers._tile_planner import TilePlan
+
+logger = logging.getLogger(__name__)
+
+STEPS_PREFIX = "steps/"
+INDEX_KEY = "steps:expiry"
+# Tile-skip settings, which change the upscale output of flat and repeated tiles
+UPSCALE_SETTINGS = (
+    "tile_skip",
+    "tile_skip_flat_range",
+    "tile_skip_reuse",
+    "tile_skip_blend_px",
+)
+
+
+def digest(path: Path) -> str:
+    """sha256 of a file."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def tiling(plan: TilePlan) -> str:
+    """The <tiling> of an upscale key run with plan."""
+    return f"tile={plan.tile},batch={plan.batch_size}"
+
+
+def _link(parent: str, step: str) -> str:
+    return hashlib.sha256(f"{parent}/{step}".encode()).hexdigest()
+
+
+def _object_key(key: str) -> str:
+    return f"{STEPS_PREFIX}{key}.png"
+
+
+class StepCache:
+    """Intermediates of one job's input, in storage."""
+
+    def __init__(self, input_hash: str, storage, directory: Path) -> None:
+        self.input_hash = input_hash
+        self.storage = storage
+        # Scratch dir for the PNGs on their way to and from storage (the job's temp dir)
+        self.directory = directory
+
+    @classmethod
+    def for_input(cls, input_path: Path, storage) -> "StepCache | None":
+        """Cache of the image at input_path (scratch files next to it); None when disabled."""
+        if settings.step_cache_ttl_seconds <= 0:
+            return None
+        return cls(digest(input_path), storage, input_path.parent)
+
+    def keys(self, job, strategy: str | None = None, tiling: str = "", model: str = "") -> dict[str, str]:
+        """
+        Key of each stored step of job's chain, denoise then upscale. The upscale key needs strategy
+        (from _scale_strategy), tiling and model (see the module docstring).
+        """
+        keys = {}
+        parent = self.input_hash
+        if getattr(job, "denoise_first", False):
+            parent = keys["denoise"] = _link(parent, f"denoise:{denoise.signature()}")
+        if strategy is not None:
+            config = ",".join(f"{name}={getattr(settings, name)}" for name in UPSCALE_SETTINGS)
+            keys["upscale"] = _link(
+                parent, f"upscale:{job.method}:{job.scale}:{strategy}:{tiling}:{model}:{config}"
+            )
+        return keys
+
+    def cached(self, key: str) -> bool:
+        """True while key's intermediate is stored and unexpired."""
+        try:
+            score = redis_client().zscore(INDEX_KEY, key)
+        except redis.RedisError as e:
+            logger.warning("step cache index unavailable: %s", e)
+            return False
+        return score is not None and score > time.time()
+
+    def load(self, key: str) -> Frame | None:
+        """The intermediate stored under key, or None."""
+        if not self.cached(key):
+            return None
+        return load(self.storage, key, self.directory)
+
+    def save(self, key: str, frame: Frame) -> None:
+        """Store frame under key (see save)."""
+        save(self.storage, key, frame, self.directory)
+
+
+def load(storage, key: str, directory: Path) -> Frame | None:
+    """Download and decode the intermediate stored under key (via directory), or None."""
+    path = directory / f"step-{key}.png"
+    try:
+        storage.get_to_file(_object_key(key), path)
+        return image.read(path)
+    except Exception as e:
+        logger.warning("step %s not loaded: %s", key[:12], e)
+        return None
+    finally:
+        path.unlink(missing_ok=True)
+
+
+def save(storage, key: str, frame: Frame, directory: Path) -> None:
+    """Store frame under key (encoded in directory) for settings.step_cache_ttl_seconds."""
+    start = time.monotonic()
+    path = directory / f"step-{key}.png"
+    try:
+        encode.write_png(frame.pixels, path, 1)
+        with open(path, "rb") as f:
+            storage.put(_object_key(key), f, "image/png")
+        redis_client().zadd(INDEX_KEY, {key: time.time() + settings.step_cache_ttl_seconds})
+    except Exception as e:
+        logger.warning("step %s not stored: %s", key[:12], e)
+        return
+    finally:
+        path.unlink(missing_ok=True)
+    logger.info("stored step %s %sx%s in %.1fs", key[:12], frame.width, frame.height, time.monotonic() - start)
+
+
+def sweep(storage) -> int:
+    """Delete the intermediates whose TTL has passed; returns how many."""
+    client = redis_client()
+    expired = [k.decode() for k in client.zrangebyscore(INDEX_KEY, 0, time.time())]
+    swept = 0
+    for key in expired:
+        if (client.zscore(INDEX_KEY, key) or 0) > time.time():
+            continue  # a job stored it again meanwhile
+        try:
+            storage.delete(_object_key(key))
+        except Exception as e:
+            logger.warning("deleting step %s failed: %s", key[:12], e)
+            continue
+        client.zrem(INDEX_KEY, key)
+        swept += 1
+    return swept
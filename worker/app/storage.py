@@ -1,3 +1,4 @@
+import shutil
 from pathlib import Path
 from typing import BinaryIO
 
@@ -47,9 +48,13 @@ class LocalStorageBackend:
         if p.exists():
             p.unlink()
 
+    def delete_prefix(self, prefix: str) -> None:
+        """Delete every key under prefix (a "dir/" prefix; used for per-job intermediates)."""
+        shutil.rmtree(self._path(prefix), ignore_errors=True)
+
 
 class S3StorageBackend:
-    """S3 (or MinIO) backend for worker: put, get_to_file, delete."""
+    """S3 (or MinIO) backend for worker: put, get_to_file, delete, delete_prefix."""
 
     def __init__(self) -> None:
         self._client = _s3_client()
@@ -66,6 +71,13 @@ class S3StorageBackend:
     def delete(self, key: str) -> None:
         self._client.delete_object(Bucket=self._bucket, Key=key)
 
+    def delete_prefix(self, prefix: str) -> None:
+        paginator = self._client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self._bucket, Prefix=prefix):
+            keys = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+            if keys:
+                self._client.delete_objects(Bucket=self._bucket, Delete={"Objects": keys})
+
 
 def get_storage() -> LocalStorageBackend | S3StorageBackend:
     if settings.use_local_storage:
@@ -1,5 +1,6 @@
 from app.tasks.cleanup import fail_stale_processing_task  # noqa: F401 - beat schedule
 from app.tasks.upscale import upscale_task
 from app.tasks.cleanup import cleanup_expired_task
+from app.tasks.split import stitch_regions_task, upscale_region_task  # noqa: F401 - split jobs
 
 __all__ = ["upscale_task", "cleanup_expired_task"]
@@ -0,0 +1,152 @@
+"""
+Batched background removal. The backend enqueues every background-remove job of one upload with
+the upload's job ids (upscale_task's batch argument). The first of those tasks to run claims up to
+settings.background_remove_batch_size - 1 of the others that are still queued, runs each job's own
+steps before segmentation (pipeline.prepare, e.g. denoise_first), segments all the images in one
+batched inference (app.processors.background_remove) and uploads each result; the claimed jobs'
+own tasks then find them no longer queued and skip. Each job keeps its own status, cancel and
+failure. If the child dies mid-batch, the claimed jobs are marked interrupted with the
+task's own job (see upscale._ResumableRequest) and the redelivered task claims them again.
+"""
+import logging
+from datetime import datetime
+from pathlib import Path
+from uuid import UUID
+
+import redis
+from sqlalchemy import select, update
+
+from app import encode, image
+from app.config import settings
+from app.db import get_db
+from app.models.job import Job
+from app.pipeline import METHOD_BACKGROUND_REMOVE, prepare
+from app.processors import background_remove
+from app.progress import redis_client
+from app.tasks.upscale import (
+    JOB_STATUS_INTERRUPTED,
+    JOB_STATUS_PROCESSING,
+    JOB_STATUS_QUEUED,
+    _fail_job,
+    _upload_result,
+)
+
+logger = logging.getLogger(__name__)
+
+# Jobs a task claimed from its batch, so a child that dies takes them down with its own job
+CLAIMED_KEY = "job:{job_id}:claimed"
+KEY_TTL_SECONDS = 24 * 3600
+
+
+def claimed(job_id: str) -> list[str]:
+    """Jobs the task of job_id claimed and has not finished ([] when Redis is unavailable)."""
+    try:
+        return [j.decode() for j in redis_client().lrange(CLAIMED_KEY.format(job_id=job_id), 0, -1)]
+    except redis.RedisError as e:
+        logger.warning("job_id=%s reading claimed jobs failed: %s", job_id, e)
+        return []
+
+
+def _claim(job_id: str, batch: list[str]) -> list[Job]:
+    """Mark up to batch_size - 1 queued (or interrupted) background-remove jobs of batch processing."""
+    others = [UUID(j) for j in batch if j != job_id]
+    limit = settings.background_remove_batch_size - 1
+    if not others or limit < 1:
+        return []
+    claimable = (JOB_STATUS_QUEUED, JOB_STATUS_INTERRUPTED)
+    db = get_db()
+    try:
+        candidates = db.execute(
+            select(Job.id)
+            .where(Job.id.in_(others), Job.method == METHOD_BACKGROUND_REMOVE, Job.status.in_(claimable))
+            .order_by(Job.created_at)
+            .limit(limit)
+        ).scalars().all()
+        if not candidates:
+            return []
+        # The status guard makes the claim atomic: a job another task claimed (or cancelled) meanwhile stays out
+        ids = db.execute(
+            update(Job)
+            .where(Job.id.in_(candidates), Job.status.in_(claimable))
+            .values(
+                status=JOB_STATUS_PROCESSING,
+                started_at=datetime.utcnow(),
+                status_detail="Running Background remove…",
+                progress=50,
+            )
+            .returning(Job.id)
+        ).scalars().all()
+        db.commit()
+        if not ids:
+            return []
+        jobs = db.execute(select(Job).where(Job.id.in_(ids)).order_by(Job.created_at)).scalars().all()
+        db.expunge_all()
+        return list(jobs)
+    finally:
+        db.close()
+
+
+def run(job, input_path: Path, tmp: Path, batch: list[str], storage) -> None:
+    """
+    Remove the background of job (input already at input_path) together with the jobs it claims
+    from batch, and upload every result. Errors of the job itself propagate to upscale_task.
+    """
+    job_id = str(job.id)
+    others = _claim(job_id, batch)
+    key = CLAIMED_KEY.format(job_id=job_id)
+    if others:
+        try:
+            client = redis_client()
+            client.rpush(key, *[str(o.id) for o in others])
+            client.expire(key, KEY_TTL_SECONDS)
+        except redis.RedisError as e:
+            logger.warning("job_id=%s recording claimed jobs failed: %s", job_id, e)
+    try:
+        ids = [job_id]
+        frames = [prepare(job, image.read(input_path))]
+        for other in others:
+            other_id = str(other.id)
+            try:
+                path = tmp / f"input-{other_id}"
+                storage.get_to_file(other.original_key, path)
+                width, height = image.probe(path)
+                if width * height / 1_000_000 > settings.max_megapixels:
+                    raise ValueError(f"Image exceeds {settings.max_megapixels} megapixels")
+                frames.append(prepare(other, image.read(path)))
+                ids.append(other_id)
+            except Exception as e:
+                logger.exception("job_id=%s batched with %s failed: %s", other_id, job_id, e)
+                _fail_job(other_id, e)
+
+        try:
+            results = background_remove.run_batch(frames)
+        except Exception as e:
+            for other_id in ids[1:]:
+                _fail_job(other_id, e)
+            raise
+        del frames
+        logger.info(
+            "job_id=%s background remove batch=%s model=%s", job_id, len(ids), background_remove.resolve()
+        )
+
+        # The task's own job last: its errors propagate, the others' are theirs alone
+        for result_id, result in reversed(list(zip(ids, results))):
+            output_path = tmp / f"output-{result_id}"
+            encoded = encode.EncodeStats()
+            if result_id == job_id:
+                encode.write(result, output_path, encode.Encoding.for_job(job), encoded)
+                _upload_result(job_id, output_path, storage, encoded)
+                continue
+            try:
+                other = next(o for o in others if str(o.id) == result_id)
+                encode.write(result, output_path, encode.Encoding.for_job(other), encoded)
+                _upload_result(result_id, output_path, storage, encoded)
+            except Exception as e:
+                logger.exception("job_id=%s batched with %s failed: %s", result_id, job_id, e)
+                _fail_job(result_id, e)
+    finally:
+        if others:
+            try:
+                redis_client().delete(key)
+            except redis.RedisError as e:
+                logger.warning("job_id=%s deleting claimed jobs failed: %s", job_id, e)
@@ -1,46 +1,128 @@
+import logging
 from datetime import datetime, timedelta
-from sqlalchemy import select, delete
 
+import redis
+from celery.result import AsyncResult
+from sqlalchemy import delete, func, select
+
+from app import step_cache
 from app.celery_app import celery_app
+from app.config import settings
 from app.db import get_db
 from app.models.job import Job
+from app.progress import SUBTASKS_KEY, redis_client
 from app.storage import get_storage
+from app.tasks import batch
+from app.tasks.split import STITCH_KEY, intermediates_prefix
+from app.upscalers import _checkpoint
+
+logger = logging.getLogger(__name__)
 
-# Jobs stuck in "processing" longer than this are marked failed (worker likely OOM-killed)
+# Jobs that started this long ago and whose task no worker is running are marked failed (worker
+# likely OOM-killed), or interrupted when they saved a tile checkpoint: the broker redelivers their
+# task after task_visibility_timeout_seconds and it resumes from there
 STALE_PROCESSING_MINUTES = 30
+# Seconds to wait for workers' replies to inspect()
+INSPECT_TIMEOUT_SECONDS = 5.0
+
+
+def _live_task_ids() -> set[str] | None:
+    """Ids of the tasks workers are running or hold reserved; None when the broker could not be asked."""
+    try:
+        inspector = celery_app.control.inspect(timeout=INSPECT_TIMEOUT_SECONDS)
+        replies = [inspector.active(), inspector.reserved()]
+    except Exception as e:
+        logger.warning("inspecting workers failed: %s", e)
+        return None
+    return {task["id"] for reply in replies if reply for tasks in reply.values() for task in tasks}
+
+
+def _alive(job, live: set[str], claimed_by_live: set[str]) -> bool:
+    """
+    Whether job's work is still going on: its task (or one that claimed it into a batch) is on a
+    worker, or it is a split job whose region / stitch tasks have not all finished (queued in the
+    broker, running, or awaiting redelivery: the chord owns it).
+    """
+    job_id = str(job.id)
+    if job.celery_task_id in live or job_id in claimed_by_live:
+        return True
+    client = redis_client()
+    subtasks = [t.decode() for t in client.lrange(SUBTASKS_KEY.format(job_id=job_id), 0, -1)]
+    stitch = client.get(STITCH_KEY.format(job_id=job_id))
+    if stitch is not None:
+        subtasks.append(stitch.decode())
+    return any(t in live or not AsyncResult(t, app=celery_app).ready() for t in subtasks)
 
 
 @celery_app.task
 def fail_stale_processing_task() -> None:
-    """Mark jobs stuck in 'processing' for too long as failed (e.g. after worker OOM)."""
+    """
+    Mark jobs that started over STALE_PROCESSING_MINUTES ago and are no longer running anywhere
+    failed (or interrupted, see above), and interrupted jobs never redelivered failed.
+    """
+    live = _live_task_ids()
+    if live is None:
+        return
     db = get_db()
     try:
-        cutoff = datetime.utcnow() - timedelta(minutes=STALE_PROCESSING_MINUTES)
+        now = datetime.utcnow()
+        cutoff = now - timedelta(minutes=STALE_PROCESSING_MINUTES)
+        redelivery_cutoff = cutoff - timedelta(seconds=settings.task_visibility_timeout_seconds)
+        started = func.coalesce(Job.started_at, Job.created_at)
         result = db.execute(
             select(Job).where(
-                Job.status == "processing",
-                Job.created_at < cutoff,
+                ((Job.status == "processing") & (started < cutoff))
+                | ((Job.status == "interrupted") & (started < redelivery_cutoff))
             )
         )
         jobs = list(result.scalars().all())
         if not jobs:
             return
+        claimed_by_live = {
+            claimed_id
+            for job in jobs
+            if job.status == "processing" and job.celery_task_id in live
+            for claimed_id in batch.claimed(str(job.id))
+        }
         msg = (
             "Processing timed out. The worker may have run out of memory—try a smaller image or increase Docker memory."
         )
-        now = datetime.utcnow()
         for job in jobs:
+            if job.status == "processing":
+                try:
+                    if _alive(job, live, claimed_by_live):
+                        continue
+                except redis.RedisError as e:
+                    logger.warning("job_id=%s split task state unavailable: %s", job.id, e)
+                    continue
+                if _checkpoint.resumable(str(job.id)):
+                    job.status = "interrupted"
+                    job.status_detail = "Worker stopped — resumes from checkpoint when redelivered…"
+                    continue
             job.status = "failed"
             job.error_message = msg
             job.status_detail = None
             job.finished_at = now
+            _checkpoint.discard(str(job.id))
         db.commit()
     finally:
         db.close()
 
 
+def _sweep_steps() -> None:
+    """Delete step intermediates past their TTL (app.step_cache); they belong to no job."""
+    try:
+        swept = step_cache.sweep(get_storage())
+    except redis.RedisError as e:
+        logger.warning("step cache sweep failed: %s", e)
+        return
+    if swept:
+        logger.info("deleted %s expired step intermediates", swept)
+
+
 @celery_app.task
 def cleanup_expired_task() -> None:
+    _sweep_steps()
     db = get_db()
     try:
         result = db.execute(
@@ -60,6 +142,17 @@ def cleanup_expired_task() -> None:
                     storage.delete(job.result_key)
                 except Exception:
                     pass
+            for variant in job.variants or []:
+                if variant.get("result_key"):
+                    try:
+                        storage.delete(variant["result_key"])
+                    except Exception:
+                        pass
+            try:
+                storage.delete_prefix(intermediates_prefix(str(job.id)))
+            except Exception:
+                pass
+            _checkpoint.discard(str(job.id))
         if jobs:
             db.execute(delete(Job).where(Job.id.in_([j.id for j in jobs])))
         db.commit()
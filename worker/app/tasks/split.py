@@ -0,0 +1,330 @@
+"""
+Split execution for very large upscale jobs (settings.split_min_megapixels): upscale_task cuts
+the (denoised) input into overlapping regions (app.upscalers._regions), stores them under
+intermediates/<job_id>/ and dispatches a chord: one upscale_region_task per region, picked up by
+any worker, then stitch_regions_task, which blends the region outputs, runs face enhance and
+uploads the result. Job progress is the sum of the regions' tile progress; cancelling the job
+revokes the region tasks (backend request_cancel reads SUBTASKS_KEY) and running regions stop
+at the next tile like a normal job; a region that fails fails the job and stops its siblings the
+same way. Region and stitch tasks are acknowledged late like
+upscale_task: a region whose child died is redelivered and resumes from its own tile checkpoint.
+"""
+import hashlib
+import io
+import json
+import logging
+import tempfile
+import uuid
+from pathlib import Path
+
+import cv2
+import redis
+from celery import chord, group
+
+from app import encode, image, pipeline, step_cache
+from app.celery_app import celery_app
+from app.config import settings
+from app.processors import face_enhance
+from app.progress import CANCEL_KEY, SUBTASKS_KEY, JobCancelled, JobProgress, redis_client
+from app.step_cache import StepCache
+from app.storage import get_storage
+from app.tasks.upscale import (
+    JOB_STATUS_PROCESSING,
+    TOO_MANY_ATTEMPTS,
+    _fail_job,
+    count_attempt,
+    _get_job,
+    _record,
+    _update_job_progress,
+    _upload_result,
+)
+from app.upscalers import _checkpoint, _regions, _scale_strategy, _tile_planner, _tiling
+from app.upscalers._model_cache import model_cache
+
+logger = logging.getLogger(__name__)
+
+# Per-region progress (permille) of a split job, summed into the job's progress
+REGIONS_KEY = "job:{job_id}:regions"
+# Task id of a split job's chord callback, so the stale-job check can tell whether it is still to run
+STITCH_KEY = "job:{job_id}:stitch"
+KEY_TTL_SECONDS = 24 * 3600
+REGION_DONE = 1000
+
+
+def intermediates_prefix(job_id: str) -> str:
+    """Storage prefix of a split job's region images (also dropped when the job expires)."""
+    return f"intermediates/{job_id}/"
+
+
+def _region_key(job_id: str, index: int, kind: str) -> str:
+    return f"{intermediates_prefix(job_id)}region-{index}-{kind}.png"
+
+
+def _step_keys(job, intermediates: StepCache | None, strategy: str) -> dict[str, str]:
+    """
+    pipeline.step_keys for a split job: each region plans its own tiles on the worker that runs it,
+    so the upscale key names the region layout and what the planner plans from instead of one plan.
+    """
+    if intermediates is None:
+        return {}
+    calibration = json.dumps(_tile_planner.load_calibration(), sort_keys=True).encode()
+    tiling = (
+        f"regions={settings.split_region_megapixels}mp,overlap={settings.split_overlap_px},"
+        f"auto={settings.tile_auto},tile={settings.real_esrgan_tile},batch={settings.tile_batch_size},"
+        f"budget={settings.tile_memory_budget_mb},calibration={hashlib.sha256(calibration).hexdigest()[:16]}"
+    )
+    return intermediates.keys(job, strategy, tiling, pipeline.model_identity(job, strategy))
+
+
+def should_split(job, input_path: Path, intermediates: StepCache | None = None) -> bool:
+    """
+    True for an upscale job whose input is at least split_min_megapixels (header-only read), unless
+    its upscale is already stored in intermediates (then the job runs in-process from there).
+    """
+    if not settings.split_min_megapixels or job.method not in pipeline.UPSCALE_METHODS:
+        return False
+    width, height = image.probe(input_path)
+    if width * height / 1_000_000 < settings.split_min_megapixels:
+        return False
+    if intermediates is not None:
+        keys = _step_keys(job, intermediates, _scale_strategy.resolve(job.method, job.scale))
+        return not intermediates.cached(keys["upscale"])
+    return True
+
+
+def dispatch(job, input_path: Path, intermediates: StepCache | None = None) -> None:
+    """
+    Run the steps before the upscale (or take them from intermediates), upload the regions and send
+    the chord; returns at once. The stitched upscale is stored in intermediates' storage.
+    """
+    job_id = str(job.id)
+    strategy = _scale_strategy.resolve(job.method, job.scale)
+    keys = _step_keys(job, intermediates, strategy)
+    step_key = keys.pop("upscale", None)
+    frame, reused = pipeline.resume(job, input_path, intermediates, keys)
+    if reused:
+        _record(job_id, steps_reused=",".join(reused))
+    img = frame.pixels
+    del frame
+    height, width = img.shape[:2]
+    regions = _regions.plan(height, width, settings.split_region_megapixels, settings.split_overlap_px)
+
+    storage = get_storage()
+    for region in regions:
+        ok, buf = cv2.imencode(".png", _regions.crop(img, region))
+        if not ok:
+            raise RuntimeError(f"Failed to encode region {region.index}")
+        storage.put(_region_key(job_id, region.index, "in"), io.BytesIO(buf.tobytes()), "image/png")
+    del img
+
+    layout = [r.to_dict() for r in regions]
+    task_ids = [str(uuid.uuid4()) for _ in layout]
+    header = group(
+        upscale_region_task.s(job_id, r, len(layout), strategy).set(task_id=task_id)
+        for r, task_id in zip(layout, task_ids)
+    )
+    stitch_id = str(uuid.uuid4())
+    callback = stitch_regions_task.s(job_id, layout, height, width, step_key).set(task_id=stitch_id).on_error(
+        stitch_failed.s(job_id=job_id)
+    )
+    # Record the region task ids before sending, so a cancel from now on revokes all of them
+    client = redis_client()
+    key = SUBTASKS_KEY.format(job_id=job_id)
+    client.rpush(key, *task_ids)
+    client.expire(key, KEY_TTL_SECONDS)
+    client.set(STITCH_KEY.format(job_id=job_id), stitch_id, ex=KEY_TTL_SECONDS)
+    _update_job_progress(job_id, pipeline.PROGRESS_START, f"Upscaling — region 0/{len(regions)}")
+    chord(header)(callback)
+    logger.info(
+        "job_id=%s split %sx%s into regions=%s (%sx%s grid) strategy=%s",
+        job_id, width, height, len(regions),
+        regions[-1].row + 1, regions[-1].col + 1, strategy,
+    )
+
+
+def _region_progress(job_id: str, index: int, count: int, label: str, end: int):
+    """report(permille, detail) for one region: stores its share and writes the summed job progress."""
+
+    def report(permille: int, detail: str) -> None:
+        key = REGIONS_KEY.format(job_id=job_id)
+        try:
+            client = redis_client()
+            client.hset(key, str(index), permille)
+            client.expire(key, KEY_TTL_SECONDS)
+            values = [int(v) for v in client.hvals(key)]
+        except redis.RedisError as e:
+            logger.warning("job_id=%s region progress update failed: %s", job_id, e)
+            return
+        done = sum(v >= REGION_DONE for v in values)
+        pct = pipeline.PROGRESS_START + (end - pipeline.PROGRESS_START) * sum(values) // (REGION_DONE * count)
+        _update_job_progress(job_id, pct, f"{label} — region {done}/{count}")
+
+    return report
+
+
+@celery_app.task(name="app.tasks.split.upscale_region_task", acks_late=True, reject_on_worker_lost=True)
+def upscale_region_task(job_id: str, region: dict, count: int, strategy: str) -> dict:
+    """Upscale one region of a split job; always returns (the chord callback checks the results)."""
+    index = region["index"]
+    job = _get_job(job_id)
+    if not job or job.status != JOB_STATUS_PROCESSING:
+        logger.info("job_id=%s region %s skipped (job no longer processing)", job_id, index)
+        return {"index": index, "skipped": True}
+    part = f"region-{index}"
+    attempt = count_attempt(f"{job_id}:{part}")
+    if attempt > settings.max_job_attempts:
+        logger.warning("job_id=%s region %s interrupted %s times, giving up", job_id, index, attempt - 1)
+        _fail_job(job_id, RuntimeError(TOO_MANY_ATTEMPTS.format(n=attempt - 1)))
+        _stop_regions(job_id)
+        return {"index": index, "error": "too many attempts"}
+    label = pipeline.upscale_label(job, strategy)
+    report = _region_progress(job_id, index, count, label, pipeline.upscale_end(job))
+    progress = JobProgress(job_id, report=report)
+    storage = get_storage()
+    try:
+        progress.check()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+            input_path = tmp / "input.png"
+            output_path = tmp / "output.png"
+            storage.get_to_file(_region_key(job_id, index, "in"), input_path)
+            stats = _tiling.TileStats()
+            out = pipeline.upscale(
+                job,
+                image.read(input_path),
+                strategy,
+                on_tile=progress.stage(label, 0, REGION_DONE),
+                stats=stats,
+                checkpoint=_checkpoint.TileCheckpoint.for_job(job_id, part),
+                spill_dir=tmp,
+            )
+            image.write(out, output_path)
+            del out
+            with open(output_path, "rb") as f:
+                storage.put(_region_key(job_id, index, "out"), f, "image/png")
+        report(REGION_DONE, "")
+        logger.info(
+            "job_id=%s region %s done%s, model cache %s",
+            job_id, index, f" alpha={stats.alpha}" if stats.alpha else "", model_cache.stats(),
+        )
+        return {"index": index, "tiles": stats.tiles, "tiles_flat": stats.flat, "tiles_reused": stats.reused}
+    except JobCancelled:
+        logger.info("job_id=%s region %s cancelled during processing, stopped early", job_id, index)
+        return {"index": index, "cancelled": True}
+    except Exception as e:
+        logger.exception("job_id=%s region %s failed: %s", job_id, index, e)
+        _fail_job(job_id, e)
+        _stop_regions(job_id)
+        return {"index": index, "error": str(e)}
+
+
+def _cleanup(job_id: str) -> None:
+    """Drop the job's region images, region checkpoints and its split bookkeeping in Redis."""
+    _checkpoint.discard(job_id)
+    try:
+        get_storage().delete_prefix(intermediates_prefix(job_id))
+    except Exception as e:
+        logger.warning("job_id=%s deleting region intermediates failed: %s", job_id, e)
+    try:
+        redis_client().delete(
+            REGIONS_KEY.format(job_id=job_id),
+            SUBTASKS_KEY.format(job_id=job_id),
+            STITCH_KEY.format(job_id=job_id),
+        )
+    except redis.RedisError as e:
+        logger.warning("job_id=%s deleting split keys failed: %s", job_id, e)
+
+
+def _stop_regions(job_id: str) -> None:
+    """
+    Stop the job's other regions as a cancel does (backend request_cancel): set the cancel flag, so
+    running regions stop at their next tile, and revoke the region tasks still queued. Called once
+    the job has failed, by the failing region itself or by the chord's error callback.
+    """
+    try:
+        client = redis_client()
+        client.set(CANCEL_KEY.format(job_id=job_id), 1, ex=KEY_TTL_SECONDS)
+        task_ids = [t.decode() for t in client.lrange(SUBTASKS_KEY.format(job_id=job_id), 0, -1)]
+    except redis.RedisError as e:
+        logger.warning("job_id=%s stopping regions failed: %s", job_id, e)
+        return
+    if task_ids:
+        celery_app.control.revoke(task_ids)
+
+
+@celery_app.task(name="app.tasks.split.stitch_regions_task", acks_late=True, reject_on_worker_lost=True)
+def stitch_regions_task(
+    results: list[dict],
+    job_id: str,
+    layout: list[dict],
+    height: int,
+    width: int,
+    step_key: str | None = None,
+) -> None:
+    """
+    Chord callback: blend the region outputs, run face enhance and upload; always cleans up.
+    step_key: where the stitched upscale is stored for later jobs (app.step_cache), if anywhere.
+    """
+    try:
+        job = _get_job(job_id)
+        if not job or job.status != JOB_STATUS_PROCESSING:
+            logger.info("job_id=%s stitch skipped (job no longer processing)", job_id)
+            return
+        incomplete = [r["index"] for r in results if "tiles" not in r]
+        if incomplete:
+            # A region that failed has already marked the job failed; this only covers stragglers
+            logger.warning("job_id=%s stitch skipped, regions without output: %s", job_id, incomplete)
+            return
+        end = pipeline.upscale_end(job)
+        _update_job_progress(job_id, end, f"Stitching {len(results)} regions…")
+        storage = get_storage()
+        regions = [_regions.Region.from_dict(r) for r in layout]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            tmp = Path(tmpdir)
+
+            def load(region: _regions.Region):
+                path = tmp / f"region-{region.index}.png"
+                storage.get_to_file(_region_key(job_id, region.index, "out"), path)
+                out = image.read(path).pixels
+                path.unlink()
+                return out
+
+            output_path = encode.result_path(tmp, job)
+            canvas = _regions.stitch(regions, load, height, width, job.scale, spill_dir=tmp)
+            if step_key:
+                step_cache.save(storage, step_key, image.Frame(canvas), tmp)
+            progress = JobProgress(job_id, report=lambda pct, d: _update_job_progress(job_id, pct, d))
+            face_stats = face_enhance.FaceStats()
+            frame = pipeline.finish(job, image.Frame(canvas), progress, end, stats=face_stats)
+            encoded = encode.EncodeStats()
+            encode.write(frame, output_path, encode.Encoding.for_job(job), encoded)
+            variants = pipeline.variants_for(job)
+            pipeline.write_variants(job, frame, variants, tmp)
+            del frame, canvas
+            totals = {k: sum(r[k] for r in results) for k in ("tiles", "tiles_flat", "tiles_reused")}
+            if job.face_enhance:
+                totals.update(faces=face_stats.faces, face_seconds=round(face_stats.seconds, 1))
+            logger.info(
+                "job_id=%s pipeline regions=%s %s",
+                job_id, len(results), " ".join(f"{k}={v}" for k, v in totals.items()),
+            )
+            _upload_result(job_id, output_path, storage, encoded, variants)
+    except JobCancelled:
+        logger.info("job_id=%s cancelled during stitching, stopped early", job_id)
+    except Exception as e:
+        logger.exception("job_id=%s stitch failed: %s", job_id, e)
+        _fail_job(job_id, e)
+    finally:
+        _cleanup(job_id)
+
+
+@celery_app.task(name="app.tasks.split.stitch_failed")
+def stitch_failed(request, exc, traceback, job_id: str) -> None:
+    """
+    Chord error callback (a region task was revoked or raised): fail the job unless cancelled, stop
+    the sibling regions still queued or running, then clean up.
+    """
+    logger.warning("job_id=%s split job did not complete: %s", job_id, exc)
+    _fail_job(job_id, exc)
+    _stop_regions(job_id)
+    _cleanup(job_id)
@@ -5,13 +5,22 @@ from datetime import datetime
 from pathlib import Path
 from uuid import UUID
 
-from sqlalchemy import select
+import redis
+from billiard.exceptions import WorkerLostError
+from celery import Task
+from celery.worker.request import Request
+from sqlalchemy import select, update
 
+from app import encode, image
 from app.celery_app import celery_app
 from app.config import settings
 from app.db import get_db
 from app.models.job import Job
+from app.progress import JobCancelled, JobProgress, redis_client
+from app.step_cache import StepCache
 from app.storage import get_storage
+from app.upscalers import _checkpoint
+from app.upscalers._model_cache import model_cache
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +29,19 @@ JOB_STATUS_PROCESSING = "processing"
 JOB_STATUS_COMPLETED = "completed"
 JOB_STATUS_FAILED = "failed"
 JOB_STATUS_CANCELLED = "cancelled"
+# Worker child died mid-job; the requeued task resumes it (must match backend JOB_STATUS_INTERRUPTED)
+JOB_STATUS_INTERRUPTED = "interrupted"
+
+# Storage key of one variant of a job's result (must match backend job_service.variant_result_key)
+VARIANT_RESULT_KEY = "results/{job_id}-{name}"
+
+# Deliveries of a job (or "<job_id>:region-<i>" of a split job), counted against max_job_attempts
+ATTEMPTS_KEY = "job:{job_id}:attempts"
+ATTEMPTS_TTL_SECONDS = 24 * 3600
+TOO_MANY_ATTEMPTS = (
+    "Processing was interrupted {n} times (the worker likely ran out of memory). "
+    "Try a smaller image or scale."
+)
 
 
 def _get_job(job_id: str) -> Job | None:
@@ -67,27 +89,120 @@ def _update_job_status(
         db.close()
 
 
+def _update_job_progress(job_id: str, progress: int, status_detail: str) -> None:
+    """Progress from inside the pipeline; only while still processing, so a concurrent cancel wins."""
+    db = get_db()
+    try:
+        db.execute(
+            update(Job)
+            .where(Job.id == UUID(job_id), Job.status == JOB_STATUS_PROCESSING)
+            .values(progress=progress, status_detail=status_detail)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def count_attempt(job_id: str) -> int:
+    """Count this delivery of job_id (or a region key); 1 when Redis is unavailable."""
+    key = ATTEMPTS_KEY.format(job_id=job_id)
+    try:
+        client = redis_client()
+        attempt = int(client.incr(key))
+        client.expire(key, ATTEMPTS_TTL_SECONDS)
+        return attempt
+    except redis.RedisError as e:
+        logger.warning("job_id=%s attempt count failed: %s", job_id, e)
+        return 1
+
+
+def _mark_interrupted(job_id: str) -> None:
+    db = get_db()
+    try:
+        db.execute(
+            update(Job)
+            .where(Job.id == UUID(job_id), Job.status == JOB_STATUS_PROCESSING)
+            .values(status=JOB_STATUS_INTERRUPTED, status_detail="Worker stopped — resuming from checkpoint…")
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+class _ResumableRequest(Request):
+    """
+    Runs in the worker parent. When the child running the job dies (OOM kill, restart), the job is
+    marked interrupted before the message is requeued (acks_late + reject_on_worker_lost), so the
+    redelivered task resumes it from its tile checkpoint instead of skipping it.
+    """
+
+    def on_failure(self, exc_info, send_failed_event=True, return_ok=False):
+        exc = getattr(exc_info.exception, "exc", exc_info.exception)
+        if isinstance(exc, WorkerLostError):
+            from app.tasks import batch
+
+            # With the jobs a background-remove task claimed from its upload (see app.tasks.batch)
+            for job_id in [self.args[0], *batch.claimed(self.args[0])]:
+                try:
+                    _mark_interrupted(job_id)
+                    logger.warning("job_id=%s interrupted: %s", job_id, exc)
+                except Exception as e:
+                    logger.warning("job_id=%s marking interrupted failed: %s", job_id, e)
+        return super().on_failure(exc_info, send_failed_event=send_failed_event, return_ok=return_ok)
+
+
+class _ResumableTask(Task):
+    Request = _ResumableRequest
+
+
 # Name must match backend celery_client.TASK_UPSCALE so tasks are received.
 # Task always returns (never re-raises); Celery acks the message so the next job in the queue runs.
-@celery_app.task(name="app.tasks.upscale.upscale_task")
-def upscale_task(job_id: str) -> None:
+# Acked only then: if the child dies mid-job the message is requeued and the job resumed.
+@celery_app.task(
+    name="app.tasks.upscale.upscale_task",
+    base=_ResumableTask,
+    acks_late=True,
+    reject_on_worker_lost=True,
+)
+def upscale_task(job_id: str, batch: list[str] | None = None) -> None:
+    """Run job_id's pipeline; batch lists the jobs of its upload a background-remove task may take along."""
     logger.info("upscale_task started job_id=%s", job_id)
     job = _get_job(job_id)
-    if not job or job.status != JOB_STATUS_QUEUED:
+    if not job or job.status not in (JOB_STATUS_QUEUED, JOB_STATUS_INTERRUPTED):
         logger.warning("upscale_task skipped job_id=%s (not found or not queued)", job_id)
         return
 
+    resuming = job.status == JOB_STATUS_INTERRUPTED
+    attempt = count_attempt(job_id)
+    if attempt > settings.max_job_attempts:
+        logger.warning("job_id=%s interrupted %s times, giving up", job_id, attempt - 1)
+        _update_job_status(
+            job_id,
+            JOB_STATUS_FAILED,
+            error_message=TOO_MANY_ATTEMPTS.format(n=attempt - 1),
+            status_detail=None,
+            finished_at=datetime.utcnow(),
+            clear_progress=True,
+        )
+        _checkpoint.discard(job_id)
+        return
+
     now = datetime.utcnow()
-    _update_job_status(
-        job_id, JOB_STATUS_PROCESSING, status_detail="Starting…", started_at=now, progress=5
-    )
+    if resuming:
+        logger.info("job_id=%s resuming (attempt %s)", job_id, attempt)
+        _update_job_status(job_id, JOB_STATUS_PROCESSING, status_detail="Resuming…", progress=5)
+    else:
+        _update_job_status(
+            job_id, JOB_STATUS_PROCESSING, status_detail="Starting…", started_at=now, progress=5
+        )
     storage = get_storage()
+    dispatched = False
 
     try:
         with tempfile.TemporaryDirectory() as tmpdir:
             tmp = Path(tmpdir)
             input_path = tmp / "input"
-            output_path = tmp / "output.png"
+            output_path = encode.result_path(tmp, job)
 
             _update_job_status(
                 job_id, JOB_STATUS_PROCESSING, status_detail="Downloading image…", progress=15
@@ -96,20 +211,18 @@ def upscale_task(job_id: str) -> None:
             storage.get_to_file(job.original_key, input_path)
 
             try:
-                import cv2
-                img = cv2.imread(str(input_path))
-                if img is not None:
-                    h, w = img.shape[:2]
-                    mp = (h * w) / 1_000_000
-                    if mp > settings.max_megapixels:
-                        _update_job_status(
-                            job_id,
-                            JOB_STATUS_FAILED,
-                            error_message=f"Image exceeds {settings.max_megapixels} megapixels",
-                            finished_at=datetime.utcnow(),
-                            clear_progress=True,
-                        )
-                        return
+                # Header only: the pipeline decodes the input once, after these checks
+                w, h = image.probe(input_path)
+                mp = (h * w) / 1_000_000
+                if mp > settings.max_megapixels:
+                    _update_job_status(
+                        job_id,
+                        JOB_STATUS_FAILED,
+                        error_message=f"Image exceeds {settings.max_megapixels} megapixels",
+                        finished_at=datetime.utcnow(),
+                        clear_progress=True,
+                    )
+                    return
             except Exception:
                 pass
 
@@ -126,13 +239,20 @@ def upscale_task(job_id: str) -> None:
                     logger.warning("job_id=%s SwinIR requested but repo not found at %s", job_id, swinir_dir)
                     return
 
-            from app.pipeline import METHOD_BACKGROUND_REMOVE, METHOD_CONVERT, UPSCALE_METHODS, run as pipeline_run
+            from app.pipeline import (
+                METHOD_BACKGROUND_REMOVE,
+                METHOD_CONVERT,
+                UPSCALE_METHODS,
+                run as pipeline_run,
+                variants_for,
+            )
 
             method_labels = {
                 "real_esrgan": "Real-ESRGAN",
                 "swinir": "SwinIR",
                 "esrgan": "ESRGAN (RRDB)",
                 "real_esrgan_anime": "Anime (Real-ESRGAN)",
+                "real_esrgan_fast": "Fast (Real-ESRGAN compact)",
                 "background_remove": "Background remove",
                 "convert": "Convert",
             }
@@ -162,52 +282,152 @@ def upscale_task(job_id: str) -> None:
                 return
 
             _update_job_status(job_id, JOB_STATUS_PROCESSING, status_detail=detail, progress=50)
-            pipeline_run(job, input_path, output_path)
-            _update_job_status(job_id, JOB_STATUS_PROCESSING, progress=75)
+            if job.method == METHOD_BACKGROUND_REMOVE and batch:
+                from app.tasks import batch as batch_jobs
 
-            # If user cancelled while we were processing, don't upload result
-            job_after = _get_job(job_id)
-            if job_after and job_after.status == JOB_STATUS_CANCELLED:
-                logger.info("job_id=%s was cancelled, skipping upload", job_id)
+                # Segments the queued jobs of the same upload with this one and uploads every result
+                batch_jobs.run(job, input_path, tmp, batch, storage)
                 return
+            from app.tasks import split
 
-            _update_job_status(
-                job_id, JOB_STATUS_PROCESSING, status_detail="Uploading result…", progress=90
+            intermediates = None
+            if job.method != METHOD_CONVERT:
+                intermediates = StepCache.for_input(input_path, storage)
+            if split.should_split(job, input_path, intermediates):
+                # Regions run as separate tasks on any worker; the chord callback finishes the job
+                split.dispatch(job, input_path, intermediates)
+                dispatched = True
+                return
+            progress = JobProgress(job_id, report=lambda pct, d: _update_job_progress(job_id, pct, d))
+            checkpoint = _checkpoint.TileCheckpoint.for_job(job_id)
+            encoded = encode.EncodeStats()
+            variants = variants_for(job)
+            steps = pipeline_run(
+                job,
+                input_path,
+                output_path,
+                progress=progress,
+                checkpoint=checkpoint,
+                encoded=encoded,
+                intermediates=intermediates,
+                variants=variants,
             )
-            logger.info("job_id=%s uploading result", job_id)
-            result_key = f"results/{job_id}"
-            with open(output_path, "rb") as f:
-                storage.put(result_key, f)
+            if steps:
+                logger.info("job_id=%s pipeline %s", job_id, " ".join(f"{k}={v}" for k, v in steps.items()))
+            if "steps_reused" in steps:
+                _record(job_id, steps_reused=steps["steps_reused"])
+            _update_job_status(job_id, JOB_STATUS_PROCESSING, progress=75)
+            logger.info("job_id=%s model cache %s", job_id, model_cache.stats())
 
-            _update_job_status(
-                job_id,
-                JOB_STATUS_COMPLETED,
-                result_key=result_key,
-                status_detail=None,
-                finished_at=datetime.utcnow(),
-                progress=100,
-            )
-            logger.info("job_id=%s completed", job_id)
+            _upload_result(job_id, output_path, storage, encoded, variants)
 
+    except JobCancelled:
+        # Backend already marked the job cancelled; the temp dir is gone and this child lives on
+        logger.info("job_id=%s cancelled during processing, stopped early", job_id)
     except Exception as e:
         logger.exception("job_id=%s failed: %s", job_id, e)
-        job_after = _get_job(job_id)
-        if job_after and job_after.status == JOB_STATUS_CANCELLED:
-            logger.info("job_id=%s was cancelled, not overwriting with failed", job_id)
-            return
-        msg = str(e)
-        if "SwinIR repo not found" in msg or "SwinIR" in msg and "not available" in msg:
-            msg = (
-                "SwinIR is not available in this deployment (repo not found). "
-                "Use Standard (Real-ESRGAN), or rebuild the worker image with: "
-                "docker compose build --no-cache worker && docker compose up -d worker"
-            )
-        _update_job_status(
+        _fail_job(job_id, e)
+        # Return normally so Celery acks this task and the next job in the queue runs.
+    finally:
+        # Done, failed or cancelled: nothing to resume (a split job's regions keep theirs until stitched)
+        if not dispatched:
+            _checkpoint.discard(job_id)
+
+
+def _record(job_id: str, **values) -> None:
+    """Store what the pipeline did (result encoding, reused steps) on the job's columns."""
+    db = get_db()
+    try:
+        db.execute(update(Job).where(Job.id == UUID(job_id)).values(**values))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _upload_result(
+    job_id: str,
+    output_path: Path,
+    storage,
+    encoded: encode.EncodeStats | None = None,
+    variants: list | None = None,
+) -> None:
+    """
+    Upload the final image and mark the job completed, unless it was cancelled meanwhile.
+    encoded (from app.encode) sets the stored content type and the job's result format / size;
+    variants (app.pipeline.Variant, written) are uploaded under their own keys and listed on the job.
+    """
+    # If user cancelled while we were processing, don't upload result
+    job_after = _get_job(job_id)
+    if job_after and job_after.status == JOB_STATUS_CANCELLED:
+        logger.info("job_id=%s was cancelled, skipping upload", job_id)
+        return
+
+    _update_job_status(
+        job_id, JOB_STATUS_PROCESSING, status_detail="Uploading result…", progress=90
+    )
+    logger.info("job_id=%s uploading result", job_id)
+    result_key = f"results/{job_id}"
+    content_type = encode.MEDIA_TYPES.get(encoded.format) if encoded is not None else None
+    with open(output_path, "rb") as f:
+        storage.put(result_key, f, content_type=content_type)
+    if encoded is not None:
+        _record(
             job_id,
-            JOB_STATUS_FAILED,
-            error_message=msg,
-            status_detail=None,
-            finished_at=datetime.utcnow(),
-            clear_progress=True,
+            result_format=encoded.format,
+            result_bytes=encoded.bytes,
+            encode_seconds=round(encoded.seconds, 2),
         )
-        # Return normally so Celery acks this task and the next job in the queue runs.
+        logger.info(
+            "job_id=%s result format=%s bytes=%s encode_seconds=%.1f",
+            job_id, encoded.format, encoded.bytes, encoded.seconds,
+        )
+    if variants:
+        written = []
+        for variant in variants:
+            key = VARIANT_RESULT_KEY.format(job_id=job_id, name=variant.name)
+            with open(variant.path, "rb") as f:
+                storage.put(key, f, content_type=encode.MEDIA_TYPES.get(variant.encoded.format))
+            written.append(
+                {
+                    "scale": variant.scale,
+                    "format": variant.encoding.format,
+                    "result_key": key,
+                    "result_format": variant.encoded.format,
+                    "result_bytes": variant.encoded.bytes,
+                }
+            )
+        _record(job_id, variants=written)
+        logger.info("job_id=%s variants %s", job_id, " ".join(v.name for v in variants))
+
+    _update_job_status(
+        job_id,
+        JOB_STATUS_COMPLETED,
+        result_key=result_key,
+        status_detail=None,
+        finished_at=datetime.utcnow(),
+        progress=100,
+    )
+    logger.info("job_id=%s completed", job_id)
+
+
+def _fail_job(job_id: str, e: Exception) -> None:
+    """Mark the job failed with a user-facing message, unless it was cancelled meanwhile."""
+    job_after = _get_job(job_id)
+    if job_after and job_after.status == JOB_STATUS_CANCELLED:
+        logger.info("job_id=%s was cancelled, not overwriting with failed", job_id)
+        return
+    msg = str(e)
+    if "SwinIR repo not found" in msg or "SwinIR" in msg and "not available" in msg:
+        msg = (
+            "SwinIR is not available in this deployment (repo not found). "
+            "Use Standard (Real-ESRGAN), or rebuild the worker image with: "
+            "docker compose build --no-cache worker && docker compose up -d worker"
+        )
+    _update_job_status(
+        job_id,
+        JOB_STATUS_FAILED,
+        error_message=msg,
+        status_detail=None,
+        finished_at=datetime.utcnow(),
+        clear_progress=True,
+    )
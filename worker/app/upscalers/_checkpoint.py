@@ -0,0 +1,98 @@
+"""
+Tile checkpoints, so a job whose worker child was OOM-killed or restarted resumes instead of
+starting from tile zero (settings.tile_checkpoints, off by default). A redelivered job resumes only
+on a worker that sees the same settings.checkpoint_dir, so checkpoints help when that directory is
+on storage shared by the workers; elsewhere they only add disk writes. Per job (and split region)
+a directory under settings.checkpoint_dir holds:
+  plan.json     the tile plan the first attempt used (a resumed attempt must batch identically)
+  canvas        the output canvas as a memory-mapped file
+  <plane>.done  one byte per tile batch of each plane, set right after the batch's tiles are written
+Both files are MAP_SHARED mappings, so every write is in the page cache as soon as it is made and
+survives the process dying; a batch whose marker is set is never run again. The directory is
+removed when the job completes, fails or is cancelled, and by cleanup_expired_task on expiry.
+"""
+import json
+import logging
+import shutil
+from dataclasses import asdict
+from pathlib import Path
+
+import numpy as np
+
+from app.config import settings
+from app.upscalers._tile_planner import TilePlan
+
+logger = logging.getLogger(__name__)
+
+
+def _root() -> Path:
+    return Path(settings.checkpoint_dir or Path(settings.local_storage_path) / "checkpoints")
+
+
+def job_dir(job_id: str) -> Path:
+    return _root() / str(job_id)
+
+
+def resumable(job_id: str) -> bool:
+    """True when an attempt of job_id (or of one of its regions) saved a tile plan to resume from."""
+    directory = job_dir(job_id)
+    return (directory / "plan.json").is_file() or any(directory.glob("*/plan.json"))
+
+
+def discard(job_id: str) -> None:
+    """Drop a job's checkpoints (all regions); missing is fine."""
+    shutil.rmtree(job_dir(job_id), ignore_errors=True)
+
+
+class TileCheckpoint:
+    """Resumable output canvas and per-batch done markers of one upscale step."""
+
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+
+    @classmethod
+    def for_job(cls, job_id: str, part: str | None = None) -> "TileCheckpoint | None":
+        """
+        Checkpoint of job_id (part: e.g. one region of a split job); None when disabled. Nothing is
+        written until save_plan, so a job the upscale step finds too small to checkpoint leaves no trace.
+        """
+        if not settings.tile_checkpoints:
+            return None
+        return cls(job_dir(job_id) / part if part else job_dir(job_id))
+
+    def load_plan(self) -> TilePlan | None:
+        try:
+            return TilePlan(**json.loads((self.directory / "plan.json").read_text()))
+        except (OSError, ValueError, TypeError):
+            return None
+
+    def save_plan(self, plan: TilePlan) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / "plan.json").write_text(json.dumps(asdict(plan)))
+
+    def canvas(self, shape: tuple[int, ...], dtype) -> np.memmap:
+        """The output canvas; reopened if a previous attempt left one of this shape and dtype."""
+        path = self.directory / "canvas"
+        meta_path = self.directory / "canvas.json"
+        meta = {"shape": list(shape), "dtype": np.dtype(dtype).str}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        try:
+            if json.loads(meta_path.read_text()) == meta:
+                return np.memmap(path, dtype=dtype, mode="r+", shape=shape)
+        except (OSError, ValueError):
+            pass
+        # New or mismatched canvas: earlier done markers describe nothing in it
+        for marker in self.directory.glob("*.done"):
+            marker.unlink()
+        canvas = np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+        meta_path.write_text(json.dumps(meta))
+        return canvas
+
+    def done(self, plane: str, batches: int) -> np.memmap | None:
+        """One byte per batch of this plane (1 = written); None when there are no batches."""
+        if not batches:
+            return None
+        path = self.directory / f"{plane}.done"
+        if path.is_file() and path.stat().st_size == batches:
+            return np.memmap(path, dtype=np.uint8, mode="r+", shape=(batches,))
+        return np.memmap(path, dtype=np.uint8, mode="w+", shape=(batches,))
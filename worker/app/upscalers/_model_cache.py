@@ -0,0 +1,91 @@
+"""
+Process-resident model cache. Keeps built models (e.g. RealESRGANer upsamplers) in memory
+so back-to-back jobs with the same method skip weight loading and model construction.
+LRU eviction against a byte budget (settings.model_cache_max_mb); hit/miss counters for logs.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def torch_module_nbytes(module: Any) -> int:
+    """Bytes held by a torch module's parameters and buffers (0 if not a module)."""
+    params = getattr(module, "parameters", None)
+    buffers = getattr(module, "buffers", None)
+    if params is None or buffers is None:
+        return 0
+    total = 0
+    for t in list(params()) + list(buffers()):
+        total += t.numel() * t.element_size()
+    return total
+
+
+class ModelCache:
+    """LRU cache of loaded models keyed by a hashable tuple; evicts least recently used over budget."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[Hashable, tuple[Any, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(size for _, size in self._entries.values())
+
+    def get(
+        self,
+        key: Hashable,
+        loader: Callable[[], Any],
+        size_of: Callable[[Any], int] | None = None,
+    ) -> Any:
+        """Return cached model for key, or build it with loader() and cache it."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            model = loader()
+            size = size_of(model) if size_of else 0
+            self._entries[key] = (model, size)
+            self._evict(keep=key)
+            logger.info(
+                "model cache miss key=%s size_mb=%.1f (hits=%s misses=%s entries=%s total_mb=%.1f)",
+                key, size / 1e6, self.hits, self.misses, len(self._entries), self.total_bytes / 1e6,
+            )
+            return model
+
+    def _evict(self, keep: Hashable) -> None:
+        """Drop least recently used entries until under budget. Never evicts `keep`."""
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            if oldest == keep:
+                break
+            self._entries.pop(oldest)
+            self.evictions += 1
+            logger.info("model cache evicted key=%s", oldest)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self.total_bytes,
+        }
+
+
+model_cache = ModelCache(settings.model_cache_max_mb * 1024 * 1024)
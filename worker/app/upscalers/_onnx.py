@@ -0,0 +1,98 @@
+"""
+ONNX Runtime backend for RRDBNet (real_esrgan, real_esrgan_anime, esrgan) on CPU.
+Each checkpoint is exported once to an .onnx graph next to it in the weights dir (dynamic batch,
+height and width; re-exported when the .pth is newer) and its InferenceSession is kept in the
+model cache. onnx_forward() plugs into the tiling engine in place of _tiling.torch_forward.
+"""
+import inspect
+import logging
+import os
+from pathlib import Path
+from typing import Any, Callable
+
+import numpy as np
+
+from app import cpu_layout
+from app.config import settings
+from app.upscalers._model_cache import model_cache
+from app.upscalers._tiling import Forward
+
+logger = logging.getLogger(__name__)
+
+OPSET = 17
+
+# Graphs that failed to export or load in this process; not retried on every job
+_unavailable: dict[str, str] = {}
+
+
+def onnx_path(model_path: str) -> Path:
+    return Path(model_path).with_suffix(".onnx")
+
+
+def export(model: Any, path: Path) -> None:
+    """Export a torch RRDBNet (fp32, CPU) to path; written to a temp name first so readers never see half a file."""
+    import torch
+
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    dynamic = {0: "batch", 2: "height", 3: "width"}
+    # torch >= 2.5 defaults towards the dynamo exporter; the TorchScript one handles RRDBNet as is
+    extra = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    try:
+        torch.onnx.export(
+            model.float().cpu().eval(),
+            torch.rand(1, 3, 64, 64),
+            str(tmp),
+            input_names=["input"],
+            output_names=["output"],
+            dynamic_axes={"input": dynamic, "output": dynamic},
+            opset_version=OPSET,
+            **extra,
+        )
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    logger.info("exported ONNX graph %s (%.1f MB)", path, path.stat().st_size / 1e6)
+
+
+def get_session(model_path: str, load_model: Callable[[], Any]) -> Any:
+    """
+    Cached onnxruntime InferenceSession for an RRDB checkpoint. load_model() builds the torch
+    network and is only called when the graph has to be (re-)exported.
+    """
+    path = onnx_path(model_path)
+    if str(path) in _unavailable:
+        raise RuntimeError(_unavailable[str(path)])
+    intra, inter = cpu_layout.onnx_threads(), settings.onnx_inter_op_threads
+
+    def load() -> Any:
+        import onnxruntime as ort
+
+        if not path.is_file() or path.stat().st_mtime < Path(model_path).stat().st_mtime:
+            export(load_model(), path)
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if intra:
+            options.intra_op_num_threads = intra
+        if inter:
+            options.inter_op_num_threads = inter
+        return ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+
+    try:
+        return model_cache.get(
+            ("onnx", str(path), intra, inter), load, size_of=lambda _: path.stat().st_size
+        )
+    except Exception as e:
+        _unavailable[str(path)] = f"ONNX backend unavailable for {path.name}: {e}"
+        raise
+
+
+def onnx_forward(session: Any) -> Forward:
+    """Batch forward through an InferenceSession: NCHW float32 in, NCHW float32 out."""
+    input_name = session.get_inputs()[0].name
+
+    def forward(batch: np.ndarray) -> np.ndarray:
+        return session.run(None, {input_name: np.ascontiguousarray(batch, dtype=np.float32)})[0]
+
+    # The session's thread pools do not survive fork, so no tile shards (onnxruntime threads instead)
+    forward.fork_safe = False
+    return forward
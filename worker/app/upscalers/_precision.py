@@ -0,0 +1,79 @@
+"""
+Reduced-precision CPU inference for the torch upscalers (RRDB, SwinIR), set per method with
+INFERENCE_PRECISION: fp32 (default), bf16 (autocast, needs AVX512-BF16 / AMX or ARM BF16) or
+int8 (dynamic quantization of Linear layers: SwinIR's attention and MLP; RRDBNet is all
+convolutions, so it stays fp32). Unsupported modes fall back to fp32 with one warning.
+On GPU the models already run in fp16 and these modes do not apply.
+"""
+import copy
+import logging
+from functools import lru_cache
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+PRECISIONS = ("fp32", "bf16", "int8")
+_warned: set[tuple[str, str]] = set()
+
+
+@lru_cache(maxsize=1)
+def _cpu_flags() -> frozenset[str]:
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith(("flags", "Features")):
+                    return frozenset(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return frozenset()
+
+
+def bf16_supported() -> bool:
+    """Native bf16 matmul/conv on this CPU (otherwise autocast is emulated and slower than fp32)."""
+    import torch
+
+    flags = _cpu_flags()
+    native = bool(flags & {"avx512_bf16", "amx_bf16", "bf16"})
+    return native and torch.backends.mkldnn.is_available()
+
+
+def int8_supported() -> bool:
+    import torch
+
+    return any(e != "none" for e in torch.backends.quantized.supported_engines)
+
+
+def _has_linear(model: Any) -> bool:
+    import torch
+
+    return any(isinstance(m, torch.nn.Linear) for m in model.modules())
+
+
+def resolve(method: str, requested: str, model: Any, on_gpu: bool = False) -> str:
+    """Precision that will actually run for this model; logs once per method when it falls back."""
+    if requested == "fp32" or on_gpu:
+        return "fp32"
+    reason = None
+    if requested not in PRECISIONS:
+        reason = f"unknown precision {requested!r}"
+    elif requested == "bf16" and not bf16_supported():
+        reason = "CPU has no native bf16 (avx512_bf16 / amx_bf16)"
+    elif requested == "int8" and not int8_supported():
+        reason = "no quantized engine in this torch build"
+    elif requested == "int8" and not _has_linear(model):
+        reason = "dynamic int8 quantizes Linear layers only and this network has none"
+    if reason is None:
+        return requested
+    if (method, requested) not in _warned:
+        _warned.add((method, requested))
+        logger.warning("%s: precision %s unavailable (%s); using fp32", method, requested, reason)
+    return "fp32"
+
+
+def quantize_dynamic(model: Any) -> Any:
+    """int8 dynamic-quantized copy of model (Linear weights int8, activations quantized per batch)."""
+    import torch
+
+    return torch.ao.quantization.quantize_dynamic(
+        copy.deepcopy(model).cpu().eval(), {torch.nn.Linear}, dtype=torch.qint8
+    )
@@ -1,4 +1,8 @@
-"""Shared Real-ESRGAN / RRDB inference. Used by real_esrgan and real_esrgan_anime."""
+"""
+Shared Real-ESRGAN inference. Used by real_esrgan, real_esrgan_anime and esrgan (RRDBNet)
+and real_esrgan_fast (SRVGGNetCompact, arch="srvgg").
+"""
+import logging
 import sys
 from pathlib import Path
 
@@ -6,24 +10,33 @@ import torchvision.transforms.functional as _tv_functional
 
 sys.modules["torchvision.transforms.functional_tensor"] = _tv_functional
 
-import cv2
+import numpy as np
 from basicsr.archs.rrdbnet_arch import RRDBNet
 from realesrgan import RealESRGANer
+from realesrgan.archs.srvgg_arch import SRVGGNetCompact
 
+from app.config import settings
+from app.upscalers import _onnx, _precision, _scale_strategy, _tiling
+from app.upscalers._checkpoint import TileCheckpoint
+from app.upscalers._model_cache import model_cache, torch_module_nbytes
 
-def upscale_rrdb(
-    input_path: Path,
-    output_path: Path,
-    model_path: str,
-    scale: int,
-    tile: int,
-    gpu_id: int | None = None,
-    num_block: int = 23,
-) -> None:
-    """Run RRDBNet upscale. scale must be 2 or 4; model must match. num_block=6 for anime 6B."""
-    if scale not in (2, 4):
-        raise ValueError("scale must be 2 or 4")
-    model = RRDBNet(
+logger = logging.getLogger(__name__)
+
+TILE_PAD = 10
+
+
+def _build_network(arch: str, scale: int, num_block: int):
+    if arch == "srvgg":
+        # realesr-general-x4v3: num_block is the number of body convolutions
+        return SRVGGNetCompact(
+            num_in_ch=3,
+            num_out_ch=3,
+            num_feat=64,
+            num_conv=num_block,
+            upscale=scale,
+            act_type="prelu",
+        )
+    return RRDBNet(
         num_in_ch=3,
         num_out_ch=3,
         num_feat=64,
@@ -31,19 +44,169 @@ def upscale_rrdb(
         num_grow_ch=32,
         scale=scale,
     )
-    upsampler = RealESRGANer(
+
+
+def _load_upsampler(
+    model_path: str, scale: int, gpu_id: int | None, num_block: int, arch: str = "rrdb"
+) -> RealESRGANer:
+    model = _build_network(arch, scale, num_block)
+    return RealESRGANer(
         scale=scale,
         model_path=model_path,
         model=model,
-        tile=tile,
-        tile_pad=10,
+        tile=0,
+        tile_pad=TILE_PAD,
         pre_pad=0,
-        half=(gpu_id is not None),
+        half=gpu_id is not None,
         gpu_id=gpu_id,
     )
-    img = cv2.imread(str(input_path), cv2.IMREAD_UNCHANGED)
-    if img is None:
-        raise RuntimeError(f"Failed to read image: {input_path}")
-    output, _ = upsampler.enhance(img, outscale=scale)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    cv2.imwrite(str(output_path), output)
+
+
+def get_rrdb_upsampler(
+    model_path: str,
+    scale: int,
+    gpu_id: int | None = None,
+    num_block: int = 23,
+    arch: str = "rrdb",
+) -> RealESRGANer:
+    """
+    Return a cached RealESRGANer (used as the weight loader: model on device, half if GPU).
+    Tiling is done by app.upscalers._tiling, so the tile size is not part of the key.
+    """
+    half = gpu_id is not None
+    key = (arch, model_path, scale, num_block, half, gpu_id)
+    return model_cache.get(
+        key,
+        lambda: _load_upsampler(model_path, scale, gpu_id, num_block, arch),
+        size_of=lambda u: torch_module_nbytes(u.model),
+    )
+
+
+def rrdb_forward(
+    model_path: str,
+    scale: int,
+    gpu_id: int | None = None,
+    num_block: int = 23,
+    backend: str = "torch",
+    precision: str = "fp32",
+    arch: str = "rrdb",
+    method: str = "",
+) -> _tiling.Forward:
+    """
+    Tile forward for the engine: ONNX Runtime when backend is "onnx" and usable on CPU (always fp32),
+    else torch at the requested CPU precision where supported. method is the upscaler's name
+    (settings.precision's key; the weight file's name when not given).
+    """
+    if backend == "onnx" and gpu_id is None:
+        try:
+            session = _onnx.get_session(
+                model_path, lambda: _load_upsampler(model_path, scale, None, num_block, arch).model
+            )
+            return _onnx.onnx_forward(session)
+        except Exception as e:
+            logger.warning("ONNX backend failed for %s, falling back to torch: %s", model_path, e)
+    upsampler = get_rrdb_upsampler(model_path, scale, gpu_id=gpu_id, num_block=num_block, arch=arch)
+    precision = _precision.resolve(
+        method or Path(model_path).stem, precision, upsampler.model, on_gpu=gpu_id is not None
+    )
+    return _tiling.torch_forward(
+        upsampler.model, upsampler.device, half=upsampler.half, bf16=precision == "bf16"
+    )
+
+
+def enhance_rrdb(
+    img: np.ndarray,
+    model_path: str,
+    scale: int,
+    tile: int,
+    gpu_id: int | None = None,
+    num_block: int = 23,
+    spill_dir: Path | None = None,
+    batch_size: int | None = None,
+    on_tile: _tiling.OnTile | None = None,
+    stats: _tiling.TileStats | None = None,
+    backend: str = "torch",
+    precision: str = "fp32",
+    arch: str = "rrdb",
+    checkpoint: TileCheckpoint | None = None,
+    alpha: str = "model",
+    method: str = "",
+) -> np.ndarray:
+    """
+    Run RRDBNet upscale on a decoded image (as from cv2.imread IMREAD_UNCHANGED).
+    method: the calling upscaler (see rrdb_forward).
+    alpha: how a BGRA input's alpha plane is upscaled (see _alpha).
+    Large outputs are a memmap canvas in spill_dir (see _tiling.allocate_canvas).
+    """
+    if scale not in (2, 4):
+        raise ValueError("scale must be 2 or 4")
+    return _tiling.enhance(
+        img,
+        rrdb_forward(
+            model_path,
+            scale,
+            gpu_id=gpu_id,
+            num_block=num_block,
+            backend=backend,
+            precision=precision,
+            arch=arch,
+            method=method,
+        ),
+        scale,
+        tile,
+        tile_pad=TILE_PAD,
+        batch_size=batch_size or settings.tile_batch_size,
+        spill_dir=spill_dir,
+        on_tile=on_tile,
+        stats=stats,
+        checkpoint=checkpoint,
+        alpha=alpha,
+    )
+
+
+def upscale_rrdb(
+    img: np.ndarray,
+    model_path: str,
+    scale: int,
+    tile: int,
+    gpu_id: int | None = None,
+    num_block: int = 23,
+    spill_dir: Path | None = None,
+    batch_size: int | None = None,
+    on_tile: _tiling.OnTile | None = None,
+    stats: _tiling.TileStats | None = None,
+    backend: str = "torch",
+    precision: str = "fp32",
+    arch: str = "rrdb",
+    strategy: str = "native",
+    checkpoint: TileCheckpoint | None = None,
+    alpha: str = "model",
+    method: str = "",
+) -> np.ndarray:
+    """
+    Upscale a decoded image (app.image layout) by scale (2 or 4). The model runs at
+    _scale_strategy.model_scale(strategy, scale) and must match it; num_block=6 for anime 6B.
+    method: the calling upscaler (see rrdb_forward).
+    """
+    h, w = img.shape[:2]
+    output = enhance_rrdb(
+        _scale_strategy.prepare_input(img, strategy),
+        model_path,
+        _scale_strategy.model_scale(strategy, scale),
+        tile,
+        gpu_id=gpu_id,
+        num_block=num_block,
+        spill_dir=spill_dir,
+        batch_size=batch_size,
+        on_tile=on_tile,
+        stats=stats,
+        backend=backend,
+        precision=precision,
+        arch=arch,
+        checkpoint=checkpoint,
+        alpha=alpha,
+        method=method,
+    )
+    if scale == 2:
+        output = _scale_strategy.finish_output(output, h, w)
+    return output
@@ -0,0 +1,135 @@
+"""
+Region grid for split jobs (see app.tasks.split): a very large image is cut into a grid of
+overlapping regions, each upscaled by a separate Celery task, and the outputs are stitched back
+with linear blending across the overlaps. Each region's weight is separable (a ramp per axis over
+its overlaps), so the weights of up to four regions at a corner sum to 1; regions are placed in
+raster order straight into the canvas, cores copied and only the leading overlap bands blended
+over what the earlier regions left there (see stitch).
+"""
+import math
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from app.upscalers._tiling import allocate_canvas
+
+
+@dataclass(frozen=True)
+class Region:
+    """Grid cell: core box [y0, y1) x [x0, x1) and the overlapping crop box (input pixels)."""
+
+    index: int
+    row: int
+    col: int
+    y0: int
+    y1: int
+    x0: int
+    x1: int
+    cy0: int
+    cy1: int
+    cx0: int
+    cx1: int
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Region":
+        return cls(**data)
+
+
+def plan(height: int, width: int, region_megapixels: float, overlap: int) -> list[Region]:
+    """Grid of about region_megapixels per cell, shaped like the image, in raster order."""
+    count = max(1, math.ceil(height * width / (region_megapixels * 1_000_000)))
+    cols = max(1, min(count, round(math.sqrt(count * width / height))))
+    rows = max(1, math.ceil(count / cols))
+    # Keep the overlap within half a core so only direct neighbours overlap
+    overlap = max(0, min(overlap, height // rows // 2, width // cols // 2))
+    ys = [height * r // rows for r in range(rows + 1)]
+    xs = [width * c // cols for c in range(cols + 1)]
+    regions = []
+    for r in range(rows):
+        for c in range(cols):
+            regions.append(Region(
+                index=len(regions),
+                row=r,
+                col=c,
+                y0=ys[r],
+                y1=ys[r + 1],
+                x0=xs[c],
+                x1=xs[c + 1],
+                cy0=max(0, ys[r] - overlap),
+                cy1=min(height, ys[r + 1] + overlap),
+                cx0=max(0, xs[c] - overlap),
+                cx1=min(width, xs[c + 1] + overlap),
+            ))
+    return regions
+
+
+def crop(img: np.ndarray, region: Region) -> np.ndarray:
+    return img[region.cy0:region.cy1, region.cx0:region.cx1]
+
+
+def _ramp(length: int, lead: int, trail: int) -> np.ndarray:
+    """Weights along one axis of a crop: 0 -> 1 over 2 * lead leading pixels, 1 -> 0 over 2 * trail trailing."""
+    pos = np.arange(length, dtype=np.float32) + 0.5
+    w = np.ones(length, dtype=np.float32)
+    if lead:
+        w = np.minimum(w, pos / (2 * lead))
+    if trail:
+        w = np.minimum(w, (length - pos) / (2 * trail))
+    return np.clip(w, 0.0, 1.0)
+
+
+def _blend(canvas: np.ndarray, out: np.ndarray, weight: np.ndarray) -> None:
+    """canvas = canvas * (1 - weight) + out * weight, rounded into canvas's dtype (same shapes)."""
+    weight = weight.reshape(weight.shape + (1,) * (out.ndim - 2))
+    info = np.iinfo(canvas.dtype)
+    blended = canvas.astype(np.float32) * (1.0 - weight) + out.astype(np.float32) * weight
+    canvas[...] = np.clip(np.rint(blended), info.min, info.max)
+
+
+def stitch(
+    regions: list[Region],
+    load: Callable[[Region], np.ndarray],
+    height: int,
+    width: int,
+    scale: int,
+    spill_dir: Path | None = None,
+) -> np.ndarray:
+    """
+    Blend the upscaled crops (load(region) -> crop upscaled by scale) into a (height, width) * scale
+    canvas; memory-mapped in spill_dir above MEMMAP_CANVAS_MIN_MB like the tile canvas.
+
+    Regions go in raster order. A region's weight is ly * ty * lx * tx (leading / trailing ramps per
+    axis) and the regions before it weigh (1 - ly) + ly * ty * tx there in total, so lerping it over
+    the canvas by its share of the sum keeps every pixel the weighted mean of the regions placed so
+    far. That share is 1 outside the leading overlap bands (the region is the first there): the
+    core and trailing bands are copied, and only the leading bands are blended, in float32.
+    """
+    canvas = None
+    for region in sorted(regions, key=lambda r: (r.row, r.col)):
+        out = load(region)
+        if canvas is None:
+            shape = (height * scale, width * scale) + out.shape[2:]
+            canvas = allocate_canvas(shape, out.dtype, spill_dir)
+        expected = ((region.cy1 - region.cy0) * scale, (region.cx1 - region.cx0) * scale)
+        if out.shape[:2] != expected:
+            raise RuntimeError(f"region {region.index}: output {out.shape[:2]} != {expected}")
+        lead_y, lead_x = (region.y0 - region.cy0) * scale, (region.x0 - region.cx0) * scale
+        ly = _ramp(expected[0], lead_y, 0)[:, None]
+        ty = _ramp(expected[0], 0, (region.cy1 - region.y1) * scale)[:, None]
+        lx = _ramp(expected[1], lead_x, 0)[None, :]
+        tx = _ramp(expected[1], 0, (region.cx1 - region.x1) * scale)[None, :]
+        share = ly * ty * lx * tx / ((1.0 - ly) + ly * ty * tx)
+        # Leading ramps span twice the lead; past them the share is 1
+        by, bx = 2 * lead_y, 2 * lead_x
+        target = canvas[region.cy0 * scale:region.cy1 * scale, region.cx0 * scale:region.cx1 * scale]
+        target[by:, bx:] = out[by:, bx:]
+        if by:
+            _blend(target[:by], out[:by], share[:by])
+        if bx:
+            _blend(target[by:, :bx], out[by:, :bx], share[by:, :bx])
+    return canvas
@@ -0,0 +1,70 @@
+"""
+How a 2× job is executed, per method (UPSCALE_2X_STRATEGY):
+  native      a 2× checkpoint (real_esrgan RealESRGAN_x2plus, swinir real_sr x2 when present)
+  half_input  halve the input (INTER_AREA), then run the 4× model: ~1/4 of the compute and memory
+  downscale   run the 4× model on the full input, then INTER_AREA the output to 2× (previous behaviour)
+The default is native where a 2× checkpoint exists, else downscale; half_input is opt-in because it
+discards input detail. 4× jobs always run the 4× model ("native").
+"""
+import logging
+
+import cv2
+import numpy as np
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+STRATEGIES = ("native", "half_input", "downscale")
+_warned: set[tuple[str, str]] = set()
+
+
+def native_x2_available(method: str) -> bool:
+    if method == "real_esrgan":
+        return True
+    if method == "swinir":
+        from app.upscalers import swinir
+
+        return (swinir.MODEL_ZOO / swinir.REAL_SR_MODEL_X2).is_file()
+    return False
+
+
+def resolve(method: str, scale: int, requested: str | None = None) -> str:
+    """Strategy a job with this method and scale runs; requested overrides the setting."""
+    if scale == 4:
+        return "native"
+    native = native_x2_available(method)
+    requested = requested or settings.upscale_2x_strategy(method)
+    if not requested:
+        return "native" if native else "downscale"
+    reason = None
+    if requested not in STRATEGIES:
+        reason = f"unknown strategy {requested!r}"
+    elif requested == "native" and not native:
+        reason = "no 2× checkpoint for this method"
+    if reason is None:
+        return requested
+    if (method, requested) not in _warned:
+        _warned.add((method, requested))
+        logger.warning("%s: 2x strategy %s unavailable (%s); using downscale", method, requested, reason)
+    return "downscale"
+
+
+def model_scale(strategy: str, scale: int) -> int:
+    """Scale the network runs at for this strategy."""
+    return scale if strategy == "native" else 4
+
+
+def prepare_input(img: np.ndarray, strategy: str) -> np.ndarray:
+    """Input the network sees: halved (rounded up) for half_input, else unchanged."""
+    if strategy != "half_input":
+        return img
+    h, w = img.shape[:2]
+    return cv2.resize(img, ((w + 1) // 2, (h + 1) // 2), interpolation=cv2.INTER_AREA)
+
+
+def finish_output(out: np.ndarray, height: int, width: int) -> np.ndarray:
+    """Network output to the 2× size of a height x width input (no-op when it already is)."""
+    if out.shape[:2] == (height * 2, width * 2):
+        return out
+    return cv2.resize(out, (width * 2, height * 2), interpolation=cv2.INTER_AREA)
@@ -0,0 +1,109 @@
+"""
+Multi-process tile sharding for a single job (settings.tile_shards), so one large image can use
+more cores than torch's intra-op threading scales to. The job's process forks the shards after
+the model is loaded, so every shard shares the weights copy-on-write instead of loading its own
+copy. Each shard runs every n-th tile batch with tile_shard_threads torch threads and writes the
+stitched tiles straight into the shared output canvas (see _tiling.allocate_canvas(shared=True)).
+Progress and errors come back over one pipe per shard; the parent keeps calling on_tile, so
+cancellation and timeouts still stop the job within a batch (the shards are killed).
+
+Plain os.fork rather than multiprocessing: Celery prefork children are daemonic, and
+multiprocessing refuses to start children from a daemonic process. Only CPU torch forwards are
+sharded; onnxruntime sessions and CUDA contexts do not survive fork.
+"""
+import logging
+import os
+import select
+import signal
+import sys
+from typing import Callable, NoReturn, Sequence, TypeVar
+
+from app import cpu_layout
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def shard_threads(shards: int) -> int:
+    """Torch threads per shard: tile_shard_threads, or this process's CPU share split across the shards."""
+    if settings.tile_shard_threads > 0:
+        return settings.tile_shard_threads
+    return max(1, cpu_layout.process_threads() // max(1, shards))
+
+
+def _child(batches: Sequence[T], work: Callable[[T], int], threads: int, fd: int) -> NoReturn:
+    """Shard process body: run its batches, report "d<tiles>" per batch or "e<error>", then _exit."""
+    status = 0
+    try:
+        torch = sys.modules.get("torch")
+        if torch is not None:
+            torch.set_num_threads(threads)
+        for batch in batches:
+            done = work(batch)
+            os.write(fd, b"d%d\n" % done)
+    except BaseException as e:  # noqa: BLE001 - everything goes back to the parent
+        status = 1
+        message = f"{type(e).__name__}: {e}".replace("\n", " ")[:2000]
+        try:
+            os.write(fd, b"e" + message.encode(errors="replace") + b"\n")
+        except OSError:
+            pass
+    finally:
+        # Never return into the parent's stack (Celery task, pipeline) from the forked copy
+        os._exit(status)
+
+
+def run(batches: Sequence[T], work: Callable[[T], int], shards: int, on_done: Callable[[int], None]) -> None:
+    """
+    Run work(batch) for every batch across `shards` forked processes; work returns the tiles it
+    wrote. on_done(tiles) runs in this process as batches finish and may raise to abort the shards.
+    """
+    shards = max(1, min(shards, len(batches)))
+    threads = shard_threads(shards)
+    children: dict[int, int] = {}  # pipe read fd -> pid
+    errors: list[str] = []
+    reaped: set[int] = set()
+    try:
+        for k in range(shards):
+            r, w = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(r)
+                _child(batches[k::shards], work, threads, w)
+            os.close(w)
+            children[r] = pid
+        logger.info("tile shards=%s threads_per_shard=%s batches=%s", shards, threads, len(batches))
+
+        pending = {fd: b"" for fd in children}
+        while pending:
+            ready, _, _ = select.select(list(pending), [], [])
+            for fd in ready:
+                chunk = os.read(fd, 4096)
+                if not chunk:
+                    del pending[fd]
+                    continue
+                *lines, pending[fd] = (pending[fd] + chunk).split(b"\n")
+                for line in lines:
+                    if line.startswith(b"d"):
+                        on_done(int(line[1:]))
+                    elif line.startswith(b"e"):
+                        errors.append(line[1:].decode(errors="replace"))
+        for pid in children.values():
+            _, status = os.waitpid(pid, 0)
+            reaped.add(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if code != 0 and not errors:
+                errors.append(f"shard pid {pid} exited with status {code}")
+    finally:
+        for fd, pid in children.items():
+            if pid not in reaped:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                os.waitpid(pid, 0)
+            os.close(fd)
+    if errors:
+        raise RuntimeError(f"tile shard failed: {errors[0]}")
@@ -0,0 +1,251 @@
+"""
+Tile planner: picks the tile size and batch size for an upscale job from the image size and the
+worker's memory budget, instead of one global tile for every image and host.
+
+Peak inference memory is modelled as fixed_bytes + bytes_per_pixel * batch * padded_tile_pixels.
+The coefficients come from scripts/calibrate_tiles.py (measured on this host, saved next to the
+weights); without a calibration file conservative CPU defaults are used. The budget is
+TILE_MEMORY_BUDGET_MB, or the cgroup / physical memory limit split across WORKER_CONCURRENCY
+children, minus the models already resident in the model cache (free VRAM on GPU). With
+TILE_SHARDS > 1 the budget is split across the shards and the image is cut into at least as many
+tiles as there are shards.
+"""
+import json
+import logging
+import math
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+from app.config import settings
+from app.upscalers._model_cache import model_cache
+
+logger = logging.getLogger(__name__)
+
+WEIGHTS_DIR = Path(__file__).resolve().parent.parent.parent / "weights"
+CALIBRATION_PATH = WEIGHTS_DIR / "tile_calibration.json"
+
+# Tile sizes considered (multiples of SwinIR's window size); tile 0 = whole image in one pass
+TILE_CANDIDATES = (64, 96, 128, 160, 192, 256, 320, 384, 448, 512, 640, 768, 1024)
+# Leave this share of the budget for the decoder, encoder and allocator slack
+HEADROOM = 0.8
+
+# Per-method tile padding (input pixels each side), as used by the upscalers
+TILE_PADS = {
+    "real_esrgan": 10,
+    "real_esrgan_anime": 10,
+    "real_esrgan_fast": 10,
+    "esrgan": 10,
+    "swinir": 16,
+}
+
+
+@dataclass(frozen=True)
+class MemoryModel:
+    """Peak bytes for one forward of `batch` tiles of `pixels` padded input pixels each."""
+
+    fixed_bytes: float
+    bytes_per_pixel: float
+
+    def peak(self, pixels: int, batch: int) -> float:
+        return self.fixed_bytes + self.bytes_per_pixel * pixels * batch
+
+
+# Rough float32 CPU activation cost per padded input pixel; replaced by calibration when present.
+# x4 RRDB and SwinIR are dominated by the 64-channel features at 4× resolution in the upsampler;
+# the x2 RRDB model pixel-unshuffles its input, so the same network runs on a quarter of the pixels.
+# The compact SRVGG model keeps only two 64-channel maps at input resolution plus its 4× output.
+DEFAULT_MODELS = {
+    "real_esrgan:4": MemoryModel(256e6, 16e3),
+    "real_esrgan:2": MemoryModel(256e6, 6e3),
+    "real_esrgan_anime:4": MemoryModel(128e6, 14e3),
+    "real_esrgan_fast:4": MemoryModel(64e6, 2e3),
+    "esrgan:4": MemoryModel(256e6, 16e3),
+    "swinir:4": MemoryModel(384e6, 24e3),
+    "swinir:2": MemoryModel(384e6, 16e3),
+}
+
+
+@dataclass(frozen=True)
+class TilePlan:
+    """Chosen tiling for one job; est_seconds is set only when calibrated timings were used."""
+
+    tile: int
+    batch_size: int
+    tiles: int
+    budget_mb: float
+    estimate_mb: float
+    source: str  # "calibrated", "default" or "fixed"
+    est_seconds: float | None = None
+
+
+def _cgroup_memory_limit() -> int | None:
+    """Container memory limit (cgroup v2, then v1), or None when unlimited / not in a cgroup."""
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            value = Path(path).read_text().strip()
+        except OSError:
+            continue
+        if value == "max":
+            return None
+        limit = int(value)
+        # cgroup v1 reports "unlimited" as a huge page-rounded number
+        return limit if limit < _physical_memory() else None
+    return None
+
+
+def _physical_memory() -> int:
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def _on_gpu() -> bool:
+    if settings.real_esrgan_gpu_id is None:
+        return False
+    import torch
+
+    return torch.cuda.is_available()
+
+
+def memory_budget_bytes() -> int:
+    """Bytes one job in this worker child may use for inference."""
+    if settings.tile_memory_budget_mb > 0:
+        return settings.tile_memory_budget_mb * 1024 * 1024
+    if _on_gpu():
+        import torch
+
+        free, _ = torch.cuda.mem_get_info(settings.real_esrgan_gpu_id)
+        return free
+    total = _cgroup_memory_limit() or _physical_memory()
+    per_child = total // max(1, settings.worker_concurrency)
+    # Shards share the cached weights copy-on-write but each holds its own activations
+    return max(0, per_child - model_cache.total_bytes) // max(1, settings.tile_shards)
+
+
+_calibration: dict | None = None
+
+
+def load_calibration() -> dict:
+    """Calibration file contents ({} when missing, unreadable or measured on another device)."""
+    global _calibration
+    if _calibration is None:
+        try:
+            data = json.loads(CALIBRATION_PATH.read_text())
+        except FileNotFoundError:
+            data = {}
+        except (OSError, ValueError) as e:
+            logger.warning("ignoring tile calibration %s: %s", CALIBRATION_PATH, e)
+            data = {}
+        device = "cuda" if _on_gpu() else "cpu"
+        if data and data.get("device") != device:
+            logger.warning(
+                "ignoring tile calibration for device=%s (worker runs on %s)", data.get("device"), device
+            )
+            data = {}
+        _calibration = data
+    return _calibration
+
+
+def _tile_count(height: int, width: int, tile: int) -> int:
+    if not tile:
+        return 1
+    return math.ceil(height / tile) * math.ceil(width / tile)
+
+
+def _padded_pixels(height: int, width: int, tile: int, pad: int) -> int:
+    if not tile:
+        return height * width
+    return min(tile + 2 * pad, height) * min(tile + 2 * pad, width)
+
+
+def _job_overhead(height: int, width: int, channels: int, scale: int) -> int:
+    """Decoded input plus the output canvas when it is small enough to stay in RAM."""
+    out_bytes = height * width * channels * scale * scale
+    in_ram = out_bytes if out_bytes < settings.memmap_canvas_min_mb * 1024 * 1024 else 0
+    return height * width * channels + in_ram
+
+
+def plan(method: str, run_scale: int, height: int, width: int, channels: int = 3) -> TilePlan:
+    """
+    Whole image if it fits; else the fastest calibrated (tile, batch) that fits, or without timings
+    the largest tile (then batch) whose estimated peak fits the budget. run_scale and height x width
+    are what the network sees (see _scale_strategy: a half_input 2× job runs 4× on a halved image).
+    """
+    key = f"{method}:{run_scale}"
+    pad = TILE_PADS.get(method, 10)
+    budget = memory_budget_bytes()
+    usable = budget * HEADROOM - _job_overhead(height, width, channels, run_scale)
+
+    entry = load_calibration().get("models", {}).get(key)
+    if entry:
+        model = MemoryModel(entry["fixed_bytes"], entry["bytes_per_pixel"])
+        source = "calibrated"
+    else:
+        model = DEFAULT_MODELS.get(key, DEFAULT_MODELS["real_esrgan:4"])
+        source = "default"
+
+    shards = 1 if _on_gpu() else max(1, settings.tile_shards)
+
+    def fits(tile: int, batch: int) -> bool:
+        return model.peak(_padded_pixels(height, width, tile, pad), batch) <= usable
+
+    def feeds_shards(tile: int, batch: int = 1) -> bool:
+        return math.ceil(_tile_count(height, width, tile) / batch) >= shards
+
+    def make(tile: int, batch: int, est_seconds: float | None = None) -> TilePlan:
+        return TilePlan(
+            tile=tile,
+            batch_size=batch,
+            tiles=_tile_count(height, width, tile),
+            budget_mb=budget / 1e6,
+            estimate_mb=model.peak(_padded_pixels(height, width, tile, pad), batch) / 1e6,
+            source=source,
+            est_seconds=est_seconds,
+        )
+
+    # Whole image in one pass when it fits (and there is only one shard to feed)
+    if shards == 1 and fits(0, 1):
+        return make(0, 1)
+
+    # Measured timings: fastest measured (tile, batch) that fits, by seconds per batch x batches
+    timed = [s for s in (entry or {}).get("samples", []) if s.get("seconds")]
+    timed = [s for s in timed if s["tile"] < max(height, width) and fits(s["tile"], s["batch"])]
+    timed = [s for s in timed if feeds_shards(s["tile"], s["batch"])] or timed
+    if timed:
+        def est(s: dict) -> float:
+            return math.ceil(_tile_count(height, width, s["tile"]) / s["batch"]) * s["seconds"]
+
+        best = min(timed, key=lambda s: (est(s), -s["tile"]))
+        return make(best["tile"], best["batch"], est(best))
+
+    # Otherwise the largest candidate tile that fits, then the largest batch (up to tile_batch_size)
+    candidates = [t for t in reversed(TILE_CANDIDATES) if t < max(height, width) and fits(t, 1)]
+    tile = next((t for t in candidates if feeds_shards(t)), candidates[0] if candidates else None)
+    if tile is None:
+        tile = TILE_CANDIDATES[0]
+        logger.warning(
+            "no tile fits the memory budget (%.0f MB) for %s %sx%s; using tile=%s",
+            budget / 1e6, key, width, height, tile,
+        )
+        return make(tile, 1)
+    tiles = _tile_count(height, width, tile)
+    batch = 1
+    while (
+        batch < min(settings.tile_batch_size, tiles)
+        and fits(tile, batch + 1)
+        and feeds_shards(tile, batch + 1)
+    ):
+        batch += 1
+    return make(tile, batch)
+
+
+def fixed_plan(method: str, height: int, width: int) -> TilePlan:
+    """The configured tile (TILE_AUTO=false): REAL_ESRGAN_TILE, or 256 for SwinIR."""
+    tile = 256 if method == "swinir" else settings.real_esrgan_tile
+    return TilePlan(
+        tile=tile,
+        batch_size=settings.tile_batch_size,
+        tiles=_tile_count(height, width, tile),
+        budget_mb=0.0,
+        estimate_mb=0.0,
+        source="fixed",
+    )
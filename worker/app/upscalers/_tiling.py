@@ -0,0 +1,498 @@
+"""
+Tiled inference engine owned by the worker (used by the RRDB and SwinIR upscalers).
+Splits the image into tiles padded by tile_pad, stacks same-shaped padded tiles into batches
+for each forward pass, and stitches the unpadded centre of each output tile back exactly as
+RealESRGANer.tile_process does. Pre/post-processing (16-bit, gray, RGBA, mod padding) matches
+RealESRGANer.enhance.
+
+Memory: the input stays uint8/uint16 and is converted to float one batch of tiles at a time;
+finished tiles are written straight into an integer output canvas, which is a numpy.memmap in
+the job's temp dir when large (settings.memmap_canvas_min_mb). Peak RSS is therefore bounded
+by tile size and batch size, not by image size, and the encoder reads from the canvas directly.
+
+Tile skipping (opt-in, settings.tile_skip): before inference each padded tile is classified.
+Near-constant tiles (every channel within tile_skip_flat_range levels) are upscaled with a bicubic
+resize instead of the model, then ramped into model-output neighbours over the padding width so
+no seam shows; tiles whose padded input is byte-identical to an earlier tile copy its output.
+
+Sharding (settings.tile_shards > 1): the tile batches of one image are spread over forked
+processes that write into a shared canvas (see _sharding).
+
+Alpha (BGRA inputs): the alpha plane runs through the model after the colour planes, or is
+interpolated / guided-upsampled from them, or filled when fully opaque (see _alpha).
+
+Checkpoints (settings.tile_checkpoints): with a TileCheckpoint the canvas is the checkpoint's file
+and each finished batch is marked done, so a resumed job only runs the batches still missing.
+"""
+import hashlib
+import logging
+import mmap
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator
+
+import cv2
+import numpy as np
+
+from app.config import settings
+from app.upscalers import _alpha, _sharding
+from app.upscalers._checkpoint import TileCheckpoint
+
+logger = logging.getLogger(__name__)
+
+_fork_warned = False
+
+# Model forward: NCHW float32 RGB in [0, 1] -> NCHW float32 at `scale` times the size
+Forward = Callable[[np.ndarray], np.ndarray]
+# Called after each batch with (tiles_done, tiles_total)
+OnTile = Callable[[int, int], None]
+
+
+@dataclass(frozen=True)
+class Tile:
+    """One tile: core box (written to the output) and padded box (fed to the model), input coords."""
+
+    index: int
+    x0: int
+    y0: int
+    x1: int
+    y1: int
+    px0: int
+    py0: int
+    px1: int
+    py1: int
+
+    @property
+    def padded_shape(self) -> tuple[int, int]:
+        return self.py1 - self.py0, self.px1 - self.px0
+
+
+@dataclass
+class TileStats:
+    """
+    Per-job tile counts accumulated by enhance(): all tiles, interpolated flat tiles, reused duplicates;
+    alpha is the alpha strategy that ran for an RGBA input (see _alpha), else None.
+    """
+
+    tiles: int = 0
+    flat: int = 0
+    reused: int = 0
+    alpha: str | None = None
+
+
+def split_tiles(height: int, width: int, tile_size: int, tile_pad: int) -> list[Tile]:
+    """Row-major tiles of tile_size (edge tiles smaller), each padded by tile_pad within the image."""
+    if not tile_size:
+        return [Tile(0, 0, 0, width, height, 0, 0, width, height)]
+    tiles = []
+    tiles_x = -(-width // tile_size)
+    tiles_y = -(-height // tile_size)
+    for y in range(tiles_y):
+        for x in range(tiles_x):
+            x0, y0 = x * tile_size, y * tile_size
+            x1, y1 = min(x0 + tile_size, width), min(y0 + tile_size, height)
+            tiles.append(
+                Tile(
+                    index=len(tiles),
+                    x0=x0,
+                    y0=y0,
+                    x1=x1,
+                    y1=y1,
+                    px0=max(x0 - tile_pad, 0),
+                    py0=max(y0 - tile_pad, 0),
+                    px1=min(x1 + tile_pad, width),
+                    py1=min(y1 + tile_pad, height),
+                )
+            )
+    return tiles
+
+
+def batch_tiles(tiles: list[Tile], batch_size: int) -> Iterator[list[Tile]]:
+    """Group tiles with the same padded shape (so they stack) into batches of at most batch_size."""
+    groups: dict[tuple[int, int], list[Tile]] = {}
+    for t in tiles:
+        groups.setdefault(t.padded_shape, []).append(t)
+    batch_size = max(1, batch_size)
+    for group in groups.values():
+        for i in range(0, len(group), batch_size):
+            yield group[i:i + batch_size]
+
+
+def torch_forward(model, device, half: bool = False, bf16: bool = False) -> Forward:
+    """
+    Batch forward for a torch module: NCHW float32 numpy in, NCHW float32 numpy out.
+    bf16 runs the model under CPU bfloat16 autocast (see app.upscalers._precision).
+    """
+    import torch
+
+    def forward(batch: np.ndarray) -> np.ndarray:
+        t = torch.from_numpy(batch).to(device)
+        if half:
+            t = t.half()
+        with torch.no_grad(), torch.autocast("cpu", dtype=torch.bfloat16, enabled=bf16):
+            out = model(t)
+        return out.float().cpu().numpy()
+
+    # CPU weights are shared copy-on-write by forked shards; a CUDA context is not
+    forward.fork_safe = torch.device(device).type == "cpu"
+    return forward
+
+
+def allocate_canvas(
+    shape: tuple[int, ...], dtype, spill_dir: Path | None = None, shared: bool = False
+) -> np.ndarray:
+    """
+    Output canvas; a memmap file in spill_dir when at least settings.memmap_canvas_min_mb.
+    shared: writes from forked shard processes must be visible here, so a small canvas is an
+    anonymous shared mapping instead of private heap memory (memmap files already are shared).
+    """
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    if spill_dir is not None and nbytes >= settings.memmap_canvas_min_mb * 1024 * 1024:
+        spill_dir.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=spill_dir, suffix=".canvas", delete=False) as f:
+            path = f.name
+        return np.memmap(path, dtype=dtype, mode="w+", shape=shape)
+    if shared:
+        return np.frombuffer(mmap.mmap(-1, max(nbytes, 1)), dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    return np.empty(shape, dtype=dtype)
+
+
+def _mod_scale(scale: int) -> int | None:
+    # x2 / x1 RRDBNet pixel-unshuffle their input, so dims must be divisible (RealESRGANer.pre_process)
+    if scale == 2:
+        return 2
+    if scale == 1:
+        return 4
+    return None
+
+
+def _to_model_input(tile: np.ndarray, max_range: int, gray: bool) -> np.ndarray:
+    """HWC BGR (or HW gray) integer tile -> CHW float32 RGB in [0, 1]."""
+    t = tile.astype(np.float32) / max_range
+    if gray:
+        return np.broadcast_to(t, (3,) + t.shape)
+    return np.transpose(t[:, :, ::-1], (2, 0, 1))
+
+
+def _from_model_output(out: np.ndarray, max_range: int, gray: bool, dtype) -> np.ndarray:
+    """CHW float32 RGB -> HWC BGR (or HW gray) integer tile, clamped and rounded like RealESRGANer."""
+    out = np.clip(out, 0, 1)
+    out = np.ascontiguousarray(np.transpose(out[::-1], (1, 2, 0)))
+    if gray:
+        out = cv2.cvtColor(out, cv2.COLOR_BGR2GRAY)
+    return (out * float(max_range)).round().astype(dtype)
+
+
+def _core_end(t: Tile, height: int, width: int) -> tuple[int, int] | None:
+    """Core bottom/right clipped to the real image (mod padding only extends bottom/right), or None."""
+    y1, x1 = min(t.y1, height), min(t.x1, width)
+    if y1 <= t.y0 or x1 <= t.x0:
+        return None
+    return y1, x1
+
+
+def _classify(
+    src: np.ndarray, tiles: list[Tile], max_range: int, reuse: bool, height: int, width: int
+) -> tuple[set[int], dict[int, int]]:
+    """
+    (flat tile indices, {duplicate index: first tile with byte-identical padded input and the same
+    output extent in the (height, width) image}).
+    """
+    limit = settings.tile_skip_flat_range * max_range / 255
+    flat: set[int] = set()
+    first: dict[tuple, int] = {}
+    reused: dict[int, int] = {}
+    for t in tiles:
+        patch = src[t.py0:t.py1, t.px0:t.px1]
+        lo, hi = patch.min(axis=(0, 1)), patch.max(axis=(0, 1))
+        if np.all(hi.astype(np.int64) - lo <= limit):
+            flat.add(t.index)
+            continue
+        if not reuse:
+            continue
+        # Same padded bytes at the same position relative to the core -> same model output; the core
+        # clipped to the image (_core_end) must match too, as _fill_skipped copies the whole of it
+        # Cores wholly in the mod padding write nothing: any of them stands for the others
+        end = _core_end(t, height, width) or (t.y0, t.x0)
+        key = (
+            patch.shape,
+            t.x0 - t.px0,
+            t.y0 - t.py0,
+            end[1] - t.x0,
+            end[0] - t.y0,
+            hashlib.blake2b(np.ascontiguousarray(patch).data, digest_size=16).digest(),
+        )
+        if key in first:
+            reused[t.index] = first[key]
+        else:
+            first[key] = t.index
+    return flat, reused
+
+
+def _interpolate_tile(src: np.ndarray, dst: np.ndarray, t: Tile, scale: int, y1: int, x1: int) -> None:
+    """Bicubic upscale of the padded tile, core written to dst (for near-constant tiles)."""
+    patch = src[t.py0:t.py1, t.px0:t.px1]
+    ph, pw = patch.shape[:2]
+    up = cv2.resize(patch, (pw * scale, ph * scale), interpolation=cv2.INTER_CUBIC)
+    oy0, ox0 = (t.y0 - t.py0) * scale, (t.x0 - t.px0) * scale
+    dst[t.y0 * scale:y1 * scale, t.x0 * scale:x1 * scale] = up[
+        oy0:oy0 + (y1 - t.y0) * scale, ox0:ox0 + (x1 - t.x0) * scale
+    ]
+
+
+def _blend_edges(dst: np.ndarray, box: tuple[int, int, int, int], sides: dict[str, bool], band: int) -> None:
+    """
+    Ramp an interpolated tile's output (box = output y0, y1, x0, x1) towards the pixels just outside
+    it on each side flagged True, over band pixels, so it meets its model-output neighbours seamlessly.
+    """
+    y0, y1, x0, x1 = box
+    for side, on in sides.items():
+        if not on:
+            continue
+        vertical = side in ("top", "bottom")
+        n = min(band, (y1 - y0 if vertical else x1 - x0) // 2)
+        if n <= 0:
+            continue
+        # weight of the neighbour's edge pixel: 1 at the seam fading to 0 at band pixels in
+        w = (1 - np.arange(1, n + 1, dtype=np.float32) / (n + 1))
+        if side == "top":
+            edge, region = dst[y0 - 1:y0, x0:x1], (slice(y0, y0 + n), slice(x0, x1))
+        elif side == "bottom":
+            edge, region = dst[y1:y1 + 1, x0:x1], (slice(y1 - n, y1), slice(x0, x1))
+            w = w[::-1]
+        elif side == "left":
+            edge, region = dst[y0:y1, x0 - 1:x0], (slice(y0, y1), slice(x0, x0 + n))
+        else:
+            edge, region = dst[y0:y1, x1:x1 + 1], (slice(y0, y1), slice(x1 - n, x1))
+            w = w[::-1]
+        shape = (n, 1) if vertical else (1, n)
+        w = w.reshape(shape + (1,) * (dst.ndim - 2))
+        current = dst[region].astype(np.float32)
+        dst[region] = (w * edge.astype(np.float32) + (1 - w) * current).round().astype(dst.dtype)
+
+
+def _run_plane(
+    src: np.ndarray,
+    dst: np.ndarray,
+    forward: Forward,
+    scale: int,
+    tile_size: int,
+    tile_pad: int,
+    batch_size: int,
+    max_range: int,
+    gray: bool,
+    on_tile: OnTile | None,
+    done_offset: int,
+    total: int,
+    skip: bool = False,
+    stats: TileStats | None = None,
+    shards: int = 1,
+    checkpoint: TileCheckpoint | None = None,
+    plane: str = "image",
+) -> int:
+    """Upscale src (HWC BGR or HW gray) tile by tile into dst; returns tiles processed."""
+    height, width = dst.shape[0] // scale, dst.shape[1] // scale
+    mod = _mod_scale(scale)
+    if mod is not None:
+        pad_h = (mod - src.shape[0] % mod) % mod
+        pad_w = (mod - src.shape[1] % mod) % mod
+        if pad_h or pad_w:
+            widths = ((0, pad_h), (0, pad_w)) + ((0, 0),) * (src.ndim - 2)
+            src = np.pad(src, widths, mode="reflect")
+    tiles = split_tiles(src.shape[0], src.shape[1], tile_size, tile_pad)
+    flat, reused = _classify(src, tiles, max_range, settings.tile_skip_reuse, height, width) if skip else (set(), {})
+    done = 0
+    model_tiles = [t for t in tiles if t.index not in flat and t.index not in reused]
+    batches = list(batch_tiles(model_tiles, batch_size))
+    markers = checkpoint.done(plane, len(batches)) if checkpoint is not None else None
+    pending = [i for i in range(len(batches)) if markers is None or not markers[i]]
+
+    def run_batch(batch: list[Tile]) -> int:
+        stacked = np.stack(
+            [_to_model_input(src[t.py0:t.py1, t.px0:t.px1], max_range, gray) for t in batch]
+        )
+        out = forward(stacked)
+        for t, out_tile in zip(batch, out):
+            end = _core_end(t, height, width)
+            if end is None:
+                continue
+            y1, x1 = end
+            oy0 = (t.y0 - t.py0) * scale
+            ox0 = (t.x0 - t.px0) * scale
+            core = out_tile[:, oy0:oy0 + (y1 - t.y0) * scale, ox0:ox0 + (x1 - t.x0) * scale]
+            dst[t.y0 * scale:y1 * scale, t.x0 * scale:x1 * scale] = _from_model_output(
+                core, max_range, gray, dst.dtype
+            )
+        return len(batch)
+
+    def run_marked(i: int) -> int:
+        # Marker after the tiles: a batch marked done is always fully in the canvas
+        n = run_batch(batches[i])
+        if markers is not None:
+            markers[i] = 1
+        return n
+
+    def batch_done(n: int) -> None:
+        nonlocal done
+        done += n
+        if on_tile is not None:
+            on_tile(done_offset + done, total)
+
+    todo = set(pending)
+    resumed = sum(len(b) for i, b in enumerate(batches) if i not in todo)
+    if resumed:
+        logger.info("tile checkpoint: %s/%s %s tiles already done, resuming", resumed, len(model_tiles), plane)
+        batch_done(resumed)
+    if shards > 1 and len(pending) > 1:
+        _sharding.run(pending, run_marked, shards, batch_done)
+    else:
+        for i in pending:
+            batch_done(run_marked(i))
+    if markers is not None:
+        markers.flush()
+
+    if flat or reused:
+        _fill_skipped(src, dst, tiles, flat, reused, scale, tile_pad, height, width)
+        done += len(flat) + len(reused)
+        if on_tile is not None:
+            on_tile(done_offset + done, total)
+    if stats is not None:
+        stats.tiles += len(tiles)
+        stats.flat += len(flat)
+        stats.reused += len(reused)
+    return done
+
+
+def _fill_skipped(
+    src: np.ndarray,
+    dst: np.ndarray,
+    tiles: list[Tile],
+    flat: set[int],
+    reused: dict[int, int],
+    scale: int,
+    tile_pad: int,
+    height: int,
+    width: int,
+) -> None:
+    """
+    Write reused tiles (copied from their model-output original, whose clipped core has the same
+    extent, see _classify) and flat tiles (interpolated, blended).
+    """
+    for index, original in reused.items():
+        t, o = tiles[index], tiles[original]
+        end = _core_end(t, height, width)
+        if end is None:
+            continue
+        y1, x1 = end
+        dst[t.y0 * scale:y1 * scale, t.x0 * scale:x1 * scale] = dst[
+            o.y0 * scale:(o.y0 + y1 - t.y0) * scale, o.x0 * scale:(o.x0 + x1 - t.x0) * scale
+        ]
+
+    band = settings.tile_skip_blend_px or tile_pad * scale
+    below_or_right = {(t.y0, t.x0): t for t in tiles}
+    above = {(t.y1, t.x0): t for t in tiles}
+    left = {(t.y0, t.x1): t for t in tiles}
+
+    def modelled(n: Tile | None) -> bool:
+        return n is not None and n.index not in flat and _core_end(n, height, width) is not None
+
+    for index in sorted(flat):
+        t = tiles[index]
+        end = _core_end(t, height, width)
+        if end is None:
+            continue
+        y1, x1 = end
+        _interpolate_tile(src, dst, t, scale, y1, x1)
+        sides = {
+            "top": modelled(above.get((t.y0, t.x0))),
+            "bottom": y1 < height and modelled(below_or_right.get((t.y1, t.x0))),
+            "left": modelled(left.get((t.y0, t.x0))),
+            "right": x1 < width and modelled(below_or_right.get((t.y0, t.x1))),
+        }
+        _blend_edges(dst, (t.y0 * scale, y1 * scale, t.x0 * scale, x1 * scale), sides, band)
+
+
+def count_tiles(height: int, width: int, tile_size: int, tile_pad: int, planes: int = 1) -> int:
+    return len(split_tiles(height, width, tile_size, tile_pad)) * planes
+
+
+def enhance(
+    img: np.ndarray,
+    forward: Forward,
+    scale: int,
+    tile_size: int,
+    tile_pad: int = 10,
+    batch_size: int = 1,
+    spill_dir: Path | None = None,
+    on_tile: OnTile | None = None,
+    skip: bool | None = None,
+    stats: TileStats | None = None,
+    shards: int | None = None,
+    checkpoint: TileCheckpoint | None = None,
+    alpha: str = "model",
+) -> np.ndarray:
+    """
+    Upscale an image as read by cv2.imread(IMREAD_UNCHANGED): BGR, BGRA or gray, 8 or 16 bit.
+    alpha is how BGRA alpha is upscaled (_alpha.STRATEGIES; "model" runs it through the network like
+    RealESRGANer's default alpha_upsampler); a fully opaque alpha plane is filled, not upscaled.
+    Returns an integer canvas (memmap in spill_dir when large) of the input's bit depth.
+    skip enables tile skipping (default settings.tile_skip); stats accumulates the tile counts.
+    shards > 1 (default settings.tile_shards) runs the tile batches in that many forked processes.
+    checkpoint: canvas and done batches persist there, and batches done by an earlier attempt are skipped.
+    """
+    height, width = img.shape[:2]
+    max_range = 65535 if np.max(img) > 256 else 255
+    dtype = np.uint16 if max_range == 65535 else np.uint8
+    gray = img.ndim == 2
+    has_alpha = not gray and img.shape[2] == 4
+    if has_alpha:
+        alpha = _alpha.choose(img[:, :, 3], alpha)
+        if stats is not None:
+            stats.alpha = alpha
+
+    global _fork_warned
+    shards = settings.tile_shards if shards is None else shards
+    if shards > 1 and not getattr(forward, "fork_safe", True):
+        if not _fork_warned:
+            _fork_warned = True
+            logger.warning("tile_shards=%s ignored: this backend / device cannot run in forked shards", shards)
+        shards = 1
+
+    out_shape = (height * scale, width * scale) + img.shape[2:]
+    if checkpoint is not None:
+        canvas = checkpoint.canvas(out_shape, dtype)
+    else:
+        canvas = allocate_canvas(out_shape, dtype, spill_dir, shared=shards > 1)
+    src = img
+
+    planes = 2 if has_alpha and alpha == "model" else 1
+    mod = _mod_scale(scale) or 1
+    total = count_tiles(-(-height // mod) * mod, -(-width // mod) * mod, tile_size, tile_pad, planes)
+    common = dict(
+        forward=forward,
+        scale=scale,
+        tile_size=tile_size,
+        tile_pad=tile_pad,
+        batch_size=batch_size,
+        max_range=max_range,
+        on_tile=on_tile,
+        total=total,
+        skip=settings.tile_skip if skip is None else skip,
+        stats=stats,
+        shards=shards,
+        checkpoint=checkpoint,
+    )
+    if gray:
+        _run_plane(src, canvas, gray=True, done_offset=0, **common)
+    elif has_alpha:
+        done = _run_plane(src[:, :, 0:3], canvas[:, :, 0:3], gray=False, done_offset=0, plane="color", **common)
+        if alpha == "model":
+            _run_plane(src[:, :, 3], canvas[:, :, 3], gray=True, done_offset=done, plane="alpha", **common)
+        else:
+            _alpha.upscale(src[:, :, 3], canvas[:, :, 0:3], canvas[:, :, 3], scale, alpha, max_range)
+    else:
+        _run_plane(src, canvas, gray=False, done_offset=0, **common)
+    if isinstance(canvas, np.memmap):
+        canvas.flush()
+    return canvas
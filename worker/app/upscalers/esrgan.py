@@ -2,9 +2,8 @@
 Original ESRGAN upscaler (deep RRDBNet from the ESRGAN paper).
 Uses the same RRDBNet architecture as Real-ESRGAN but with the original
 ESRGAN pre-trained weights. Good for illustrations/anime-style images.
-4× only in the model; 2× is done by 4× then downscale.
+4× only in the model; 2× is 4× then downscale, or 4× on a halved input (_scale_strategy).
 """
-import os
 import sys
 from pathlib import Path
 
@@ -12,12 +11,14 @@ import torchvision.transforms.functional as _tv_functional
 
 sys.modules["torchvision.transforms.functional_tensor"] = _tv_functional
 
-import cv2
-from basicsr.archs.rrdbnet_arch import RRDBNet
+import numpy as np
 from basicsr.utils.download_util import load_file_from_url
-from realesrgan import RealESRGANer
 
 from app.config import settings
+from app.upscalers import _alpha, _scale_strategy
+from app.upscalers._realesrgan_lib import enhance_rrdb, upscale_rrdb
+from app.upscalers._checkpoint import TileCheckpoint
+from app.upscalers._tiling import OnTile, TileStats
 
 # Official ESRGAN x4 model (RRDB, DF2KOST training)
 ESRGAN_X4_URL = (
@@ -27,9 +28,14 @@ ESRGAN_X4_URL = (
 WEIGHTS_DIR = Path(__file__).resolve().parent.parent.parent / "weights"
 
 
+def weights(model_scale: int = 4) -> Path:
+    """Weights file of the network (4× only; downloaded or not)."""
+    return WEIGHTS_DIR / "ESRGAN_x4.pth"
+
+
 def _get_esrgan_x4_path() -> str:
     WEIGHTS_DIR.mkdir(parents=True, exist_ok=True)
-    path = WEIGHTS_DIR / "ESRGAN_x4.pth"
+    path = weights()
     if path.is_file():
         return str(path)
     load_file_from_url(
@@ -42,47 +48,54 @@ def _get_esrgan_x4_path() -> str:
 
 
 def upscale(
-    input_path: Path,
-    output_path: Path,
+    img: np.ndarray,
     scale: int,
     tile: int | None = None,
-) -> None:
+    batch_size: int | None = None,
+    on_tile: OnTile | None = None,
+    strategy: str | None = None,
+    stats: TileStats | None = None,
+    checkpoint: TileCheckpoint | None = None,
+    spill_dir: Path | None = None,
+    alpha: str | None = None,
+) -> np.ndarray:
+    """
+    Upscale a decoded image (app.image layout); a large output is a memmap in spill_dir.
+    alpha overrides the method's alpha strategy for BGRA inputs (see _alpha).
+    """
     if scale not in (2, 4):
         raise ValueError("scale must be 2 or 4")
-    tile = tile or settings.real_esrgan_tile
-
-    # Original ESRGAN is 4× only; for 2× we run 4× then downscale
-    run_scale = 4
-    model_path = _get_esrgan_x4_path()
-
-    model = RRDBNet(
-        num_in_ch=3,
-        num_out_ch=3,
-        num_feat=64,
-        num_block=23,
-        num_grow_ch=32,
-        scale=4,
-    )
-    upsampler = RealESRGANer(
-        scale=4,
-        model_path=model_path,
-        model=model,
-        tile=tile,
-        tile_pad=10,
-        pre_pad=0,
-        half=(settings.real_esrgan_gpu_id is not None),
+    tile = settings.real_esrgan_tile if tile is None else tile
+    # Original ESRGAN is 4× only: 2× is 4× then downscale, or 4× on a halved input (half_input)
+    strategy = _scale_strategy.resolve("esrgan", scale, strategy)
+    return upscale_rrdb(
+        img,
+        _get_esrgan_x4_path(),
+        scale,
+        tile,
         gpu_id=settings.real_esrgan_gpu_id,
+        backend=settings.inference_backend("esrgan"),
+        precision=settings.precision("esrgan"),
+        method="esrgan",
+        batch_size=batch_size,
+        on_tile=on_tile,
+        strategy=strategy,
+        stats=stats,
+        checkpoint=checkpoint,
+        spill_dir=spill_dir,
+        alpha=_alpha.resolve("esrgan", alpha),
     )
 
-    img = cv2.imread(str(input_path), cv2.IMREAD_UNCHANGED)
-    if img is None:
-        raise RuntimeError(f"Failed to read image: {input_path}")
 
-    out_img, _ = upsampler.enhance(img, outscale=run_scale)
-
-    if scale == 2:
-        h, w = out_img.shape[:2]
-        out_img = cv2.resize(out_img, (w // 2, h // 2), interpolation=cv2.INTER_AREA)
-
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    cv2.imwrite(str(output_path), out_img)
+def warmup(scale: int = 4) -> None:
+    """Load the ESRGAN x4 model into the model cache and run one tiny tile."""
+    enhance_rrdb(
+        np.zeros((32, 32, 3), dtype=np.uint8),
+        _get_esrgan_x4_path(),
+        4,
+        settings.real_esrgan_tile,
+        gpu_id=settings.real_esrgan_gpu_id,
+        backend=settings.inference_backend("esrgan"),
+        precision=settings.precision("esrgan"),
+        method="esrgan",
+    )
@@ -1,10 +1,14 @@
 """Real-ESRGAN upscaler (general / real-world)."""
 from pathlib import Path
 
+import numpy as np
 from basicsr.utils.download_util import load_file_from_url
 
 from app.config import settings
-from app.upscalers._realesrgan_lib import upscale_rrdb
+from app.upscalers import _alpha, _scale_strategy
+from app.upscalers._realesrgan_lib import enhance_rrdb, upscale_rrdb
+from app.upscalers._checkpoint import TileCheckpoint
+from app.upscalers._tiling import OnTile, TileStats
 
 WEIGHTS_DIR = Path(__file__).resolve().parent.parent.parent / "weights"
 URLS = {
@@ -13,6 +17,15 @@ URLS = {
 }
 
 
+def _model_name(model_scale: int) -> str:
+    return "RealESRGAN_x2plus" if model_scale == 2 else "RealESRGAN_x4plus"
+
+
+def weights(model_scale: int) -> Path:
+    """Weights file of the network run at model_scale (downloaded or not)."""
+    return WEIGHTS_DIR / f"{_model_name(model_scale)}.pth"
+
+
 def _get_model_path(model_name: str) -> str:
     WEIGHTS_DIR.mkdir(parents=True, exist_ok=True)
     path = WEIGHTS_DIR / f"{model_name}.pth"
@@ -30,21 +43,56 @@ def _get_model_path(model_name: str) -> str:
 
 
 def upscale(
-    input_path: Path,
-    output_path: Path,
+    img: np.ndarray,
     scale: int,
     tile: int | None = None,
-) -> None:
+    batch_size: int | None = None,
+    on_tile: OnTile | None = None,
+    strategy: str | None = None,
+    stats: TileStats | None = None,
+    checkpoint: TileCheckpoint | None = None,
+    spill_dir: Path | None = None,
+    alpha: str | None = None,
+) -> np.ndarray:
+    """
+    Upscale a decoded image (app.image layout); a large output is a memmap in spill_dir.
+    alpha overrides the method's alpha strategy for BGRA inputs (see _alpha).
+    """
     if scale not in (2, 4):
         raise ValueError("scale must be 2 or 4")
-    tile = tile or settings.real_esrgan_tile
-    model_name = "RealESRGAN_x2plus" if scale == 2 else "RealESRGAN_x4plus"
-    model_path = _get_model_path(model_name)
-    upscale_rrdb(
-        input_path,
-        output_path,
-        model_path,
+    tile = settings.real_esrgan_tile if tile is None else tile
+    strategy = _scale_strategy.resolve("real_esrgan", scale, strategy)
+    model_scale = _scale_strategy.model_scale(strategy, scale)
+    model_name = _model_name(model_scale)
+    return upscale_rrdb(
+        img,
+        _get_model_path(model_name),
         scale,
         tile,
         gpu_id=settings.real_esrgan_gpu_id,
+        backend=settings.inference_backend("real_esrgan"),
+        precision=settings.precision("real_esrgan"),
+        method="real_esrgan",
+        batch_size=batch_size,
+        on_tile=on_tile,
+        strategy=strategy,
+        stats=stats,
+        checkpoint=checkpoint,
+        spill_dir=spill_dir,
+        alpha=_alpha.resolve("real_esrgan", alpha),
+    )
+
+
+def warmup(scale: int = 4) -> None:
+    """Load the model for scale into the model cache and run one tiny tile through it."""
+    model_name = "RealESRGAN_x2plus" if scale == 2 else "RealESRGAN_x4plus"
+    enhance_rrdb(
+        np.zeros((32, 32, 3), dtype=np.uint8),
+        _get_model_path(model_name),
+        scale,
+        settings.real_esrgan_tile,
+        gpu_id=settings.real_esrgan_gpu_id,
+        backend=settings.inference_backend("real_esrgan"),
+        precision=settings.precision("real_esrgan"),
+        method="real_esrgan",
     )
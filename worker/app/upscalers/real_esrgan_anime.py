@@ -1,12 +1,14 @@
 """Real-ESRGAN anime upscaler. Optimized for anime / illustrations."""
-import shutil
-import cv2
 from pathlib import Path
 
+import numpy as np
 from basicsr.utils.download_util import load_file_from_url
 
 from app.config import settings
-from app.upscalers._realesrgan_lib import upscale_rrdb
+from app.upscalers import _alpha, _scale_strategy
+from app.upscalers._realesrgan_lib import enhance_rrdb, upscale_rrdb
+from app.upscalers._checkpoint import TileCheckpoint
+from app.upscalers._tiling import OnTile, TileStats
 
 WEIGHTS_DIR = Path(__file__).resolve().parent.parent.parent / "weights"
 ANIME_URL = (
@@ -16,9 +18,14 @@ ANIME_URL = (
 MODEL_NAME = "RealESRGAN_x4plus_anime_6B"
 
 
+def weights(model_scale: int = 4) -> Path:
+    """Weights file of the network (4× only; downloaded or not)."""
+    return WEIGHTS_DIR / f"{MODEL_NAME}.pth"
+
+
 def _get_model_path() -> str:
     WEIGHTS_DIR.mkdir(parents=True, exist_ok=True)
-    path = WEIGHTS_DIR / f"{MODEL_NAME}.pth"
+    path = weights()
     if path.is_file():
         return str(path)
     load_file_from_url(
@@ -31,32 +38,56 @@ def _get_model_path() -> str:
 
 
 def upscale(
-    input_path: Path,
-    output_path: Path,
+    img: np.ndarray,
     scale: int,
     tile: int | None = None,
-) -> None:
+    batch_size: int | None = None,
+    on_tile: OnTile | None = None,
+    strategy: str | None = None,
+    stats: TileStats | None = None,
+    checkpoint: TileCheckpoint | None = None,
+    spill_dir: Path | None = None,
+    alpha: str | None = None,
+) -> np.ndarray:
+    """
+    Upscale a decoded image (app.image layout); a large output is a memmap in spill_dir.
+    alpha overrides the method's alpha strategy for BGRA inputs (see _alpha).
+    """
     if scale not in (2, 4):
         raise ValueError("scale must be 2 or 4")
-    tile = tile or settings.real_esrgan_tile
-    model_path = _get_model_path()
-    # Anime model is 4× only; for 2× we run 4× then downscale
-    run_scale = 4
-    tmp_out = output_path.parent / "anime_4x.png"
-    upscale_rrdb(
-        input_path,
-        tmp_out,
-        model_path,
-        run_scale,
+    tile = settings.real_esrgan_tile if tile is None else tile
+    # Anime model is 4× only: 2× is 4× then downscale, or 4× on a halved input (half_input)
+    strategy = _scale_strategy.resolve("real_esrgan_anime", scale, strategy)
+    return upscale_rrdb(
+        img,
+        _get_model_path(),
+        scale,
         tile,
         gpu_id=settings.real_esrgan_gpu_id,
+        backend=settings.inference_backend("real_esrgan_anime"),
+        precision=settings.precision("real_esrgan_anime"),
+        method="real_esrgan_anime",
+        num_block=6,
+        batch_size=batch_size,
+        on_tile=on_tile,
+        strategy=strategy,
+        stats=stats,
+        checkpoint=checkpoint,
+        spill_dir=spill_dir,
+        alpha=_alpha.resolve("real_esrgan_anime", alpha),
+    )
+
+
+def warmup(scale: int = 4) -> None:
+    """Load the anime model into the model cache and run one tiny tile (model is 4× for any scale)."""
+    enhance_rrdb(
+        np.zeros((32, 32, 3), dtype=np.uint8),
+        _get_model_path(),
+        4,
+        settings.real_esrgan_tile,
+        gpu_id=settings.real_esrgan_gpu_id,
+        backend=settings.inference_backend("real_esrgan_anime"),
+        precision=settings.precision("real_esrgan_anime"),
+        method="real_esrgan_anime",
         num_block=6,
     )
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    if scale == 2:
-        img = cv2.imread(str(tmp_out))
-        h, w = img.shape[:2]
-        img = cv2.resize(img, (w // 2, h // 2), interpolation=cv2.INTER_AREA)
-        cv2.imwrite(str(output_path), img)
-    else:
-        shutil.copy2(tmp_out, output_path)
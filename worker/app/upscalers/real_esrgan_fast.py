@@ -0,0 +1,105 @@
+"""
+Fast Real-ESRGAN upscaler (realesr-general-x4v3, SRVGGNetCompact).
+A small all-convolution network that upsamples only at the very end, several times faster than
+the 23-block RRDBNet on CPU at somewhat lower quality. Runs on the same tiling, model cache,
+ONNX and precision paths as the RRDB methods.
+4× only in the model; 2× is 4× then downscale, or 4× on a halved input (_scale_strategy).
+"""
+import sys
+from pathlib import Path
+
+import torchvision.transforms.functional as _tv_functional
+
+sys.modules["torchvision.transforms.functional_tensor"] = _tv_functional
+
+import numpy as np
+from basicsr.utils.download_util import load_file_from_url
+
+from app.config import settings
+from app.upscalers import _alpha, _scale_strategy
+from app.upscalers._realesrgan_lib import enhance_rrdb, upscale_rrdb
+from app.upscalers._checkpoint import TileCheckpoint
+from app.upscalers._tiling import OnTile, TileStats
+
+REALESR_GENERAL_X4V3_URL = (
+    "https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.5.0/realesr-general-x4v3.pth"
+)
+WEIGHTS_DIR = Path(__file__).resolve().parent.parent.parent / "weights"
+# realesr-general-x4v3 body: 32 conv + PReLU layers of 64 features
+NUM_CONV = 32
+
+
+def weights(model_scale: int = 4) -> Path:
+    """Weights file of the network (4× only; downloaded or not)."""
+    return WEIGHTS_DIR / "realesr-general-x4v3.pth"
+
+
+def _get_model_path() -> str:
+    WEIGHTS_DIR.mkdir(parents=True, exist_ok=True)
+    path = weights()
+    if path.is_file():
+        return str(path)
+    load_file_from_url(
+        url=REALESR_GENERAL_X4V3_URL,
+        model_dir=str(WEIGHTS_DIR),
+        progress=True,
+        file_name="realesr-general-x4v3.pth",
+    )
+    return str(path)
+
+
+def upscale(
+    img: np.ndarray,
+    scale: int,
+    tile: int | None = None,
+    batch_size: int | None = None,
+    on_tile: OnTile | None = None,
+    strategy: str | None = None,
+    stats: TileStats | None = None,
+    checkpoint: TileCheckpoint | None = None,
+    spill_dir: Path | None = None,
+    alpha: str | None = None,
+) -> np.ndarray:
+    """
+    Upscale a decoded image (app.image layout); a large output is a memmap in spill_dir.
+    alpha overrides the method's alpha strategy for BGRA inputs (see _alpha).
+    """
+    if scale not in (2, 4):
+        raise ValueError("scale must be 2 or 4")
+    tile = settings.real_esrgan_tile if tile is None else tile
+    strategy = _scale_strategy.resolve("real_esrgan_fast", scale, strategy)
+    return upscale_rrdb(
+        img,
+        _get_model_path(),
+        scale,
+        tile,
+        gpu_id=settings.real_esrgan_gpu_id,
+        num_block=NUM_CONV,
+        backend=settings.inference_backend("real_esrgan_fast"),
+        precision=settings.precision("real_esrgan_fast"),
+        method="real_esrgan_fast",
+        arch="srvgg",
+        batch_size=batch_size,
+        on_tile=on_tile,
+        strategy=strategy,
+        stats=stats,
+        checkpoint=checkpoint,
+        spill_dir=spill_dir,
+        alpha=_alpha.resolve("real_esrgan_fast", alpha),
+    )
+
+
+def warmup(scale: int = 4) -> None:
+    """Load the compact x4 model into the model cache and run one tiny tile."""
+    enhance_rrdb(
+        np.zeros((32, 32, 3), dtype=np.uint8),
+        _get_model_path(),
+        4,
+        settings.real_esrgan_tile,
+        gpu_id=settings.real_esrgan_gpu_id,
+        num_block=NUM_CONV,
+        backend=settings.inference_backend("real_esrgan_fast"),
+        precision=settings.precision("real_esrgan_fast"),
+        method="real_esrgan_fast",
+        arch="srvgg",
+    )
@@ -1,137 +1,204 @@
 """
-SwinIR upscaler: runs official SwinIR main_test_swinir.py via subprocess.
-Requires SwinIR repo at SWINIR_DIR (e.g. /app/SwinIR) with model downloaded.
-Streams SwinIR stdout/stderr to worker logs so you see what it's doing.
+SwinIR upscaler: in-process port of the official main_test_swinir.py real_sr path.
+Requires SwinIR repo at SWINIR_DIR (e.g. /app/SwinIR) for the network definition and model.
+The network is loaded once per worker process (model cache) and run tiled on an in-memory array,
+so concurrent jobs never share files and there is no per-job torch import or checkpoint reload.
 """
+import importlib.util
 import logging
 import os
-import shutil
-import subprocess
-import threading
 import time
 from pathlib import Path
 
+import numpy as np
+import torch
+
 from app.config import settings
+from app.image import color, eight_bit
+from app.upscalers import _alpha, _precision, _scale_strategy, _tiling
+from app.upscalers._checkpoint import TileCheckpoint
+from app.upscalers._model_cache import model_cache, torch_module_nbytes
 
 logger = logging.getLogger(__name__)
 
-
-def _stream_output(process: subprocess.Popen, prefix: str = "SwinIR") -> None:
-    """Read subprocess stdout line-by-line and log each line."""
-    if process.stdout is None:
-        return
-    for line in process.stdout:
-        line = (line or "").rstrip()
-        if line:
-            logger.info("%s: %s", prefix, line)
-
 SWINIR_DIR = Path(os.environ.get("SWINIR_DIR", "/app/SwinIR"))
 REAL_SR_MODEL = "003_realSR_BSRGAN_DFO_s64w8_SwinIR-M_x4_GAN.pth"
+# Optional native 2× real_sr model (same SwinIR-M hyperparameters); without it 2× runs the 4× model
+REAL_SR_MODEL_X2 = "003_realSR_BSRGAN_DFO_s64w8_SwinIR-M_x2_GAN.pth"
 MODEL_ZOO = SWINIR_DIR / "model_zoo" / "swinir"
+WINDOW_SIZE = 8
+TILE_OVERLAP = 32  # main_test_swinir.py default; tiles are padded by half of it
+HEARTBEAT_SECONDS = 30
+
+
+def weights(model_scale: int) -> Path:
+    """real_sr checkpoint of the network run at model_scale (present or not)."""
+    return MODEL_ZOO / (REAL_SR_MODEL_X2 if model_scale == 2 else REAL_SR_MODEL)
+
+
+def _device() -> torch.device:
+    return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+def _load_network_class():
+    """Import SwinIR from the repo checkout without putting SWINIR_DIR on sys.path."""
+    source = SWINIR_DIR / "models" / "network_swinir.py"
+    if not source.is_file():
+        raise RuntimeError(f"SwinIR repo not found at {SWINIR_DIR}")
+    spec = importlib.util.spec_from_file_location("swinir_network", source)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.SwinIR
+
+
+def _build_model(model_path: Path, scale: int) -> torch.nn.Module:
+    """real_sr SwinIR-M, same hyperparameters as main_test_swinir.define_model."""
+    net = _load_network_class()
+    model = net(
+        upscale=scale,
+        in_chans=3,
+        img_size=64,
+        window_size=WINDOW_SIZE,
+        img_range=1.0,
+        depths=[6, 6, 6, 6, 6, 6],
+        embed_dim=180,
+        num_heads=[6, 6, 6, 6, 6, 6],
+        mlp_ratio=2,
+        upsampler="nearest+conv",
+        resi_connection="1conv",
+    )
+    pretrained = torch.load(str(model_path), map_location="cpu")
+    param_key = "params_ema"
+    model.load_state_dict(pretrained[param_key] if param_key in pretrained else pretrained, strict=True)
+    model.eval()
+    return model.to(_device())
+
+
+def get_model(model_path: Path, scale: int) -> torch.nn.Module:
+    """Return the cached SwinIR network for these weights; loaded on first use per process."""
+    key = ("swinir", str(model_path), scale)
+    return model_cache.get(key, lambda: _build_model(model_path, scale), size_of=torch_module_nbytes)
+
+
+def get_forward(model_path: Path, scale: int, precision: str = "fp32") -> _tiling.Forward:
+    """Tile forward at the requested CPU precision (int8 = cached dynamic-quantized copy)."""
+    model = get_model(model_path, scale)
+    device = _device()
+    precision = _precision.resolve("swinir", precision, model, on_gpu=device.type == "cuda")
+    if precision == "int8":
+        key = ("swinir", str(model_path), scale, "int8")
+        model = model_cache.get(key, lambda: _precision.quantize_dynamic(model), size_of=torch_module_nbytes)
+    return _tiling.torch_forward(model, device, bf16=precision == "bf16")
+
+
+def _deadline_callback(deadline: float, on_tile: _tiling.OnTile | None = None) -> _tiling.OnTile:
+    """
+    Per-batch callback: raise TimeoutError past the deadline, log a heartbeat every
+    HEARTBEAT_SECONDS, then call the caller's on_tile (progress / cancel).
+    """
+    last_log = time.monotonic()
+
+    def callback(done: int, total: int) -> None:
+        nonlocal last_log
+        now = time.monotonic()
+        if now > deadline:
+            raise TimeoutError(f"SwinIR timed out after {settings.swinir_timeout_seconds} seconds")
+        if now - last_log >= HEARTBEAT_SECONDS:
+            logger.info("SwinIR still processing... tile %s/%s", done, total)
+            last_log = now
+        if on_tile is not None:
+            on_tile(done, total)
+
+    return callback
+
+
+def enhance(
+    img: np.ndarray,
+    scale: int,
+    tile: int | None = 256,
+    spill_dir: Path | None = None,
+    batch_size: int | None = None,
+    on_tile: _tiling.OnTile | None = None,
+    precision: str | None = None,
+    stats: _tiling.TileStats | None = None,
+    checkpoint: TileCheckpoint | None = None,
+    alpha: str = "model",
+) -> np.ndarray:
+    """
+    Upscale a BGR uint8 image with SwinIR real_sr at scale (4, or 2 with the x2 checkpoint); a BGRA
+    image's alpha plane is upscaled per alpha (see _alpha).
+    Tiles go through the shared engine (padded by half of main_test_swinir's overlap, centres
+    stitched), so memory is bounded by the tile rather than by full-size float accumulators.
+    The network pads each tile to a window_size multiple itself (SwinIR.check_image_size).
+    precision defaults to settings.precision("swinir").
+    """
+    model_path = weights(scale)
+    if not model_path.is_file():
+        raise FileNotFoundError(f"SwinIR model not found: {model_path}")
+    forward = get_forward(model_path, scale, precision or settings.precision("swinir"))
+    deadline = time.monotonic() + settings.swinir_timeout_seconds
+    return _tiling.enhance(
+        img,
+        forward,
+        scale,
+        tile or 0,
+        tile_pad=TILE_OVERLAP // 2,
+        batch_size=batch_size or settings.tile_batch_size,
+        spill_dir=spill_dir,
+        on_tile=_deadline_callback(deadline, on_tile),
+        stats=stats,
+        checkpoint=checkpoint,
+        alpha=alpha,
+    )
 
 
 def upscale(
-    input_path: Path,
-    output_path: Path,
+    img: np.ndarray,
     scale: int,
     tile: int | None = 256,
-) -> None:
+    batch_size: int | None = None,
+    on_tile: _tiling.OnTile | None = None,
+    strategy: str | None = None,
+    stats: _tiling.TileStats | None = None,
+    checkpoint: TileCheckpoint | None = None,
+    spill_dir: Path | None = None,
+    alpha: str | None = None,
+) -> np.ndarray:
+    """
+    Upscale a decoded image (app.image layout, taken as 8-bit); a large output is a memmap in spill_dir.
+    alpha overrides the alpha strategy for BGRA inputs (see _alpha).
+    """
     if scale not in (2, 4):
         raise ValueError("scale must be 2 or 4")
     if not SWINIR_DIR.is_dir():
         raise RuntimeError(f"SwinIR repo not found at {SWINIR_DIR}")
 
-    model_path = MODEL_ZOO / REAL_SR_MODEL
-    if not model_path.is_file():
-        raise FileNotFoundError(f"SwinIR model not found: {model_path}")
+    # The network is 8-bit BGR; a BGRA input keeps its alpha plane
+    img = eight_bit(img) if img.ndim == 3 and img.shape[2] == 4 else color(img)
+    h, w = img.shape[:2]
 
-    # real_sr uses x4 model; for 2x we run 4x then downscale below
-    run_scale = 4
-    folder_lq = input_path.parent
-    # Ensure input has a simple name for output lookup
-    input_name = input_path.stem
-
-    args = [
-        "python",
-        str(SWINIR_DIR / "main_test_swinir.py"),
-        "--task",
-        "real_sr",
-        "--scale",
-        str(run_scale),
-        "--folder_lq",
-        str(folder_lq),
-        "--model_path",
-        str(model_path),
-    ]
-    if tile:
-        args.extend(["--tile", str(tile)])
-
-    logger.info(
-        "SwinIR subprocess starting (if it doesn't print progress, the heartbeat is the only status until it finishes)"
-    )
-    process = subprocess.Popen(
-        args,
-        cwd=str(SWINIR_DIR),
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        bufsize=1,
-    )
-    reader = threading.Thread(
-        target=_stream_output,
-        args=(process,),
-        kwargs={"prefix": "SwinIR"},
-        daemon=True,
+    # 2×: the x2 real_sr model when present, else the x4 model on the full or halved input
+    strategy = _scale_strategy.resolve("swinir", scale, strategy)
+    start = time.monotonic()
+    out_img = enhance(
+        _scale_strategy.prepare_input(img, strategy),
+        _scale_strategy.model_scale(strategy, scale),
+        tile=tile,
+        spill_dir=spill_dir,
+        batch_size=batch_size,
+        on_tile=on_tile,
+        stats=stats,
+        checkpoint=checkpoint,
+        alpha=_alpha.resolve("swinir", alpha),
     )
-    reader.start()
+    logger.info("SwinIR finished in %.1f min (strategy=%s)", (time.monotonic() - start) / 60, strategy)
 
-    start = time.monotonic()
-    last_log = start
-    heartbeat_interval = 30  # every 30s when SwinIR doesn't print progress
-
-    try:
-        while process.poll() is None:
-            elapsed = time.monotonic() - start
-            if elapsed > settings.swinir_timeout_seconds:
-                process.kill()
-                process.wait()
-                raise TimeoutError(
-                    f"SwinIR timed out after {settings.swinir_timeout_seconds} seconds"
-                )
-            if time.monotonic() - last_log >= heartbeat_interval:
-                logger.info(
-                    "SwinIR still processing... (%.1f min elapsed)",
-                    elapsed / 60,
-                )
-                last_log = time.monotonic()
-            time.sleep(10)
-
-        reader.join(timeout=2)
-        returncode = process.returncode
-    except TimeoutError:
-        raise
-    except Exception:
-        process.kill()
-        process.wait()
-        raise
-
-    if returncode != 0:
-        raise RuntimeError("SwinIR failed (see SwinIR: ... lines above for details)")
-
-    # Output: results/swinir_real_sr_x4/{imgname}_SwinIR.png
-    save_dir = SWINIR_DIR / "results" / f"swinir_real_sr_x{run_scale}"
-    out_file = save_dir / f"{input_name}_SwinIR.png"
-    if not out_file.is_file():
-        raise RuntimeError(f"SwinIR did not produce {out_file}")
-
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-    if scale == 2 and run_scale == 4:
-        # Downscale 4x -> 2x
-        import cv2
-
-        img = cv2.imread(str(out_file))
-        h, w = img.shape[:2]
-        half = cv2.resize(img, (w // 2, h // 2), interpolation=cv2.INTER_AREA)
-        cv2.imwrite(str(output_path), half)
-    else:
-        shutil.copy2(out_file, output_path)
+    if scale == 2:
+        out_img = _scale_strategy.finish_output(out_img, h, w)
+    return out_img
+
+
+def warmup(scale: int = 4) -> None:
+    """Load the SwinIR network a job at this scale runs into the model cache and run one tiny tile."""
+    run_scale = _scale_strategy.model_scale(_scale_strategy.resolve("swinir", scale), scale)
+    enhance(np.zeros((32, 32, 3), dtype=np.uint8), run_scale, tile=None)
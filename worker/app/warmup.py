@@ -0,0 +1,100 @@
+"""
+Preload models in the Celery parent process before the prefork pool starts.
+Children are forked after this runs, so they share the weight pages copy-on-write
+instead of each loading its own copy, and the first real job skips lazy-init costs.
+"""
+import gc
+import logging
+import resource
+import time
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _rss_mb() -> float:
+    """Current resident set size in MB (VmRSS from /proc; peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _parse_entries(value: str) -> list[tuple[str, int]]:
+    """Parse 'real_esrgan:2,swinir' into [(method, scale)]; scale defaults to 4."""
+    entries = []
+    for item in value.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        method, _, scale = item.partition(":")
+        entries.append((method.strip(), int(scale) if scale else 4))
+    return entries
+
+
+def _warmup_fn(method: str):
+    # Imported lazily: each upscaler module pulls in torch and its model code
+    if method == "real_esrgan":
+        from app.upscalers import real_esrgan as module
+    elif method == "real_esrgan_anime":
+        from app.upscalers import real_esrgan_anime as module
+    elif method == "real_esrgan_fast":
+        from app.upscalers import real_esrgan_fast as module
+    elif method == "esrgan":
+        from app.upscalers import esrgan as module
+    elif method == "swinir":
+        from app.upscalers import swinir as module
+    elif method == "face_enhance":
+        from app.processors import face_enhance as module
+    else:
+        raise ValueError(f"Unknown method: {method}")
+    return module.warmup
+
+
+def preload_models() -> None:
+    """Load and warm up every model listed in settings.warmup_models. Failures are logged, not raised."""
+    entries = _parse_entries(settings.warmup_models)
+    if not entries:
+        return
+
+    import torch
+
+    # Run the dummy tiles single-threaded so no OpenMP worker threads exist in the
+    # parent at fork time (forking after a parallel region can hang the children).
+    threads = torch.get_num_threads()
+    torch.set_num_threads(1)
+    rss_before = _rss_mb()
+    loaded = []
+    try:
+        for method, scale in entries:
+            start = time.monotonic()
+            try:
+                _warmup_fn(method)(scale)
+            except Exception as e:
+                logger.exception("warmup failed method=%s scale=%s: %s", method, scale, e)
+                continue
+            loaded.append(f"{method}:{scale}")
+            logger.info(
+                "warmup loaded method=%s scale=%s in %.1fs rss_mb=%.0f",
+                method, scale, time.monotonic() - start, _rss_mb(),
+            )
+    finally:
+        torch.set_num_threads(threads)
+
+    # Move everything allocated so far out of the GC's reach so collections in the
+    # children don't touch (and un-share) the preloaded objects' pages.
+    gc.collect()
+    gc.freeze()
+
+    from app.upscalers._model_cache import model_cache
+
+    stats = model_cache.stats()
+    logger.info(
+        "warmup preloaded %s; rss_mb=%.0f (+%.0f) model_cache_mb=%.0f",
+        ", ".join(loaded) or "nothing", _rss_mb(), _rss_mb() - rss_before, stats["bytes"] / 1e6,
+    )
@@ -5,4 +5,5 @@ cd /app
 # Download weights in background so Celery starts immediately and picks up the queue.
 # Worker code also downloads missing weights on first use, so jobs can run while this finishes.
 python scripts/download_weights.py &
-exec celery -A app.celery_app worker -B --loglevel=info --concurrency=1 "$@"
+# WARMUP_MODELS are loaded before the pool forks, so children share them; raise WORKER_CONCURRENCY accordingly.
+exec celery -A app.celery_app worker -B --loglevel=info --concurrency="${WORKER_CONCURRENCY:-1}" "$@"
@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+"""
+Worker inference benchmarks. Needs the worker requirements and model weights
+(python scripts/download_weights.py). Run from the worker dir:
+
+  python scripts/benchmark.py batching --size 1024x768 --tile 192 --batch-sizes 1,2,4,8
+  python scripts/benchmark.py memory --size 4000x3000 --tile 256
+  python scripts/benchmark.py onnx --method real_esrgan_anime --tile 256 --tolerance 2
+  python scripts/benchmark.py precision --method swinir --test-set ~/upscaler-testset --modes fp32,bf16,int8
+  python scripts/benchmark.py skip --size 1920x1080 --tile 128
+  python scripts/benchmark.py shards --method swinir --size 1024x768 --tile 128 --shards 1,2,4,8
+  python scripts/benchmark.py x2 --method esrgan --test-set ~/upscaler-testset --output x2-esrgan.md
+  python scripts/benchmark.py denoise --size 4000x3000 --workers 1,2,4,8
+
+Pass --image to benchmark a real image instead of synthetic noise.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+WORKER_DIR = SCRIPT_DIR.parent
+sys.path.insert(0, str(WORKER_DIR))
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+
+RRDB_METHODS = ("real_esrgan", "real_esrgan_anime", "esrgan")
+TORCH_METHODS = RRDB_METHODS + ("swinir",)
+# cmd_x2 goes through each method's upscale(), so it also covers the compact model
+X2_METHODS = TORCH_METHODS + ("real_esrgan_fast",)
+
+
+def _load_image(args: argparse.Namespace) -> np.ndarray:
+    if args.image:
+        img = cv2.imread(args.image, cv2.IMREAD_UNCHANGED)
+        if img is None:
+            raise SystemExit(f"Failed to read image: {args.image}")
+        return img
+    return _synthetic_image(args.size, seed=0)
+
+
+def _synthetic_image(size: str, seed: int) -> np.ndarray:
+    w, h = (int(v) for v in size.lower().split("x"))
+    rng = np.random.default_rng(seed)
+    # Smooth noise looks more like a photo to the network than white noise
+    small = rng.integers(0, 256, (max(h // 8, 1), max(w // 8, 1), 3), dtype=np.uint8)
+    return cv2.resize(small, (w, h), interpolation=cv2.INTER_CUBIC)
+
+
+def _screenshot_image(size: str, seed: int) -> np.ndarray:
+    """Screenshot-like input: flat background, a few photo panels and a repeated icon row."""
+    w, h = (int(v) for v in size.lower().split("x"))
+    rng = np.random.default_rng(seed)
+    img = np.full((h, w, 3), 245, dtype=np.uint8)
+    img[: max(h // 12, 1)] = (60, 45, 40)  # title bar
+    for _ in range(3):
+        pw, ph = rng.integers(w // 8, w // 3), rng.integers(h // 8, h // 3)
+        x, y = rng.integers(0, w - pw), rng.integers(h // 12, h - ph)
+        img[y:y + ph, x:x + pw] = _synthetic_image(f"{pw}x{ph}", seed=int(rng.integers(1 << 16)))
+    # Identical icons on a 64 px grid, so tiles over them repeat byte for byte
+    icon = _synthetic_image("48x48", seed=seed + 1)
+    for x in range(0, w - 64, 64):
+        img[h - 64 + 8:h - 8, x + 8:x + 56] = icon
+    return img
+
+
+def _rrdb_model(method: str, scale: int) -> tuple[str, int, int]:
+    """(model_path, model_scale, num_block) for an RRDB method at a requested scale."""
+    if method == "real_esrgan":
+        from app.upscalers import real_esrgan
+
+        name = "RealESRGAN_x2plus" if scale == 2 else "RealESRGAN_x4plus"
+        return real_esrgan._get_model_path(name), scale, 23
+    if method == "real_esrgan_anime":
+        from app.upscalers import real_esrgan_anime
+
+        return real_esrgan_anime._get_model_path(), 4, 6
+    if method == "esrgan":
+        from app.upscalers import esrgan
+
+        return esrgan._get_esrgan_x4_path(), 4, 23
+    raise SystemExit(f"Not an RRDB method: {method}")
+
+
+def _timed(fn, repeat: int) -> tuple[float, object]:
+    """Best wall time over repeat runs (after the model is warm) and the last result."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def _max_diff(a: np.ndarray, b: np.ndarray) -> int:
+    return int(np.abs(a.astype(np.int32) - b.astype(np.int32)).max())
+
+
+def cmd_batching(args: argparse.Namespace) -> int:
+    """Per-tile RealESRGANer.enhance loop vs the worker tiling engine at several batch sizes."""
+    from app.config import settings
+    from app.upscalers import _tiling
+    from app.upscalers._realesrgan_lib import TILE_PAD, get_rrdb_upsampler
+
+    img = _load_image(args)
+    model_path, model_scale, num_block = _rrdb_model(args.method, args.scale)
+    upsampler = get_rrdb_upsampler(
+        model_path, model_scale, gpu_id=settings.real_esrgan_gpu_id, num_block=num_block
+    )
+    forward = _tiling.torch_forward(upsampler.model, upsampler.device, half=upsampler.half)
+    h, w = img.shape[:2]
+    n_tiles = len(_tiling.split_tiles(h, w, args.tile, TILE_PAD))
+    print(f"{args.method} x{model_scale} {w}x{h} tile={args.tile} tiles={n_tiles}")
+
+    # Warm up oneDNN kernels so the first timed run isn't penalised
+    _tiling.enhance(img[:64, :64], forward, model_scale, args.tile)
+
+    upsampler.tile_size = args.tile
+    base_t, base = _timed(lambda: upsampler.enhance(img, outscale=model_scale)[0], args.repeat)
+    upsampler.tile_size = 0
+    print(f"  RealESRGANer per-tile loop   {base_t:8.2f}s")
+    for bs in (int(v) for v in args.batch_sizes.split(",")):
+        t, out = _timed(
+            lambda: _tiling.enhance(img, forward, model_scale, args.tile, TILE_PAD, batch_size=bs),
+            args.repeat,
+        )
+        print(
+            f"  engine batch={bs:<3}            {t:8.2f}s  x{base_t / t:4.2f}  "
+            f"max_abs_diff={_max_diff(out, base)}"
+        )
+    return 0
+
+
+def cmd_onnx(args: argparse.Namespace) -> int:
+    """Torch vs ONNX Runtime through the tiling engine: time and pixel difference (exit 1 over tolerance)."""
+    from app import cpu_layout
+    from app.config import settings
+    from app.upscalers import _onnx, _tiling
+    from app.upscalers._realesrgan_lib import TILE_PAD, get_rrdb_upsampler
+
+    img = _load_image(args)
+    model_path, model_scale, num_block = _rrdb_model(args.method, args.scale)
+    upsampler = get_rrdb_upsampler(model_path, model_scale, num_block=num_block)
+    forwards = {
+        "torch": _tiling.torch_forward(upsampler.model, upsampler.device),
+        "onnx": _onnx.onnx_forward(_onnx.get_session(model_path, lambda: upsampler.model)),
+    }
+    h, w = img.shape[:2]
+    print(
+        f"{args.method} x{model_scale} {w}x{h} tile={args.tile} batch={args.batch_size} "
+        f"onnx threads intra={cpu_layout.onnx_threads() or 'default'} "
+        f"inter={settings.onnx_inter_op_threads or 'default'}"
+    )
+
+    outputs, times = {}, {}
+    for name, forward in forwards.items():
+        _tiling.enhance(img[:64, :64], forward, model_scale, args.tile)
+        times[name], outputs[name] = _timed(
+            lambda: _tiling.enhance(img, forward, model_scale, args.tile, TILE_PAD, args.batch_size),
+            args.repeat,
+        )
+        speedup = f"  x{times['torch'] / times[name]:4.2f}" if name != "torch" else ""
+        print(f"  {name:<6} {times[name]:8.2f}s{speedup}")
+
+    diff = np.abs(outputs["onnx"].astype(np.int32) - outputs["torch"].astype(np.int32))
+    over = float((diff > args.tolerance).mean() * 100)
+    print(f"  max_abs_diff={int(diff.max())} mean_abs_diff={diff.mean():.4f} over_tolerance={over:.4f}%")
+    if diff.max() > args.tolerance:
+        print(f"  FAIL: ONNX output differs from torch by more than {args.tolerance}")
+        return 1
+    return 0
+
+
+def _psnr(a: np.ndarray, b: np.ndarray) -> float:
+    mse = float(np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2))
+    return float("inf") if mse == 0 else 10 * np.log10(255.0**2 / mse)
+
+
+def _test_set(args: argparse.Namespace) -> list[tuple[str, np.ndarray]]:
+    """Images of --test-set (sorted, so the set is fixed), or --count seeded synthetic images."""
+    if not args.test_set:
+        return [(f"synthetic-{i}", _synthetic_image(args.size, seed=i)) for i in range(args.count)]
+    images = []
+    for path in sorted(Path(args.test_set).expanduser().iterdir()):
+        if path.suffix.lower() in (".png", ".jpg", ".jpeg", ".webp"):
+            img = cv2.imread(str(path), cv2.IMREAD_COLOR)
+            if img is not None:
+                images.append((path.name, img))
+    if not images:
+        raise SystemExit(f"No images in {args.test_set}")
+    return images
+
+
+def _precision_forward(method: str, scale: int, mode: str):
+    """(forward, model_scale, effective_mode) for a torch method at a CPU precision mode."""
+    from app.config import settings
+    from app.upscalers import _precision
+
+    if method == "swinir":
+        from app.upscalers import swinir
+
+        model_path = swinir.MODEL_ZOO / swinir.REAL_SR_MODEL
+        model = swinir.get_model(model_path, 4)
+        effective = _precision.resolve(method, mode, model, on_gpu=swinir._device().type == "cuda")
+        return swinir.get_forward(model_path, 4, mode), 4, effective
+
+    from app.upscalers._realesrgan_lib import get_rrdb_upsampler, rrdb_forward
+
+    model_path, model_scale, num_block = _rrdb_model(method, scale)
+    gpu_id = settings.real_esrgan_gpu_id
+    model = get_rrdb_upsampler(model_path, model_scale, gpu_id=gpu_id, num_block=num_block).model
+    effective = _precision.resolve(method, mode, model, on_gpu=gpu_id is not None)
+    forward = rrdb_forward(
+        model_path, model_scale, gpu_id=gpu_id, num_block=num_block, precision=mode, method=method
+    )
+    return forward, model_scale, effective
+
+
+def cmd_precision(args: argparse.Namespace) -> int:
+    """Speed and PSNR against fp32 of each CPU precision mode over a fixed test set."""
+    from app.upscalers import _tiling
+
+    pad = 16 if args.method == "swinir" else 10
+    images = _test_set(args)
+    modes = [m.strip() for m in args.modes.split(",")]
+    if "fp32" not in modes:
+        modes.insert(0, "fp32")
+    print(f"{args.method} x{args.scale} tile={args.tile} images={len(images)}")
+
+    reference: dict[str, np.ndarray] = {}
+    rows = []
+    for mode in modes:
+        forward, model_scale, effective = _precision_forward(args.method, args.scale, mode)
+        _tiling.enhance(images[0][1][:64, :64], forward, model_scale, args.tile, pad)
+        total, psnrs = 0.0, []
+        for name, img in images:
+            t, out = _timed(lambda: _tiling.enhance(img, forward, model_scale, args.tile, pad), args.repeat)
+            total += t
+            if mode == "fp32":
+                reference[name] = out
+            else:
+                psnrs.append(_psnr(out, reference[name]))
+        rows.append((mode, effective, total, psnrs))
+
+    base = rows[0][2]
+    lines = [
+        "| mode | runs as | time (s) | speedup | PSNR vs fp32 mean (dB) | min (dB) |",
+        "|---|---|---|---|---|---|",
+    ]
+    for mode, effective, total, psnrs in rows:
+        mean = f"{np.mean(psnrs):.2f}" if psnrs else "ref"
+        low = f"{min(psnrs):.2f}" if psnrs else "ref"
+        lines.append(f"| {mode} | {effective} | {total:.2f} | x{base / total:.2f} | {mean} | {low} |")
+    report = "\n".join(lines)
+    print(report)
+    if args.output:
+        Path(args.output).write_text(
+            f"# {args.method} x{args.scale} precision report\n\n"
+            f"Test set: {args.test_set or f'{args.count} synthetic {args.size}'}; tile {args.tile}.\n\n"
+            f"{report}\n"
+        )
+        print(f"saved {args.output}")
+    return 0
+
+
+def cmd_skip(args: argparse.Namespace) -> int:
+    """Tile skipping off vs on over screenshot-like inputs: time, skipped / reused tiles, PSNR vs off."""
+    from app.upscalers import _tiling
+
+    pad = 16 if args.method == "swinir" else 10
+    if args.test_set:
+        images = _test_set(args)
+    else:
+        images = [(f"screenshot-{i}", _screenshot_image(args.size, seed=i)) for i in range(args.count)]
+    forward, model_scale, _ = _precision_forward(args.method, args.scale, "fp32")
+    _tiling.enhance(images[0][1][:64, :64], forward, model_scale, args.tile, pad, skip=False)
+    print(f"{args.method} x{model_scale} tile={args.tile} images={len(images)}")
+
+    for name, img in images:
+        t_off, off = _timed(
+            lambda: _tiling.enhance(img, forward, model_scale, args.tile, pad, skip=False), args.repeat
+        )
+        stats = _tiling.TileStats()
+        t_on, on = _timed(
+            lambda: _tiling.enhance(img, forward, model_scale, args.tile, pad, skip=True, stats=stats),
+            args.repeat,
+        )
+        # stats accumulate over repeats
+        runs = max(args.repeat, 1)
+        print(
+            f"  {name:<16} off {t_off:7.2f}s  on {t_on:7.2f}s  x{t_off / t_on:4.2f}  "
+            f"tiles={stats.tiles // runs} flat={stats.flat // runs} reused={stats.reused // runs}  "
+            f"PSNR vs off {_psnr(on, off):.2f} dB"
+        )
+    return 0
+
+
+def cmd_shards(args: argparse.Namespace) -> int:
+    """Scaling of one image's tile loop over 1..N forked shard processes (TILE_SHARDS)."""
+    from app.upscalers import _sharding, _tiling
+
+    pad = 16 if args.method == "swinir" else 10
+    img = _load_image(args)
+    forward, model_scale, _ = _precision_forward(args.method, args.scale, "fp32")
+    h, w = img.shape[:2]
+    n_tiles = len(_tiling.split_tiles(h, w, args.tile, pad))
+    print(f"{args.method} x{model_scale} {w}x{h} tile={args.tile} batch={args.batch_size} tiles={n_tiles}")
+    _tiling.enhance(img[:64, :64], forward, model_scale, args.tile, pad, shards=1)
+
+    base_t, base = None, None
+    for n in (int(v) for v in args.shards.split(",")):
+        t, out = _timed(
+            lambda: _tiling.enhance(
+                img, forward, model_scale, args.tile, pad, batch_size=args.batch_size, shards=n
+            ),
+            args.repeat,
+        )
+        if base_t is None:
+            base_t, base = t, out
+        print(
+            f"  shards={n:<3} threads/shard={_sharding.shard_threads(n):<3} {t:8.2f}s  "
+            f"x{base_t / t:4.2f}  max_abs_diff={_max_diff(out, base)}"
+        )
+    return 0
+
+
+def cmd_x2(args: argparse.Namespace) -> int:
+    """2× strategies through the method's upscale(): time and PSNR against 4×-then-downscale."""
+    import importlib
+
+    from app.upscalers import _scale_strategy
+
+    module = importlib.import_module(f"app.upscalers.{args.method}")
+    images = _test_set(args)
+    strategies = [s.strip() for s in args.strategies.split(",")]
+    if "downscale" not in strategies:
+        strategies.insert(0, "downscale")
+    print(f"{args.method} x2 tile={args.tile} images={len(images)}")
+
+    reference: dict[str, np.ndarray] = {}
+    rows = []
+    for strategy in strategies:
+        total, psnrs = 0.0, []
+        used = _scale_strategy.resolve(args.method, 2, strategy)
+        for name, img in images:
+            t, out = _timed(lambda: module.upscale(img, 2, tile=args.tile, strategy=strategy), args.repeat)
+            total += t
+            out = np.asarray(out)
+            if strategy == "downscale":
+                reference[name] = out
+            else:
+                psnrs.append(_psnr(out, reference[name]))
+        rows.append((strategy, used, total, psnrs))
+
+    base = rows[0][2]
+    lines = [
+        "| strategy | runs as | time (s) | speedup | PSNR vs downscale mean (dB) | min (dB) |",
+        "|---|---|---|---|---|---|",
+    ]
+    for strategy, used, total, psnrs in rows:
+        mean = f"{np.mean(psnrs):.2f}" if psnrs else "ref"
+        low = f"{min(psnrs):.2f}" if psnrs else "ref"
+        lines.append(f"| {strategy} | {used} | {total:.2f} | x{base / total:.2f} | {mean} | {low} |")
+    report = "\n".join(lines)
+    print(report)
+    if args.output:
+        Path(args.output).write_text(
+            f"# {args.method} 2× strategy report\n\n"
+            f"Test set: {args.test_set or f'{args.count} synthetic {args.size}'}; tile {args.tile}.\n\n"
+            f"{report}\n"
+        )
+        print(f"saved {args.output}")
+    return 0
+
+
+def cmd_denoise(args: argparse.Namespace) -> int:
+    """Banded denoise over 1..N threads and the bilateral option: time and PSNR vs one nlmeans call."""
+    from app.processors import denoise
+
+    if args.test_set:
+        images = _test_set(args)
+    else:
+        # Smooth synthetic photos plus gaussian noise, so there is something to remove
+        rng = np.random.default_rng(0)
+        images = []
+        for i in range(args.count):
+            clean = _synthetic_image(args.size, seed=i)
+            noisy = np.clip(clean + rng.normal(0, args.sigma, clean.shape), 0, 255).astype(np.uint8)
+            images.append((f"noisy-{i}", noisy))
+    workers = [int(v) for v in args.workers.split(",")]
+    print(f"denoise images={len(images)} workers={workers}")
+    for name, img in images:
+        h, w = img.shape[:2]
+        t_ref, ref = _timed(
+            lambda: cv2.fastNlMeansDenoisingColored(
+                img, None, denoise.NLM_H, denoise.NLM_H, denoise.NLM_TEMPLATE, denoise.NLM_SEARCH
+            ),
+            args.repeat,
+        )
+        print(f"  {name} {w}x{h}: single nlmeans call {t_ref:.2f}s")
+        for method in denoise.METHODS:
+            for n in workers:
+                t, out = _timed(lambda: denoise.denoise(img, method, n), args.repeat)
+                print(
+                    f"    {method:<10} workers={n:<3} {t:8.2f}s  x{t_ref / t:5.2f}  "
+                    f"PSNR vs single call {_psnr(out, ref):6.2f} dB  max_abs_diff={_max_diff(out, ref)}"
+                )
+    return 0
+
+
+def _memory_child(args: argparse.Namespace) -> int:
+    """Run one upscale + PNG encode in this process (invoked by cmd_memory)."""
+    from app.config import settings
+    from app.upscalers import _tiling
+    from app.upscalers._realesrgan_lib import TILE_PAD, get_rrdb_upsampler
+
+    img = _load_image(args)
+    model_path, model_scale, num_block = _rrdb_model(args.method, args.scale)
+    upsampler = get_rrdb_upsampler(
+        model_path, model_scale, gpu_id=settings.real_esrgan_gpu_id, num_block=num_block
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        out_path = Path(tmpdir) / "output.png"
+        if args.variant == "legacy":
+            upsampler.tile_size = args.tile
+            out, _ = upsampler.enhance(img, outscale=model_scale)
+        else:
+            forward = _tiling.torch_forward(upsampler.model, upsampler.device, half=upsampler.half)
+            out = _tiling.enhance(img, forward, model_scale, args.tile, TILE_PAD, spill_dir=Path(tmpdir))
+        cv2.imwrite(str(out_path), out)
+    return 0
+
+
+def cmd_memory(args: argparse.Namespace) -> int:
+    """Peak RSS of RealESRGANer.enhance vs the engine with a memmap canvas (fresh process each)."""
+    from app.upscalers._realesrgan_lib import TILE_PAD
+    from app.upscalers._tiling import count_tiles
+
+    img = _load_image(args)
+    h, w = img.shape[:2]
+    print(
+        f"{args.method} x{args.scale} {w}x{h} tile={args.tile} "
+        f"tiles={count_tiles(h, w, args.tile, TILE_PAD)}"
+    )
+    passthrough = ["--size", args.size, "--method", args.method, "--scale", str(args.scale)]
+    if args.image:
+        passthrough += ["--image", args.image]
+    for variant in ("legacy", "engine"):
+        cmd = [
+            sys.executable, __file__, *passthrough,
+            "_memory-child", "--tile", str(args.tile), "--variant", variant,
+        ]
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, env={**os.environ, "MEMMAP_CANVAS_MIN_MB": "0"})
+        # wait4 reports the child's own peak RSS (ru_maxrss, KB on Linux)
+        _, status, usage = os.wait4(proc.pid, 0)
+        if os.waitstatus_to_exitcode(status) != 0:
+            raise SystemExit(f"{variant} run failed")
+        print(f"  {variant:<8} peak_rss_mb={usage.ru_maxrss / 1024:8.0f}  {time.perf_counter() - start:8.2f}s")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", help="input image (default: synthetic, see --size)")
+    parser.add_argument("--size", default="1024x768", help="synthetic input WxH")
+    parser.add_argument("--method", default="real_esrgan", choices=X2_METHODS)
+    parser.add_argument("--scale", type=int, default=4, choices=(2, 4))
+    parser.add_argument("--repeat", type=int, default=1, help="runs per variant (best time reported)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("batching", help=cmd_batching.__doc__)
+    p.add_argument("--tile", type=int, default=192)
+    p.add_argument("--batch-sizes", default="1,2,4,8")
+    p.set_defaults(func=cmd_batching)
+
+    p = sub.add_parser("memory", help=cmd_memory.__doc__)
+    p.add_argument("--tile", type=int, default=256)
+    p.set_defaults(func=cmd_memory)
+
+    p = sub.add_parser("onnx", help=cmd_onnx.__doc__)
+    p.add_argument("--tile", type=int, default=256)
+    p.add_argument("--batch-size", type=int, default=1)
+    p.add_argument("--tolerance", type=int, default=2, help="max allowed per-pixel difference (8-bit levels)")
+    p.set_defaults(func=cmd_onnx)
+
+    p = sub.add_parser("precision", help=cmd_precision.__doc__)
+    p.add_argument("--test-set", help="directory of test images (default: --count synthetic images)")
+    p.add_argument("--count", type=int, default=4)
+    p.add_argument("--modes", default="fp32,bf16,int8")
+    p.add_argument("--tile", type=int, default=256)
+    p.add_argument("--output", help="also write the report as markdown")
+    p.set_defaults(func=cmd_precision)
+
+    p = sub.add_parser("skip", help=cmd_skip.__doc__)
+    p.add_argument("--test-set", help="directory of test images (default: --count synthetic screenshots)")
+    p.add_argument("--count", type=int, default=3)
+    p.add_argument("--tile", type=int, default=128)
+    p.set_defaults(func=cmd_skip)
+
+    p = sub.add_parser("shards", help=cmd_shards.__doc__)
+    p.add_argument("--tile", type=int, default=128)
+    p.add_argument("--batch-size", type=int, default=1)
+    p.add_argument("--shards", default="1,2,4", help="shard counts to compare (first is the baseline)")
+    p.set_defaults(func=cmd_shards)
+
+    p = sub.add_parser("x2", help=cmd_x2.__doc__)
+    p.add_argument("--test-set", help="directory of test images (default: --count synthetic images)")
+    p.add_argument("--count", type=int, default=4)
+    p.add_argument("--strategies", default="downscale,native,half_input")
+    p.add_argument("--tile", type=int, default=256)
+    p.add_argument("--output", help="also write the report as markdown")
+    p.set_defaults(func=cmd_x2)
+
+    p = sub.add_parser("denoise", help=cmd_denoise.__doc__)
+    p.add_argument("--test-set", help="directory of test images (default: --count noisy synthetic images)")
+    p.add_argument("--count", type=int, default=2)
+    p.add_argument("--sigma", type=float, default=10.0, help="noise added to synthetic images (8-bit levels)")
+    p.add_argument("--workers", default="1,2,4", help="thread counts to compare")
+    p.set_defaults(func=cmd_denoise)
+
+    p = sub.add_parser("_memory-child")
+    p.add_argument("--tile", type=int, default=256)
+    p.add_argument("--variant", choices=("legacy", "engine"), required=True)
+    p.set_defaults(func=_memory_child)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Measure per-tile inference memory and time on this host for the tile planner
+(app/upscalers/_tile_planner.py) and save them to weights/tile_calibration.json.
+Needs the worker requirements and model weights. Run from the worker dir, on the
+same machine (and GPU setting) as the worker, ideally while it is idle:
+
+  python scripts/calibrate_tiles.py
+  python scripts/calibrate_tiles.py --methods real_esrgan:4,swinir:4 --tiles 128,256,512 --batch-sizes 1,2
+
+Each (tile, batch) point runs in a fresh process so its peak memory is its own.
+Points that fail (e.g. out of memory) are reported and skipped.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+WORKER_DIR = SCRIPT_DIR.parent
+sys.path.insert(0, str(WORKER_DIR))
+
+import numpy as np  # noqa: E402
+
+DEFAULT_METHODS = "real_esrgan:4,real_esrgan:2,real_esrgan_anime:4,real_esrgan_fast:4,esrgan:4,swinir:4"
+
+
+def _forward(method: str, scale: int):
+    """(forward, on_gpu) for the network a job with this method runs at this model scale."""
+    from app.config import settings
+    from app.upscalers import _tiling
+
+    if method == "swinir":
+        from app.upscalers import swinir
+
+        name = swinir.REAL_SR_MODEL_X2 if scale == 2 else swinir.REAL_SR_MODEL
+        model = swinir.get_model(swinir.MODEL_ZOO / name, scale)
+        device = swinir._device()
+        return _tiling.torch_forward(model, device), device.type == "cuda"
+
+    from app.upscalers._realesrgan_lib import get_rrdb_upsampler
+
+    arch = "rrdb"
+    if method == "real_esrgan":
+        from app.upscalers import real_esrgan
+
+        name = "RealESRGAN_x2plus" if scale == 2 else "RealESRGAN_x4plus"
+        model_path, num_block = real_esrgan._get_model_path(name), 23
+    elif method == "real_esrgan_fast":
+        from app.upscalers import real_esrgan_fast
+
+        model_path, num_block = real_esrgan_fast._get_model_path(), real_esrgan_fast.NUM_CONV
+        arch = "srvgg"
+    elif method == "real_esrgan_anime":
+        from app.upscalers import real_esrgan_anime
+
+        model_path, num_block = real_esrgan_anime._get_model_path(), 6
+    elif method == "esrgan":
+        from app.upscalers import esrgan
+
+        model_path, num_block = esrgan._get_esrgan_x4_path(), 23
+    else:
+        raise SystemExit(f"Unknown method: {method}")
+    upsampler = get_rrdb_upsampler(
+        model_path, scale, gpu_id=settings.real_esrgan_gpu_id, num_block=num_block, arch=arch
+    )
+    forward = _tiling.torch_forward(upsampler.model, upsampler.device, half=upsampler.half)
+    return forward, upsampler.device.type == "cuda"
+
+
+def _rss_bytes() -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _child(args: argparse.Namespace) -> int:
+    """Measure one (tile, batch) point; prints one JSON line."""
+    from app.upscalers._tile_planner import TILE_PADS
+
+    forward, on_gpu = _forward(args.method, args.scale)
+    side = args.tile + 2 * TILE_PADS[args.method]
+    batch = np.random.default_rng(0).random((args.batch, 3, side, side), dtype=np.float32)
+    forward(batch[:1, :, :32, :32])  # load kernels outside the measurement
+
+    if on_gpu:
+        import torch
+
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+        baseline = torch.cuda.memory_allocated()
+    else:
+        baseline = _rss_bytes()
+    seconds = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        forward(batch)
+        seconds = min(seconds, time.perf_counter() - start)
+    if on_gpu:
+        peak = torch.cuda.max_memory_allocated() - baseline
+    else:
+        # ru_maxrss also covers the model load, so this errs on the high side
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - baseline
+    print(json.dumps({
+        "tile": args.tile,
+        "batch": args.batch,
+        "pixels": side * side,
+        "peak_bytes": max(peak, 0),
+        "seconds": seconds,
+        "device": "cuda" if on_gpu else "cpu",
+    }))
+    return 0
+
+
+def _fit(samples: list[dict]) -> tuple[float, float]:
+    """Least-squares fixed_bytes + bytes_per_pixel * (pixels * batch) over the measured points."""
+    x = np.array([s["pixels"] * s["batch"] for s in samples], dtype=np.float64)
+    y = np.array([s["peak_bytes"] for s in samples], dtype=np.float64)
+    if len(set(x.tolist())) < 2:
+        return 0.0, float(y.max() / x.max())
+    slope, intercept = np.polyfit(x, y, 1)
+    return max(float(intercept), 0.0), max(float(slope), 1.0)
+
+
+def main() -> int:
+    from app.upscalers._tile_planner import CALIBRATION_PATH
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--methods", default=DEFAULT_METHODS, help="method:model_scale list")
+    parser.add_argument("--tiles", default="128,192,256,384,512")
+    parser.add_argument("--batch-sizes", default="1,2,4")
+    parser.add_argument("--repeat", type=int, default=2, help="timed runs per point (best kept)")
+    parser.add_argument("--output", type=Path, default=CALIBRATION_PATH)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--method", help=argparse.SUPPRESS)
+    parser.add_argument("--scale", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--tile", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--batch", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return _child(args)
+
+    try:
+        data = json.loads(args.output.read_text())
+    except FileNotFoundError:
+        data = {}
+    models = data.get("models", {})
+    device = data.get("device")
+
+    for entry in args.methods.split(","):
+        method, _, scale = entry.strip().partition(":")
+        scale = int(scale or 4)
+        key = f"{method}:{scale}"
+        print(f"{key}")
+        samples = []
+        for tile in (int(v) for v in args.tiles.split(",")):
+            for batch in (int(v) for v in args.batch_sizes.split(",")):
+                cmd = [
+                    sys.executable, __file__, "--child", "--method", method, "--scale", str(scale),
+                    "--tile", str(tile), "--batch", str(batch), "--repeat", str(args.repeat),
+                ]
+                proc = subprocess.run(cmd, capture_output=True, text=True, env=os.environ)
+                if proc.returncode != 0:
+                    print(f"  tile={tile:<5} batch={batch:<3} failed (exit {proc.returncode}); skipping larger batches")
+                    break
+                sample = json.loads(proc.stdout.strip().splitlines()[-1])
+                device = sample.pop("device")
+                samples.append(sample)
+                print(
+                    f"  tile={tile:<5} batch={batch:<3} peak_mb={sample['peak_bytes'] / 1e6:8.0f}  "
+                    f"{sample['seconds']:7.2f}s/batch"
+                )
+        if not samples:
+            print("  no successful runs; keeping previous calibration")
+            continue
+        fixed, per_pixel = _fit(samples)
+        models[key] = {"fixed_bytes": fixed, "bytes_per_pixel": per_pixel, "samples": samples}
+        print(f"  fit: fixed_mb={fixed / 1e6:.0f} bytes_per_pixel={per_pixel:.0f}")
+
+    from app.config import settings
+
+    data.update({
+        "device": device,
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "worker_concurrency": settings.worker_concurrency,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "models": models,
+    })
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    args.output.write_text(json.dumps(data, indent=2))
+    print(f"saved {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -36,6 +36,10 @@ DOWNLOADS = [
         "https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.2.4/RealESRGAN_x4plus_anime_6B.pth",
         WEIGHTS_DIR / "RealESRGAN_x4plus_anime_6B.pth",
     ),
+    (
+        "https://github.com/xinntao/Real-ESRGAN/releases/download/v0.2.5.0/realesr-general-x4v3.pth",
+        WEIGHTS_DIR / "realesr-general-x4v3.pth",
+    ),
     (
         "https://github.com/xinntao/Real-ESRGAN/releases/download/v0.1.1/ESRGAN_SRx4_DF2KOST_official-ff704c30.pth",
         WEIGHTS_DIR / "ESRGAN_x4.pth",
@@ -0,0 +1,36 @@
+import cv2
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.upscalers import _tile_planner
+
+
+@pytest.fixture(autouse=True)
+def isolated_settings(monkeypatch, tmp_path):
+    """Keep host setup (shards, calibration file, storage dir) out of the tests."""
+    monkeypatch.setattr(settings, "tile_shards", 1)
+    monkeypatch.setattr(settings, "local_storage_path", str(tmp_path / "storage"))
+    monkeypatch.setattr(_tile_planner, "_calibration", {})
+
+
+@pytest.fixture
+def fake_forward():
+    """
+    forward(scale) for the tiling engine without a model: a 3x3 box blur (so tiles depend on
+    their padding, like a network) then nearest-neighbour upscaling. NCHW float32 in and out.
+    """
+
+    def make(scale: int):
+        def forward(batch: np.ndarray) -> np.ndarray:
+            blurred = np.stack([np.stack([cv2.blur(plane, (3, 3)) for plane in tile]) for tile in batch])
+            return np.repeat(np.repeat(blurred, scale, axis=2), scale, axis=3)
+
+        return forward
+
+    return make
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.upscalers import _alpha
+
+SCALE = 4
+
+
+def _planes(rng, height=90, width=70):
+    alpha = rng.integers(0, 255, (height, width), dtype=np.uint8)
+    color = rng.integers(0, 255, (height * SCALE, width * SCALE, 3), dtype=np.uint8)
+    return alpha, color
+
+
+def _upscale(alpha, color, strategy):
+    dst = np.zeros(color.shape[:2], dtype=np.uint8)
+    _alpha.upscale(alpha, color, dst, SCALE, strategy, 255)
+    return dst
+
+
+@pytest.mark.parametrize("strategy", ["interpolate", "guided"])
+def test_bands_match_whole_image(monkeypatch, rng, strategy):
+    """Banded alpha upscaling reads enough context that every band equals a whole-image pass."""
+    alpha, color = _planes(rng)
+    whole = _upscale(alpha, color, strategy)
+    monkeypatch.setattr(_alpha, "BAND_PIXELS", 20_000)
+    np.testing.assert_array_equal(_upscale(alpha, color, strategy), whole)
+
+
+def test_opaque_alpha_is_filled(rng):
+    alpha = np.full((10, 12), 255, dtype=np.uint8)
+    assert _alpha.choose(alpha, "model") == _alpha.OPAQUE
+    assert _alpha.choose(alpha[:, :6] // 2, "guided") == "guided"
+    dst = np.zeros((40, 48), dtype=np.uint8)
+    _alpha.upscale(alpha, np.zeros((40, 48, 3), np.uint8), dst, SCALE, _alpha.OPAQUE, 255)
+    assert (dst == 255).all()
+
+
+def test_resolve(monkeypatch):
+    monkeypatch.setattr(settings, "alpha_strategies", "real_esrgan:guided,swinir:bogus")
+    assert _alpha.resolve("real_esrgan") == "guided"
+    assert _alpha.resolve("real_esrgan", "interpolate") == "interpolate"
+    assert _alpha.resolve("swinir") == "model"
+    assert _alpha.resolve("esrgan") == "model"
@@ -0,0 +1,74 @@
+import uuid
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app import encode
+from app.image import Frame
+from app.processors import background_remove, denoise
+from app.tasks import batch
+
+
+class FakeStorage:
+    """The original pixels of the claimed jobs, by key."""
+
+    def __init__(self, originals):
+        self.originals = originals
+
+    def get_to_file(self, key, path):
+        encode.write_png(self.originals[key], path, 1)
+
+
+class FakeRedis:
+    def rpush(self, key, *values):
+        pass
+
+    def expire(self, key, seconds):
+        pass
+
+    def delete(self, key):
+        pass
+
+
+def _job(denoise_first):
+    job_id = uuid.uuid4()
+    return SimpleNamespace(
+        id=job_id, method="background_remove", denoise_first=denoise_first, original_key=f"originals/{job_id}"
+    )
+
+
+@pytest.fixture
+def segmented(monkeypatch):
+    """The frames run_batch is given, in order; results and failures are only recorded."""
+    frames = []
+
+    def run_batch(batch_frames, model=None):
+        frames.extend(batch_frames)
+        return [f.with_pixels(np.dstack([f.pixels, f.pixels[:, :, 0]])) for f in batch_frames]
+
+    monkeypatch.setattr(background_remove, "run_batch", run_batch)
+    monkeypatch.setattr(batch, "redis_client", FakeRedis)
+    monkeypatch.setattr(batch, "_upload_result", lambda job_id, path, storage, encoded: None)
+    monkeypatch.setattr(batch, "_fail_job", lambda job_id, e: pytest.fail(f"{job_id} failed: {e}"))
+    return frames
+
+
+@pytest.mark.parametrize("denoise_first", [False, True])
+def test_each_batched_job_runs_its_own_prepare_step(monkeypatch, tmp_path, rng, segmented, denoise_first):
+    """A claimed job with denoise_first is denoised before segmentation, like it would be alone."""
+    own, other = _job(False), _job(denoise_first)
+    pixels = {str(j.id): rng.integers(0, 255, (40, 30, 3), dtype=np.uint8) for j in (own, other)}
+    monkeypatch.setattr(batch, "_claim", lambda job_id, ids: [other])
+    input_path = tmp_path / "input"
+    encode.write_png(pixels[str(own.id)], input_path, 1)
+    storage = FakeStorage({other.original_key: pixels[str(other.id)]})
+
+    batch.run(own, input_path, tmp_path, [str(own.id), str(other.id)], storage)
+
+    assert len(segmented) == 2
+    np.testing.assert_array_equal(segmented[0].pixels, pixels[str(own.id)])
+    expected = pixels[str(other.id)]
+    if denoise_first:
+        expected = denoise.run(Frame(expected)).pixels
+    np.testing.assert_array_equal(segmented[1].pixels, expected)
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.upscalers import _checkpoint, _tiling
+from app.upscalers._tile_planner import TilePlan
+
+
+def test_disabled_by_default():
+    """TILE_CHECKPOINTS defaults to off: no checkpoint, nothing written."""
+    assert settings.tile_checkpoints is False
+    assert _checkpoint.TileCheckpoint.for_job("job-1") is None
+    assert not _checkpoint.resumable("job-1")
+
+
+def test_resumed_attempt_runs_only_the_missing_batches(monkeypatch, fake_forward, rng):
+    """A crashed attempt's finished batches are kept; the next one completes the same canvas."""
+    monkeypatch.setattr(settings, "tile_checkpoints", True)
+    img = rng.integers(0, 255, (40, 50, 3), dtype=np.uint8)
+    model = fake_forward(2)
+    runs = []
+
+    def crashing(batch):
+        if len(runs) == 5:
+            raise MemoryError("child killed")
+        runs.append(len(batch))
+        return model(batch)
+
+    checkpoint = _checkpoint.TileCheckpoint.for_job("job-1")
+    with pytest.raises(MemoryError):
+        _tiling.enhance(img, crashing, 2, 16, tile_pad=2, skip=False, checkpoint=checkpoint)
+    assert _checkpoint.resumable("job-1") is False  # the plan is the pipeline's to save
+    checkpoint.save_plan(TilePlan(16, 1, 12, 1000.0, 500.0, "fixed"))
+    assert _checkpoint.resumable("job-1")
+
+    resumed = []
+
+    def forward(batch):
+        resumed.append(len(batch))
+        return model(batch)
+
+    checkpoint = _checkpoint.TileCheckpoint.for_job("job-1")
+    out = _tiling.enhance(img, forward, 2, 16, tile_pad=2, skip=False, checkpoint=checkpoint)
+    assert len(resumed) == 12 - 5
+    np.testing.assert_array_equal(out, _tiling.enhance(img, model, 2, 0, skip=False))
+    _checkpoint.discard("job-1")
+    assert not _checkpoint.job_dir("job-1").exists()
+
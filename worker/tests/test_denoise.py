@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from app.image import Frame
+from app.processors import denoise
+
+
+@pytest.mark.parametrize("method", denoise.METHODS)
+@pytest.mark.parametrize("workers", [2, 3])
+def test_bands_match_single_pass(rng, method, workers):
+    """Row bands read their filter's reach beyond themselves, so they stitch to the whole-image filter."""
+    img = rng.integers(0, 255, (300, 90, 3), dtype=np.uint8)
+    assert len(denoise.bands(300, workers * denoise.BANDS_PER_WORKER, 1)) > 1
+    np.testing.assert_array_equal(
+        denoise.denoise(img, method, workers=workers), denoise.denoise(img, method, workers=1)
+    )
+
+
+def test_bands_cover_every_row_once():
+    parts = denoise.bands(1000, 6, 17)
+    assert [y0 for y0, _, _, _ in parts][0] == 0 and parts[-1][1] == 1000
+    for (_, y1, _, _), (y0, _, _, _) in zip(parts, parts[1:]):
+        assert y1 == y0
+    for y0, y1, a0, a1 in parts:
+        assert a0 == max(0, y0 - 17) and a1 == min(1000, y1 + 17)
+    assert len(denoise.bands(100, 6, 17)) == 1  # under MIN_BAND_ROWS a band
+
+
+def test_unknown_method_falls_back_to_nlmeans():
+    assert denoise.resolve("median") == "nlmeans"
+    assert denoise.signature("median") == denoise.signature("nlmeans")
+
+
+def test_run_takes_any_frame_to_8bit_bgr(rng):
+    pixels = rng.integers(0, 65535, (80, 60, 4), dtype=np.uint16)
+    out = denoise.run(Frame(pixels, "PNG"))
+    assert out.pixels.shape == (80, 60, 3) and out.pixels.dtype == np.uint8
+    assert out.source_format == "PNG"
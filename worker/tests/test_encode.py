@@ -0,0 +1,73 @@
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from app import encode
+from app.image import Frame
+
+
+def _photo(rng, height, width, channels, dtype):
+    """Smooth gradients plus noise, like an upscaled photo."""
+    top = np.iinfo(dtype).max
+    y, x = np.mgrid[0:height, 0:width]
+    base = (x * 7 + y * 3) % (top + 1)
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    noise = rng.integers(0, max(2, top // 64), shape)
+    if channels > 1:
+        base = base[:, :, None]
+    return np.clip(base + noise, 0, top).astype(dtype)
+
+
+@pytest.mark.parametrize("channels", [1, 3, 4])
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+@pytest.mark.parametrize("level", [0, 1, 2, 6])
+@pytest.mark.parametrize("name", ["out.png", "out"])
+def test_png_round_trip(rng, tmp_path, channels, dtype, level, name):
+    """Every level decodes to exactly the input pixels, with OpenCV and with Pillow, whatever the file name."""
+    pixels = _photo(rng, 97, 131, channels, dtype)
+    path = tmp_path / name
+    encode.write_png(pixels, path, level)
+    assert [p.name for p in tmp_path.iterdir()] == [name]
+    np.testing.assert_array_equal(cv2.imread(str(path), cv2.IMREAD_UNCHANGED), pixels)
+    with Image.open(path) as im:
+        im.load()  # Pillow checks the zlib stream's Adler-32 and the chunk CRCs
+        assert im.size == (131, 97)
+
+
+def test_png_from_a_memmap_canvas(rng, tmp_path):
+    """The output canvas is encoded where it is, as a memmap."""
+    pixels = _photo(rng, 64, 80, 4, np.uint16)
+    canvas = np.memmap(tmp_path / "canvas", dtype=np.uint16, mode="w+", shape=pixels.shape)
+    canvas[:] = pixels
+    encode.write_png(canvas, tmp_path / "out.png", 1)
+    np.testing.assert_array_equal(cv2.imread(str(tmp_path / "out.png"), cv2.IMREAD_UNCHANGED), pixels)
+
+
+@pytest.mark.parametrize("target_format,name", [(None, "output.png"), ("webp", "output.webp"), ("jpeg", "output.jpeg")])
+def test_result_path_names_the_format(tmp_path, target_format, name):
+    assert encode.result_path(tmp_path, SimpleNamespace(target_format=target_format)) == tmp_path / name
+
+
+@pytest.mark.parametrize("fmt,quality", [("webp", None), ("webp", 80), ("jpeg", 90)])
+def test_write_formats(rng, tmp_path, fmt, quality):
+    """write records what it wrote; lossless WebP keeps the 8-bit pixels."""
+    pixels = _photo(rng, 40, 60, 3, np.uint8)
+    stats = encode.EncodeStats()
+    path = tmp_path / f"out.{fmt}"
+    assert encode.write(Frame(pixels), path, encode.Encoding(fmt, quality), stats) == fmt
+    assert stats.format == fmt and stats.bytes == path.stat().st_size
+    decoded = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+    assert decoded.shape == pixels.shape
+    if fmt == "webp" and quality is None:
+        np.testing.assert_array_equal(decoded, pixels)
+
+
+def test_write_falls_back_to_png_over_the_size_limit(monkeypatch, rng, tmp_path):
+    monkeypatch.setitem(encode.MAX_SIDE, "webp", 32)
+    pixels = _photo(rng, 20, 40, 4, np.uint8)
+    path = tmp_path / "out"
+    assert encode.write(Frame(pixels), path, encode.Encoding("webp")) == "png"
+    np.testing.assert_array_equal(cv2.imread(str(path), cv2.IMREAD_UNCHANGED), pixels)
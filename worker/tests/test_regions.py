@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from app.upscalers import _regions
+
+SCALE = 2
+
+
+def _crops(full: np.ndarray, scale: int = SCALE):
+    """load(region) returning each region's crop of an already upscaled image."""
+    return lambda r: full[r.cy0 * scale:r.cy1 * scale, r.cx0 * scale:r.cx1 * scale]
+
+
+@pytest.mark.parametrize("height,width,megapixels,overlap", [
+    (300, 500, 0.02, 16),
+    (257, 131, 0.005, 8),
+    (400, 90, 0.004, 32),
+    (100, 100, 1.0, 8),
+])
+def test_plan_cores_cover_the_image(height, width, megapixels, overlap):
+    """Cores tile the image exactly; crops extend them by the overlap inside the image."""
+    regions = _regions.plan(height, width, megapixels, overlap)
+    covered = np.zeros((height, width), dtype=int)
+    for r in regions:
+        covered[r.y0:r.y1, r.x0:r.x1] += 1
+        assert 0 <= r.cy0 <= r.y0 < r.y1 <= r.cy1 <= height
+        assert 0 <= r.cx0 <= r.x0 < r.x1 <= r.cx1 <= width
+        assert _regions.Region.from_dict(r.to_dict()) == r
+    assert (covered == 1).all()
+    assert [r.index for r in regions] == list(range(len(regions)))
+
+
+@pytest.mark.parametrize("channels", [None, 3, 4])
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+@pytest.mark.parametrize("height,width,megapixels,overlap", [
+    (300, 500, 0.02, 16),
+    (257, 131, 0.005, 8),
+    (400, 90, 0.004, 32),
+])
+def test_stitch_matches_single_pass(rng, channels, dtype, height, width, megapixels, overlap):
+    """Regions that agree on their overlaps stitch back to the single-pass image, bit for bit."""
+    shape = (height * SCALE, width * SCALE) + ((channels,) if channels else ())
+    full = rng.integers(0, np.iinfo(dtype).max, shape, dtype=dtype)
+    regions = _regions.plan(height, width, megapixels, overlap)
+    assert len(regions) > 1
+    out = _regions.stitch(regions, _crops(full), height, width, SCALE)
+    assert out.dtype == dtype
+    np.testing.assert_array_equal(out, full)
+
+
+def test_stitch_blends_only_the_overlaps():
+    """Regions of different constants keep their value in the cores and ramp between them across the overlaps."""
+    height, width, overlap = 120, 160, 8
+    regions = _regions.plan(height, width, 0.005, overlap)
+    values = {r.index: 40 * (r.index + 1) for r in regions}
+
+    def load(r):
+        return np.full(((r.cy1 - r.cy0) * SCALE, (r.cx1 - r.cx0) * SCALE), values[r.index], dtype=np.uint8)
+
+    out = _regions.stitch(regions, load, height, width, SCALE)
+    for r in regions:
+        # Outside every overlap band only the region itself contributes
+        y0, y1 = (r.y0 + overlap) * SCALE if r.cy0 < r.y0 else 0, (r.y1 - overlap) * SCALE
+        x0, x1 = (r.x0 + overlap) * SCALE if r.cx0 < r.x0 else 0, (r.x1 - overlap) * SCALE
+        assert (out[y0:y1, x0:x1] == values[r.index]).all()
+    assert out.min() >= min(values.values()) and out.max() <= max(values.values())
+    # Across a vertical seam the blend moves monotonically from the left value to the right one
+    left, right = regions[0], regions[1]
+    row = out[height // 4 * SCALE, (left.x1 - overlap) * SCALE:(left.x1 + overlap) * SCALE].astype(int)
+    assert row[0] <= row[-1] and (np.diff(row) >= 0).all()
+    assert values[left.index] < row[len(row) // 2] < values[right.index]
+
+
+def test_stitch_rejects_a_wrong_region_size(rng):
+    regions = _regions.plan(100, 100, 0.002, 8)
+    full = rng.integers(0, 255, (200, 200, 3), dtype=np.uint8)
+    with pytest.raises(RuntimeError, match="region 0"):
+        _regions.stitch(regions, lambda r: full[:10, :10], 100, 100, SCALE)
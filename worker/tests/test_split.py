@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app import encode, pipeline, progress
+from app.tasks import split, upscale
+
+JOB_ID = "job-1"
+REGION_TASKS = ["region-task-0", "region-task-1", "region-task-2"]
+
+
+class FakeRedis:
+    """The string, list and hash commands split jobs use."""
+
+    def __init__(self):
+        self.values = {}
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def exists(self, key):
+        return int(key in self.values)
+
+    def incr(self, key):
+        self.values[key] = self.values.get(key, 0) + 1
+        return self.values[key]
+
+    def expire(self, key, seconds):
+        pass
+
+    def lrange(self, key, start, end):
+        return [v.encode() for v in self.values.get(key, [])]
+
+    def hset(self, key, field, value):
+        self.values.setdefault(key, {})[field] = value
+
+    def hvals(self, key):
+        return list(self.values.get(key, {}).values())
+
+    def delete(self, *keys):
+        for key in keys:
+            self.values.pop(key, None)
+
+
+class FakeStorage:
+    def get_to_file(self, key, path):
+        encode.write_png(np.zeros((8, 8, 3), np.uint8), path, 1)
+
+    def put(self, key, f, content_type):
+        pass
+
+
+@pytest.fixture
+def split_job(monkeypatch):
+    """A processing split job with three dispatched region tasks; records failures and revokes."""
+    client = FakeRedis()
+    client.values[progress.SUBTASKS_KEY.format(job_id=JOB_ID)] = list(REGION_TASKS)
+    for module in (progress, split, upscale):
+        monkeypatch.setattr(module, "redis_client", lambda: client)
+    job = SimpleNamespace(id=JOB_ID, status=upscale.JOB_STATUS_PROCESSING, method="real_esrgan", scale=4)
+    monkeypatch.setattr(split, "_get_job", lambda job_id: job)
+    monkeypatch.setattr(split, "_update_job_progress", lambda job_id, pct, detail: None)
+    monkeypatch.setattr(split, "get_storage", FakeStorage)
+    failed, revoked = [], []
+    monkeypatch.setattr(split, "_fail_job", lambda job_id, e: failed.append(str(e)))
+    monkeypatch.setattr(split.celery_app.control, "revoke", revoked.extend)
+    return SimpleNamespace(redis=client, failed=failed, revoked=revoked)
+
+
+def _region(index):
+    return {"index": index}
+
+
+def test_a_failing_region_stops_its_siblings(monkeypatch, split_job):
+    """Region 0 fails while region 1 runs: the queued regions are revoked and region 1 stops at its next tile."""
+    tiles = []
+
+    def upscale_step(job, frame, strategy, on_tile, **kwargs):
+        if tiles:
+            raise RuntimeError("out of memory")  # region 0, started while region 1 is at its first tile
+        for done in range(1, 5):
+            on_tile(done, 4)
+            tiles.append(done)
+            if done == 1:
+                failed = split.upscale_region_task(JOB_ID, _region(0), 3, "native")
+                assert failed == {"index": 0, "error": "out of memory"}
+        return frame
+
+    monkeypatch.setattr(pipeline, "upscale", upscale_step)
+    assert split.upscale_region_task(JOB_ID, _region(1), 3, "native") == {"index": 1, "cancelled": True}
+    assert tiles == [1]
+    assert split_job.failed == ["out of memory"]
+    assert split_job.revoked == REGION_TASKS
+    # A region that only starts now stops before its first tile
+    assert split.upscale_region_task(JOB_ID, _region(2), 3, "native") == {"index": 2, "cancelled": True}
+    assert tiles == [1]
+
+
+def test_a_region_out_of_attempts_stops_its_siblings(monkeypatch, split_job):
+    monkeypatch.setattr(split.settings, "max_job_attempts", 1)
+    split_job.redis.values[upscale.ATTEMPTS_KEY.format(job_id=f"{JOB_ID}:region-2")] = 1
+    assert split.upscale_region_task(JOB_ID, _region(2), 3, "native")["error"] == "too many attempts"
+    assert len(split_job.failed) == 1
+    assert split_job.revoked == REGION_TASKS
+    assert split_job.redis.exists(progress.CANCEL_KEY.format(job_id=JOB_ID))
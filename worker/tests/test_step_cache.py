@@ -0,0 +1,165 @@
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app import image, pipeline, step_cache
+from app.config import settings
+from app.image import Frame
+from app.storage import LocalStorageBackend
+from app.upscalers._tile_planner import TilePlan
+
+TILING = step_cache.tiling(TilePlan(256, 2, 6, 1000.0, 500.0, "default"))
+
+
+class FakeRedis:
+    """The sorted-set commands the step cache index uses."""
+
+    def __init__(self):
+        self.scores = {}
+
+    def zscore(self, key, member):
+        return self.scores.get(member)
+
+    def zadd(self, key, mapping):
+        self.scores.update(mapping)
+
+    def zrangebyscore(self, key, low, high):
+        return [m.encode() for m, s in self.scores.items() if low <= s <= high]
+
+    def zrem(self, key, member):
+        self.scores.pop(member, None)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = FakeRedis()
+    monkeypatch.setattr(step_cache, "redis_client", lambda: client)
+    return client
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return step_cache.StepCache("input-hash", LocalStorageBackend(), tmp_path)
+
+
+def _job(**fields):
+    return SimpleNamespace(**{"method": "real_esrgan", "scale": 4, "denoise_first": False, **fields})
+
+
+def test_disabled_by_default(tmp_path):
+    """STEP_CACHE_TTL_SECONDS defaults to 0: no cache, no hashing."""
+    path = tmp_path / "input"
+    path.write_bytes(b"image")
+    assert settings.step_cache_ttl_seconds == 0
+    assert step_cache.StepCache.for_input(path, LocalStorageBackend()) is None
+
+
+def test_keys_follow_the_chain(cache):
+    """denoise is keyed on the input, upscale on the denoise key when there is one."""
+    plain = cache.keys(_job(), "native", TILING, "model")
+    denoised = cache.keys(_job(denoise_first=True), "native", TILING, "model")
+    assert set(plain) == {"upscale"}
+    assert set(denoised) == {"denoise", "upscale"}
+    assert denoised["upscale"] != plain["upscale"]
+    assert cache.keys(_job(denoise_first=True))["denoise"] == denoised["denoise"]
+    other = step_cache.StepCache("other-hash", cache.storage, cache.directory)
+    assert other.keys(_job(), "native", TILING, "model")["upscale"] != plain["upscale"]
+
+
+@pytest.mark.parametrize("change", [
+    {"method": "swinir"},
+    {"scale": 2},
+    {"strategy": "half_input"},
+    {"tiling": step_cache.tiling(TilePlan(256, 4, 6, 1000.0, 500.0, "default"))},
+    {"tiling": step_cache.tiling(TilePlan(128, 2, 24, 1000.0, 500.0, "default"))},
+    {"model": "other weights"},
+    {"tile_skip": True},
+    {"tile_skip_blend_px": 7},
+])
+def test_upscale_key_covers_what_changes_the_output(monkeypatch, cache, change):
+    args = {"strategy": "native", "tiling": TILING, "model": "model"}
+    base = cache.keys(_job(denoise_first=True), **args)
+    job = _job(denoise_first=True)
+    for name, value in change.items():
+        if name in args:
+            args[name] = value
+        elif hasattr(job, name):
+            setattr(job, name, value)
+        else:
+            monkeypatch.setattr(settings, name, value)
+    changed = cache.keys(job, **args)
+    assert changed["denoise"] == base["denoise"]
+    assert changed["upscale"] != base["upscale"]
+
+
+def test_denoise_key_covers_its_method_not_its_workers(monkeypatch, cache):
+    """Banded denoise matches the whole-image filter, so the worker count is not part of the key."""
+    monkeypatch.setattr(settings, "denoise_workers", 1)
+    base = cache.keys(_job(denoise_first=True))
+    monkeypatch.setattr(settings, "denoise_workers", 3)
+    assert cache.keys(_job(denoise_first=True)) == base
+    monkeypatch.setattr(settings, "denoise_method", "bilateral")
+    assert cache.keys(_job(denoise_first=True))["denoise"] != base["denoise"]
+
+
+def test_model_identity_names_the_configured_model(monkeypatch):
+    job = _job()
+    base = pipeline.model_identity(job, "native")
+    assert base.startswith("RealESRGAN_x4plus.pth:")
+    assert pipeline.model_identity(job, "half_input") == base  # both run the x4 network
+    assert pipeline.model_identity(_job(scale=2), "native").startswith("RealESRGAN_x2plus.pth:")
+    monkeypatch.setattr(settings, "inference_precision", "real_esrgan:bf16")
+    assert pipeline.model_identity(job, "native") != base
+    monkeypatch.setattr(settings, "inference_precision", "esrgan:bf16")
+    assert pipeline.model_identity(job, "native") == base
+
+
+def test_step_keys_take_the_checkpointed_plan(monkeypatch, cache, tmp_path):
+    """The upscale key names the plan the upscale will run: the checkpoint's, else a fresh one."""
+    path = tmp_path / "input.png"
+    planned = TilePlan(32, 1, 4, 1000.0, 500.0, "fixed")
+    monkeypatch.setattr(pipeline, "plan_input", lambda job, input_path, strategy: planned)
+    keys, plan = pipeline.step_keys(_job(), path, "native", cache)
+    assert plan == planned
+
+    resumed = TilePlan(16, 2, 12, 1000.0, 500.0, "fixed")
+    checkpoint = SimpleNamespace(load_plan=lambda: resumed)
+    resumed_keys, plan = pipeline.step_keys(_job(), path, "native", cache, checkpoint)
+    assert plan == resumed
+    assert resumed_keys["upscale"] != keys["upscale"]
+    assert pipeline.step_keys(_job(), path, "native", None) == ({}, None)
+
+
+@pytest.mark.parametrize("shape,denoise_first", [((48, 70, 4), False), ((48, 70, 4), True), ((48, 70), False)])
+def test_plan_input_matches_the_decoded_frame(tmp_path, shape, denoise_first):
+    """Planning from the file header gives the plan of the frame the upscale step takes."""
+    path = tmp_path / "input.png"
+    image.write(Frame(np.zeros(shape, np.uint8)), path)
+    job = _job(denoise_first=denoise_first)
+    frame = pipeline.prepare(job, image.read(path))
+    assert pipeline.plan_input(job, path, "native") == pipeline.plan_tiles(job, frame, "native")
+
+
+@pytest.mark.parametrize("shape,dtype", [((20, 30, 3), np.uint8), ((20, 30, 4), np.uint16), ((20, 30), np.uint8)])
+def test_save_load_round_trip(monkeypatch, redis, cache, rng, shape, dtype):
+    monkeypatch.setattr(settings, "step_cache_ttl_seconds", 60)
+    pixels = rng.integers(0, np.iinfo(dtype).max, shape, dtype=dtype)
+    assert cache.load("k") is None
+    cache.save("k", Frame(pixels))
+    assert cache.cached("k")
+    np.testing.assert_array_equal(cache.load("k").pixels, pixels)
+    assert not list(cache.directory.glob("step-*"))  # scratch files are removed
+
+
+def test_expired_steps_miss_and_are_swept(monkeypatch, redis, cache, rng):
+    monkeypatch.setattr(settings, "step_cache_ttl_seconds", 60)
+    cache.save("old", Frame(rng.integers(0, 255, (8, 8, 3), dtype=np.uint8)))
+    cache.save("new", Frame(rng.integers(0, 255, (8, 8, 3), dtype=np.uint8)))
+    redis.scores["old"] = time.time() - 1
+    assert cache.load("old") is None
+    assert step_cache.sweep(cache.storage) == 1
+    assert set(redis.scores) == {"new"}
+    stored = cache.storage.base / step_cache.STEPS_PREFIX
+    assert [p.stem for p in stored.iterdir()] == ["new"]
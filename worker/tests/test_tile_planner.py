@@ -0,0 +1,68 @@
+import pytest
+
+from app.config import settings
+from app.upscalers import _tile_planner
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    def set_budget(mb: int, batch_size: int = 1) -> None:
+        monkeypatch.setattr(settings, "tile_memory_budget_mb", mb)
+        monkeypatch.setattr(settings, "tile_batch_size", batch_size)
+
+    return set_budget
+
+
+def test_whole_image_when_it_fits(budget):
+    budget(64_000)
+    plan = _tile_planner.plan("real_esrgan", 4, 300, 400)
+    assert (plan.tile, plan.batch_size, plan.tiles, plan.source) == (0, 1, 1, "default")
+
+
+@pytest.mark.parametrize("method,scale", [("real_esrgan", 4), ("real_esrgan", 2), ("swinir", 4), ("real_esrgan_fast", 4)])
+def test_tiles_fit_the_budget(budget, method, scale):
+    budget(2_000, batch_size=8)
+    plan = _tile_planner.plan(method, scale, 3000, 4000)
+    assert plan.tile in _tile_planner.TILE_CANDIDATES
+    assert 1 <= plan.batch_size <= 8
+    assert plan.estimate_mb <= plan.budget_mb * _tile_planner.HEADROOM
+    assert plan.tiles == _tile_planner._tile_count(3000, 4000, plan.tile)
+
+
+def test_more_memory_never_means_smaller_tiles(budget):
+    tiles = []
+    for mb in (600, 1_200, 2_400, 4_800):
+        budget(mb)
+        tiles.append(_tile_planner.plan("real_esrgan", 4, 3000, 4000).tile)
+    assert tiles == sorted(tiles)
+
+
+def test_smallest_tile_when_nothing_fits(budget):
+    budget(1)
+    plan = _tile_planner.plan("real_esrgan", 4, 3000, 4000)
+    assert (plan.tile, plan.batch_size) == (_tile_planner.TILE_CANDIDATES[0], 1)
+
+
+def test_calibrated_timings_pick_the_fastest_fitting(monkeypatch, budget):
+    budget(2_000, batch_size=4)
+    monkeypatch.setattr(_tile_planner, "_calibration", {
+        "device": "cpu",
+        "models": {"real_esrgan:4": {
+            "fixed_bytes": 100e6,
+            "bytes_per_pixel": 10e3,
+            "samples": [
+                {"tile": 128, "batch": 4, "seconds": 1.0},
+                {"tile": 256, "batch": 1, "seconds": 2.0},
+                {"tile": 512, "batch": 1, "seconds": 1.0},  # fastest, but ~2.9 GB peak
+            ],
+        }},
+    })
+    plan = _tile_planner.plan("real_esrgan", 4, 1024, 1024)
+    assert (plan.tile, plan.batch_size, plan.source) == (128, 4, "calibrated")
+    assert plan.est_seconds == 64 / 4 * 1.0
+
+
+def test_fixed_plan(monkeypatch):
+    monkeypatch.setattr(settings, "real_esrgan_tile", 384)
+    assert _tile_planner.fixed_plan("real_esrgan", 1000, 800).tile == 384
+    assert _tile_planner.fixed_plan("swinir", 1000, 800).tile == 256
@@ -0,0 +1,111 @@
+import numpy as np
+import pytest
+
+from app.config import settings
+from app.upscalers import _tiling
+
+
+def _image(rng, height, width, channels, dtype):
+    shape = (height, width) if channels == 1 else (height, width, channels)
+    return rng.integers(0, np.iinfo(dtype).max, shape, dtype=dtype)
+
+
+@pytest.mark.parametrize("scale", [2, 4])
+@pytest.mark.parametrize("channels", [1, 3, 4])
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16])
+@pytest.mark.parametrize("tile_size,batch_size", [(16, 1), (24, 3), (64, 2)])
+def test_tiles_match_single_pass(fake_forward, rng, scale, channels, dtype, tile_size, batch_size):
+    """Padded tiles, batched or not, stitch to the same canvas as one whole-image forward."""
+    img = _image(rng, 45, 71, channels, dtype)
+    forward = fake_forward(scale)
+    whole = _tiling.enhance(img, forward, scale, 0, skip=False)
+    tiled = _tiling.enhance(img, forward, scale, tile_size, tile_pad=4, batch_size=batch_size, skip=False)
+    assert tiled.dtype == dtype
+    assert tiled.shape == (45 * scale, 71 * scale) + img.shape[2:]
+    np.testing.assert_array_equal(tiled, whole)
+
+
+def test_split_and_batch_tiles():
+    """split_tiles covers the image with row-major cores; batches only stack equal padded shapes."""
+    tiles = _tiling.split_tiles(40, 50, 16, 2)
+    assert len(tiles) == 12
+    covered = np.zeros((40, 50), dtype=int)
+    for t in tiles:
+        covered[t.y0:t.y1, t.x0:t.x1] += 1
+    assert (covered == 1).all()
+    batches = list(_tiling.batch_tiles(tiles, 4))
+    assert sorted(t.index for b in batches for t in b) == list(range(12))
+    assert all(len(b) <= 4 and len({t.padded_shape for t in b}) == 1 for b in batches)
+
+
+def test_large_canvas_spills_to_a_memmap(monkeypatch, fake_forward, rng, tmp_path):
+    """Above memmap_canvas_min_mb the canvas is a file in spill_dir with the same pixels; progress reaches the total."""
+    monkeypatch.setattr(settings, "memmap_canvas_min_mb", 0)
+    img = _image(rng, 40, 50, 4, np.uint8)
+    forward = fake_forward(2)
+    progress = []
+    out = _tiling.enhance(
+        img, forward, 2, 16, tile_pad=2, spill_dir=tmp_path, on_tile=lambda done, total: progress.append((done, total))
+    )
+    assert isinstance(out, np.memmap) and list(tmp_path.glob("*.canvas"))
+    np.testing.assert_array_equal(out, _tiling.enhance(img, forward, 2, 0))
+    assert progress[-1] == (24, 24)  # 12 tiles for the colour planes, 12 for alpha
+
+
+@pytest.mark.parametrize("channels", [3, 4])
+def test_shards_match_single_pass(fake_forward, rng, channels):
+    """Batches spread over forked shards stitch into the shared canvas like one process does."""
+    img = _image(rng, 45, 71, channels, np.uint8)
+    forward = fake_forward(2)
+    sharded = _tiling.enhance(img, forward, 2, 16, tile_pad=4, skip=False, shards=3)
+    np.testing.assert_array_equal(sharded, _tiling.enhance(img, forward, 2, 0, skip=False))
+
+
+def test_tile_stats_count_batches(fake_forward, rng):
+    """stats counts every tile once, whatever the batch size."""
+    img = _image(rng, 40, 50, 3, np.uint8)
+    stats = _tiling.TileStats()
+    _tiling.enhance(img, fake_forward(4), 4, 16, tile_pad=2, batch_size=4, skip=False, stats=stats)
+    assert stats.tiles == len(_tiling.split_tiles(40, 50, 16, 2)) == 12
+
+
+def test_reused_tiles_match_single_pass(monkeypatch, fake_forward, rng):
+    """Tiles with byte-identical padded input copy the first one's output: same canvas as running them."""
+    monkeypatch.setattr(settings, "tile_skip_reuse", True)
+    pattern = _image(rng, 16, 16, 3, np.uint8)
+    img = np.tile(pattern, (4, 4, 1))
+    forward = fake_forward(4)
+    stats = _tiling.TileStats()
+    skipped = _tiling.enhance(img, forward, 4, 16, tile_pad=0, skip=True, stats=stats)
+    assert stats.reused > 0
+    np.testing.assert_array_equal(skipped, _tiling.enhance(img, forward, 4, 16, tile_pad=0, skip=False))
+
+
+def test_reuse_needs_the_same_clipped_extent(monkeypatch, fake_forward, rng):
+    """
+    A tile on the mod-padded edge (clipped core) is not the original of an unclipped duplicate:
+    copying the duplicate's full extent from it would read past its core.
+    """
+    monkeypatch.setattr(settings, "tile_skip_reuse", True)
+    img = _image(rng, 16, 31, 3, np.uint8)
+    block = _image(rng, 8, 8, 3, np.uint8)
+    block[:, 7] = block[:, 5]  # what the reflect pad of column 31 repeats
+    img[0:8, 24:31] = block[:, :7]
+    img[8:16, 8:16] = block
+    forward = fake_forward(2)
+    skipped = _tiling.enhance(img, forward, 2, 8, tile_pad=0, skip=True)
+    np.testing.assert_array_equal(skipped, _tiling.enhance(img, forward, 2, 8, tile_pad=0, skip=False))
+
+
+def test_flat_tiles_are_interpolated(monkeypatch, fake_forward):
+    """A constant image is all flat tiles: no forward runs and the canvas keeps the value."""
+    monkeypatch.setattr(settings, "tile_skip_flat_range", 2)
+
+    def forward(batch):
+        raise AssertionError("flat tiles must not reach the model")
+
+    img = np.full((32, 48, 3), 77, dtype=np.uint8)
+    stats = _tiling.TileStats()
+    out = _tiling.enhance(img, forward, 4, 16, tile_pad=2, skip=True, stats=stats)
+    assert stats.flat == stats.tiles == 6
+    assert (out == 77).all()